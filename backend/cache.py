@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Hashable, Iterable, NamedTuple, Union
+
+import numpy as np
+from pydantic import BaseModel
+
+from storage import MappedArray
+from operations import EXECUTION_FIELDS
+
+DIGEST_CHUNK_SIZE = 1 << 20
+
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DIGEST_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def operation_key(operation_type: str, source_digests: Iterable[str], operation: BaseModel) -> tuple:
+    """
+    Cache key of an operation: its type, the digests of its source images and the canonical
+    JSON of its parameters, so equal requests map to the same key whatever the field order.
+    Execution settings such as workers are left out since they do not change the result.
+    """
+    parameters = json.dumps(operation.model_dump(mode='json', exclude=EXECUTION_FIELDS), sort_keys=True, separators=(',', ':'))
+    return (operation_type, tuple(source_digests), parameters)
+
+class LRUCache:
+    """
+    Least recently used map holding at most max_size units, as measured by size_of.
+    Values larger than max_size are not stored; max_size <= 0 disables the cache.
+    """
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries: OrderedDict = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def size_of(self, value) -> int:
+        return 1
+
+    def get(self, key: Hashable):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value):
+        self.discard(key)
+        value_size = self.size_of(value)
+        if self.max_size <= 0 or value_size > self.max_size:
+            return
+        self.entries[key] = value
+        self.size += value_size
+        while self.size > self.max_size:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= self.size_of(evicted)
+            self.evictions += 1
+
+    def discard(self, key: Hashable):
+        value = self.entries.pop(key, None)
+        if value is not None:
+            self.size -= self.size_of(value)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+class ResultCache(LRUCache):
+    """
+    Maps operation keys to stored results (the response of the derived image), at most max_size of them.
+    """
+    @classmethod
+    def from_environment(cls) -> 'ResultCache':
+        return cls(max_size=int(os.environ.get("IMG_PROC_RESULT_CACHE_SIZE", 1024)))
+
+    def invalidate_image(self, image_id: str):
+        """
+        Drops every result that points at the given derived image.
+        """
+        for key in [key for key, value in self.entries.items() if value.image_id == image_id]:
+            self.discard(key)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "max_entries": self.max_size}
+
+class DecodedImage(NamedTuple):
+    array: Union[np.ndarray, MappedArray] # stored .npy images are mapped by the operations instead
+    digest: str # of the stored file, for result cache keys
+
+class DecodedImageCache(LRUCache):
+    """
+    Maps image IDs to decoded images, bounded by max_size bytes of pixel data.
+    Cached arrays are read-only since every request shares them; mapped images hold no pixels.
+    """
+    @classmethod
+    def from_environment(cls) -> 'DecodedImageCache':
+        return cls(max_size=int(os.environ.get("IMG_PROC_DECODED_CACHE_BYTES", 256 * 1024 * 1024)))
+
+    def size_of(self, value: DecodedImage) -> int:
+        return value.array.nbytes if isinstance(value.array, np.ndarray) else 0
+
+    def put(self, key: Hashable, value: DecodedImage):
+        if isinstance(value.array, np.ndarray):
+            value.array.flags.writeable = False
+        super().put(key, value)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "resident_bytes": self.size, "max_bytes": self.max_size}
+
+result_cache = ResultCache.from_environment()
+decoded_image_cache = DecodedImageCache.from_environment()
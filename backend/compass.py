@@ -0,0 +1,117 @@
+import numpy as np
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+from convolution import saturate
+
+COMPASS_OPERATORS = ('kirsch', 'robinson')
+COMPASS_BAND_BYTES = 1 << 17 # per band of work-dtype rows, about half a typical L2 cache
+
+# the eight neighbours of a 3x3 window counter-clockwise from the bottom right, as (row, column);
+# compass kernel d weights the neighbours ring[d], ring[d + 1], ... so kernel d + 1 is kernel d
+# turned by 45 degrees and the direction index d points 45 * d degrees counter-clockwise from east
+RING = ((2, 2), (1, 2), (0, 2), (0, 1), (0, 0), (1, 0), (2, 0), (2, 1))
+
+def compass_response(image_array: np.ndarray, operator: str, return_orientation: bool = False, dtype=None) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Strongest response of the eight compass kernels, each correlated like cv2.filter2D
+    (reflect-101 border, rounded and saturated to the input dtype), without an image per kernel:
+    the responses come from shared sums of the shifted neighbours and fold into one running maximum.
+    Given a dtype, the response is converted to it instead, without saturation.
+
+    With return_orientation, also returns the direction index of the winning kernel (see RING)
+    as a uint8 map, the first one on ties like np.argmax over the unsaturated responses.
+    """
+    if operator not in COMPASS_OPERATORS:
+        raise ValueError(f"Unsupported compass operator '{operator}'")
+    if image_array.ndim not in (2, 3):
+        raise ValueError("Input image must be a 2D or 3D numpy array.")
+
+    # 8-bit responses stay within +-6120, exact in int16 at half the memory of int32
+    work_dtype = np.int16 if image_array.dtype == np.uint8 else np.float64
+    padding = [(1, 1), (1, 1)] + [(0, 0)] * (image_array.ndim - 2)
+    padded = np.pad(image_array, padding, mode='reflect')
+    height = image_array.shape[0]
+
+    # bands of rows small enough that the neighbour sums stay in the CPU cache between passes
+    band_rows = max(COMPASS_BAND_BYTES // (padded[0].size * np.dtype(work_dtype).itemsize), 1)
+    response = np.empty(image_array.shape, dtype=image_array.dtype if dtype is None else dtype)
+    orientation = np.empty(image_array.shape, dtype=np.uint8) if return_orientation else None
+    for top in range(0, height, band_rows):
+        bottom = min(top + band_rows, height)
+        best, band_orientation = _compass_band(padded[top:bottom + 2].astype(work_dtype), operator, return_orientation)
+        response[top:bottom] = best if dtype is not None else saturate(best, image_array.dtype)
+        if return_orientation:
+            orientation[top:bottom] = band_orientation
+
+    if return_orientation:
+        return response, orientation
+    return response
+
+def _compass_band(padded: np.ndarray, operator: str, return_orientation: bool) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    height, width = padded.shape[0] - 2, padded.shape[1] - 2
+    neighbours = [padded[row:row + height, column:column + width] for row, column in RING]
+
+    if operator == 'kirsch':
+        # kernel d is 5 on three adjacent neighbours and -3 on the other five, i.e.
+        # 8 * window_d - 3 * total with window_d = ring[d] + ring[d + 1] + ring[d + 2], so only
+        # the windows compete and each one is the previous minus one neighbour plus the next
+        best, orientation = _running_max(_kirsch_windows(neighbours), return_orientation)
+        total = sum(neighbours[1:], neighbours[0].copy())
+        best *= 8
+        total *= 3
+        best -= total
+        return best, orientation
+
+    # kernel d + 4 is kernel d negated, and kernel d is (ring[d] + 2 ring[d + 1] + ring[d + 2])
+    # minus the same three neighbours opposite, built from differences of opposite neighbours
+    return _running_max(_robinson_responses(neighbours), return_orientation)
+
+def _running_max(responses: Iterable[np.ndarray], return_orientation: bool) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    # responses may reuse their buffers between iterations, the maximum keeps its own
+    best = orientation = greater = winner = None
+    for d, response in enumerate(responses):
+        if best is None:
+            best = response.copy()
+            if return_orientation:
+                orientation = np.zeros(response.shape, dtype=np.uint8)
+                greater = np.empty(response.shape, dtype=bool)
+                winner = np.empty(response.shape, dtype=np.uint8)
+            continue
+        if return_orientation:
+            # d only grows, so a new winner is also the largest index so far: a branch-free
+            # maximum with greater * d replaces a masked write, which is slow on random masks
+            np.greater(response, best, out=greater)
+            np.multiply(greater, d, out=winner, casting='unsafe')
+            np.maximum(orientation, winner, out=orientation)
+        np.maximum(best, response, out=best)
+    return best, orientation
+
+def _kirsch_windows(neighbours: List[np.ndarray]) -> Iterator[np.ndarray]:
+    window = neighbours[0] + neighbours[1]
+    window += neighbours[2]
+    yield window
+    for d in range(1, 8):
+        window += neighbours[(d + 2) % 8]
+        window -= neighbours[d - 1]
+        yield window
+
+def _robinson_responses(neighbours: List[np.ndarray]) -> Iterator[np.ndarray]:
+    # with e_d = ring[d] - ring[d + 4] (and e_4 = -e_0), kernel d responds with
+    # e_d + 2 e_(d + 1) + e_(d + 2) = f_d + f_(d + 1), where f_d = e_d + e_(d + 1)
+    e = [neighbours[d] - neighbours[d + 4] for d in range(4)]
+    f3 = e[3] - e[0]
+    e[0] += e[1]
+    e[1] += e[2]
+    e[2] += e[3]
+    f = [e[0], e[1], e[2], f3]
+    r3 = np.subtract(f[3], f[0], out=e[3])
+    f[0] += f[1]
+    f[1] += f[2]
+    f[2] += f[3]
+    responses = [f[0], f[1], f[2], r3]
+
+    yield from responses
+    negated = None
+    for response in responses:
+        negated = np.negative(response, out=negated)
+        yield negated
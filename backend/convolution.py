@@ -0,0 +1,138 @@
+import numpy as np
+import cv2
+from typing import List, Optional, Sequence, Tuple
+
+SeparableTerms = Sequence[Tuple[np.ndarray, np.ndarray]] # (column, row) pairs whose outer products add up to the kernel
+
+CV2_DEPTHS = {np.dtype(np.uint8): cv2.CV_8U, np.dtype(np.uint16): cv2.CV_16U, np.dtype(np.int16): cv2.CV_16S,
+              np.dtype(np.float32): cv2.CV_32F, np.dtype(np.float64): cv2.CV_64F}
+
+def rank_one_terms(kernel: np.ndarray, rtol: float = 1e-9) -> Optional[List[Tuple[np.ndarray, np.ndarray]]]:
+    """
+    Splits a kernel into one column and one row when it is their outer product (within rtol),
+    from its largest entry's row and column, in O(size**2).
+    """
+    kernel = np.asarray(kernel, dtype=np.float64)
+    i, j = np.unravel_index(np.argmax(np.abs(kernel)), kernel.shape)
+    pivot = kernel[i, j]
+    if pivot == 0:
+        return None
+    column, row = kernel[:, j], kernel[i, :] / pivot
+    if not np.allclose(np.outer(column, row), kernel, rtol=rtol, atol=rtol * abs(pivot)):
+        return None
+    return [(column, row)]
+
+def separable_is_cheaper(size: int, term_count: int) -> bool:
+    """
+    Multiply-adds per pixel: a row and a column pass of size taps per term against size**2 for the 2D kernel.
+    """
+    return term_count * 2 * size < size * size
+
+def convolve(image_array: np.ndarray, kernel: Optional[np.ndarray] = None, terms: Optional[SeparableTerms] = None) -> np.ndarray:
+    """
+    cv2.filter2D semantics (correlation, reflect-101 border, output in the input dtype with
+    rounding and saturation) over all channels in one call.
+
+    Kernels given as separable terms, or found to be rank one, run as 1D row and column passes,
+    O(size) per pixel and term instead of O(size**2), when the cost model says so. Other
+    kernels go to cv2.filter2D, whose DFT path is the FFT route for large non-separable kernels.
+    """
+    if image_array.ndim not in (2, 3):
+        raise ValueError("Input image must be a 2D or 3D numpy array.")
+    if kernel is None and terms is None:
+        raise ValueError("Either a kernel or its separable terms are required.")
+
+    size = len(terms[0][0]) if terms is not None else max(kernel.shape)
+    if terms is None and separable_is_cheaper(size, 1):
+        terms = rank_one_terms(kernel)
+    if terms is not None and separable_is_cheaper(size, len(terms)):
+        return separable_filter(image_array, terms)
+
+    if kernel is None:
+        kernel = sum(np.outer(column, row) for column, row in terms)
+    return filter2d(image_array, kernel)
+
+def filter2d(image_array: np.ndarray, kernel: np.ndarray, ddepth: int = -1) -> np.ndarray:
+    """
+    cv2.filter2D over all channels; ddepth -1 keeps the input dtype, a signed or float cv2 depth
+    keeps the responses that the input dtype would saturate.
+    """
+    if image_array.ndim == 3 and image_array.shape[2] > 4 or image_array.dtype not in CV2_DEPTHS:
+        # cv2 filters at most 4 channels and its own dtypes, the rest goes channel by channel
+        return _per_channel(image_array, lambda channel: cv2.filter2D(channel, ddepth, kernel))
+    return cv2.filter2D(image_array, ddepth, kernel)
+
+def separable_filter(image_array: np.ndarray, terms: SeparableTerms) -> np.ndarray:
+    """
+    Sum of the 1D-pass correlations of the terms, accumulated in floating point and rounded
+    back to the input dtype once.
+    """
+    if image_array.ndim == 3 and image_array.shape[2] > 4 or image_array.dtype not in CV2_DEPTHS:
+        return _per_channel(image_array, lambda channel: separable_filter(channel, terms))
+
+    if len(terms) == 1: # cv2 keeps its float row buffers internal and rounds once
+        column, row = terms[0]
+        return cv2.sepFilter2D(image_array, -1, np.asarray(row, dtype=np.float64), np.asarray(column, dtype=np.float64))
+
+    work_depth = cv2.CV_64F if image_array.dtype == np.float64 else cv2.CV_32F
+    accumulated = None
+    for column, row in terms:
+        response = cv2.sepFilter2D(image_array, work_depth, np.asarray(row, dtype=np.float64), np.asarray(column, dtype=np.float64))
+        if accumulated is None:
+            accumulated = response
+        else:
+            accumulated += response
+    return saturate(accumulated, image_array.dtype)
+
+def saturate(array: np.ndarray, dtype: np.dtype) -> np.ndarray:
+    """
+    Converts like cv2's saturate_cast: round half to even, then clip to the integer range.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f':
+        return array.astype(dtype, copy=False)
+    info = np.iinfo(dtype)
+    if array.dtype.kind == 'f':
+        array = np.rint(array)
+    return np.clip(array, info.min, info.max).astype(dtype)
+
+def _per_channel(image_array: np.ndarray, func) -> np.ndarray:
+    if image_array.ndim == 2:
+        return func(image_array)
+    return np.dstack([func(np.ascontiguousarray(image_array[:, :, c])) for c in range(image_array.shape[2])])
+
+def gaussian_terms(size: int, sigma: Optional[float] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Normalized 1D Gaussian as the single separable term of generate_gaussian_kernel's 2D kernel.
+    """
+    if sigma is None:
+        sigma = size / 6.0
+    ax = np.linspace(-(size // 2), size // 2, size)
+    gaussian = np.exp(-ax**2 / (2. * sigma**2))
+    gaussian /= gaussian.sum()
+    return [(gaussian, gaussian)]
+
+def box_terms(size: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+    ones = np.full(size, 1.0 / size)
+    return [(ones, ones)]
+
+def log_terms(size: int, sigma: Optional[float] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    generate_log_kernel as four separable terms: with g the 1D Gaussian and q = x**2 / (2 sigma**2) g,
+    LoG = norm (g g - q g - g q), and subtracting its mean adds a constant term.
+    """
+    if sigma is None:
+        sigma = size / 6.0
+    ax = np.arange(-size // 2 + 1., size // 2 + 1.)
+    gaussian = np.exp(-ax**2 / (2 * sigma**2))
+    weighted = ax**2 / (2 * sigma**2) * gaussian
+    normalization = -1 / (np.pi * sigma**4)
+
+    # mean of the kernel before centering, from the 1D sums
+    mean = normalization * (gaussian.sum()**2 - 2 * weighted.sum() * gaussian.sum()) / size**2
+    return [
+        (normalization * gaussian, gaussian),
+        (-normalization * weighted, gaussian),
+        (-normalization * gaussian, weighted),
+        (np.full(size, -mean), np.ones(size)),
+    ]
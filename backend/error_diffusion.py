@@ -0,0 +1,182 @@
+import numpy as np
+from typing import Sequence
+
+try:
+    from numba import njit
+except ImportError: # numba is optional, the NumPy engines are used without it
+    njit = None
+
+ERROR_DIFFUSION_STRIP_BYTES = 1 << 25 # skewed float64 strip of the wavefront engine, at most about 32 MiB
+
+# (dy, dx, weight) offsets relative to the pixel being quantized
+ERROR_DIFFUSION_KERNELS = {
+    'floyd_steinberg': (
+        (0, 1, 7 / 16),
+        (1, -1, 3 / 16),
+        (1, 0, 5 / 16),
+        (1, 1, 1 / 16)
+    ),
+    'jarvis_judice_ninke': (
+        (0, 1, 7 / 48), (0, 2, 5 / 48),
+        (1, -2, 3 / 48), (1, -1, 5 / 48), (1, 0, 7 / 48), (1, 1, 5 / 48), (1, 2, 3 / 48),
+        (2, -2, 1 / 48), (2, -1, 3 / 48), (2, 0, 5 / 48), (2, 1, 3 / 48), (2, 2, 1 / 48)
+    ),
+    'stucki': (
+        (0, 1, 8 / 42), (0, 2, 4 / 42),
+        (1, -2, 2 / 42), (1, -1, 4 / 42), (1, 0, 8 / 42), (1, 1, 4 / 42), (1, 2, 2 / 42),
+        (2, -2, 1 / 42), (2, -1, 2 / 42), (2, 0, 4 / 42), (2, 1, 2 / 42), (2, 2, 1 / 42)
+    ),
+}
+
+def _diffuse_pixels(buffer, thresholds, dys, dxs, weights, serpentine):
+    height, width, channels = buffer.shape
+    for y in range(height):
+        reverse = serpentine and y % 2 == 1
+        for i in range(width):
+            x = width - 1 - i if reverse else i
+            for c in range(channels):
+                old_pixel = buffer[y, x, c]
+                new_pixel = 255.0 if old_pixel > thresholds[c] else 0.0
+                buffer[y, x, c] = new_pixel
+                quant_error = old_pixel - new_pixel
+
+                for k in range(weights.shape[0]):
+                    ny = y + dys[k]
+                    nx = x - dxs[k] if reverse else x + dxs[k]
+                    if 0 <= ny < height and 0 <= nx < width:
+                        buffer[ny, nx, c] += quant_error * weights[k]
+
+_compiled_diffuse_pixels = njit(cache=True)(_diffuse_pixels) if njit is not None else None
+
+def wavefront_slope(kernel) -> int:
+    """
+    Smallest a for which the pixels on a line a * y + x = t only receive error from earlier lines,
+    and the taps reaching one pixel arrive in the order of a raster scan (sources by row, then x).
+    """
+    taps = sorted(kernel, key=lambda tap: (-tap[0], -tap[1])) # raster order of one pixel's sources
+    a = 1
+    while True:
+        offsets = [a * dy + dx for dy, dx, _ in taps]
+        if min(offsets) > 0 and all(earlier >= later for earlier, later in zip(offsets, offsets[1:])):
+            return a
+        a += 1
+
+def _diffuse_wavefronts(buffer, thresholds, kernel):
+    # Pixels on one line a * y + x = t depend on earlier lines only, so each line is quantized in one
+    # vectorized step over all its pixels and channels. A strip is copied skewed by a pixels per row
+    # and transposed, so that every line is contiguous. Every pixel still receives its errors in
+    # raster order, so the result equals the pixel-by-pixel scan bit for bit; strips bound the memory
+    # of the skewed copy.
+    height, width, channels = buffer.shape
+    a = wavefront_slope(kernel)
+    taps = [(dy, a * dy + dx, weight) for dy, dx, weight in sorted(kernel, key=lambda tap: (-tap[0], -tap[1]))]
+    max_dy = max(dy for dy, _, _ in taps)
+    max_offset = max(offset for _, offset, _ in taps)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+
+    # tall strips take fewer steps per row, the skew adds a pixels per row to their width
+    strip_rows = height
+    while strip_rows > 16 and 8 * channels * strip_rows * (width + a * strip_rows) > ERROR_DIFFUSION_STRIP_BYTES:
+        strip_rows = max(strip_rows // 2, 16)
+
+    for top in range(0, height, strip_rows):
+        rows = min(strip_rows, height - top) # quantized here, the max_dy rows below only receive errors
+        skew_rows = min(rows + max_dy, height - top)
+        skewed = np.zeros((max(a * (rows - 1) + width + max_offset, a * (skew_rows - 1) + width), skew_rows, channels))
+        for r in range(skew_rows):
+            skewed[a * r:a * r + width, r] = buffer[top + r]
+
+        for t in range(a * (rows - 1) + width):
+            first = max(0, -(-(t - width + 1) // a))
+            last = min(rows - 1, t // a)
+            if first > last:
+                continue
+            line = skewed[t, first:last + 1]
+            quantized = np.where(line > thresholds, 255.0, 0.0)
+            errors = line - quantized
+            line[...] = quantized
+            for dy, offset, weight in taps:
+                count = min(last + 1 + dy, skew_rows) - (first + dy)
+                if count > 0:
+                    # targets past the left or right edge land in the skew padding, which is never read
+                    skewed[t + offset, first + dy:first + dy + count] += errors[:count] * weight
+
+        for r in range(skew_rows):
+            buffer[top + r] = skewed[a * r:a * r + width, r]
+
+def _diffuse_rows(buffer, thresholds, kernel):
+    # serpentine scans reverse every other row, so a row can only start once the one above is done
+    # and nothing but the channels of a pixel could be quantized together; NumPy calls on a few
+    # channels cost more than plain floats, so rows are walked per channel
+    height, width, channels = buffer.shape
+    same_row = [(dx, weight) for dy, dx, weight in kernel if dy == 0]
+    # a pixel-by-pixel scan adds the errors of a row's sources in increasing x, i.e. decreasing dx per target
+    lower_rows = sorted(((dy, dx, weight) for dy, dx, weight in kernel if dy > 0), key=lambda k: (k[0], -k[1]))
+
+    for y in range(height):
+        # scanning a reversed view right to left mirrors the kernel for serpentine rows
+        view = buffer[:, ::-1] if y % 2 == 1 else buffer
+        row = view[y]
+        errors = np.empty((width, channels))
+
+        # the same-row error term is sequential, so this part walks the row with plain floats
+        for c in range(channels):
+            values = row[:, c].tolist()
+            threshold = thresholds[c]
+            channel_errors = [0.0] * width
+            for x in range(width):
+                old_pixel = values[x]
+                new_pixel = 255 if old_pixel > threshold else 0
+                values[x] = new_pixel
+                quant_error = old_pixel - new_pixel
+                channel_errors[x] = quant_error
+                for dx, weight in same_row:
+                    if x + dx < width:
+                        values[x + dx] += quant_error * weight
+            row[:, c] = values
+            errors[:, c] = channel_errors
+
+        # errors pushed to the rows below are applied to all channels at once
+        for dy, dx, weight in lower_rows:
+            ny = y + dy
+            if ny >= height or abs(dx) >= width:
+                continue
+            contribution = errors * weight
+            if dx >= 0:
+                view[ny, dx:] += contribution[:width - dx]
+            else:
+                view[ny, :width + dx] += contribution[-dx:]
+
+def error_diffusion(image_array: np.ndarray, thresholds: Sequence[int], kernel: str = 'floyd_steinberg', serpentine: bool = False) -> np.ndarray:
+    """
+    Quantizes each channel to 0/255, diffusing the quantization error with the given kernel.
+    Accepts an (H, W) or (H, W, C) array with one threshold per channel.
+    """
+    if kernel not in ERROR_DIFFUSION_KERNELS:
+        raise ValueError(f"Unsupported error diffusion kernel '{kernel}'.")
+
+    buffer = np.array(image_array, dtype=np.float64)
+    grayscale = buffer.ndim == 2
+    if grayscale:
+        buffer = buffer[:, :, np.newaxis]
+
+    if len(thresholds) != buffer.shape[2]:
+        raise ValueError(f"Expected {buffer.shape[2]} thresholds, got {len(thresholds)}.")
+
+    weights = ERROR_DIFFUSION_KERNELS[kernel]
+    if _compiled_diffuse_pixels is not None:
+        offsets = np.array([(dy, dx) for dy, dx, _ in weights], dtype=np.int64)
+        _compiled_diffuse_pixels(
+            buffer,
+            np.array(thresholds, dtype=np.float64),
+            offsets[:, 0],
+            offsets[:, 1],
+            np.array([weight for _, _, weight in weights]),
+            serpentine
+        )
+    elif serpentine:
+        _diffuse_rows(buffer, thresholds, weights)
+    else:
+        _diffuse_wavefronts(buffer, thresholds, weights)
+
+    return buffer[:, :, 0] if grayscale else buffer
@@ -0,0 +1,274 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from collections import Counter
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Optional, Tuple
+
+EXECUTOR_KINDS = ('process', 'thread', 'inline')
+
+# operations that spend their time in cv2/NumPy kernels release the GIL and can stay in threads,
+# pure-Python loops (serpentine error diffusion without numba, region labeling) need their own processes
+DEFAULT_ROUTES = {
+    'grayscale': 'process',
+    'halftoning': 'process',
+    'histogram_equalization': 'process',
+    'histogram_smoothing': 'process',
+    'basic_edge_detection': 'thread',
+    'advanced_edge_detection': 'thread',
+    'filtering': 'thread',
+    'single_operation': 'process',
+    'multi_operation': 'process',
+    'histogram_segmentation': 'process',
+    'pipeline': 'process',
+    'decode': 'thread', # file read and PNG decode in the API process, feeding the decoded image cache
+    'ingest': 'thread', # upload decode, metadata, histogram and storage encode; reads the request's spooled file, not for processes
+    'create': 'process',
+    'histogram': 'process', # plot rendering, pyplot is not thread-safe
+    'bands': 'process', # row bands of one operation that hold the GIL (e.g. a large median), see submit
+}
+
+PROGRESS_SLOTS = 1024 # jobs whose progress is tracked at the same time, the others only report their status
+
+_progress_counters = None # (done, total) pairs in shared memory, in the API process and its process workers
+
+def _init_process_worker(progress_counters):
+    global _progress_counters
+    _progress_counters = progress_counters
+
+class Progress:
+    """
+    Units of work done out of a total (pipeline steps, tiles or bands), reported by an operation
+    while it runs and read for the job status. The counters are a slot of a shared-memory array
+    the process workers inherit, so reporting sends no messages and reading never waits on a
+    worker; a Progress pickles to its slot number.
+    """
+    def __init__(self, slot: int, on_close: Optional[Callable[['Progress'], None]] = None):
+        self.slot = slot
+        self.on_close = on_close
+        self.final: Optional[Tuple[int, int]] = None
+
+    def __getstate__(self):
+        return self.slot
+
+    def __setstate__(self, slot: int):
+        self.__init__(slot)
+
+    def start(self, total: int):
+        with _progress_counters.get_lock():
+            _progress_counters[2 * self.slot:2 * self.slot + 2] = [0, total]
+
+    def advance(self, units: int = 1):
+        with _progress_counters.get_lock():
+            _progress_counters[2 * self.slot] += units
+
+    def read(self) -> Tuple[int, int]:
+        if self.final is not None:
+            return self.final
+        with _progress_counters.get_lock():
+            done, total = _progress_counters[2 * self.slot:2 * self.slot + 2]
+        return done, total
+
+    def close(self):
+        """
+        Keeps the last counts and gives the slot back, once whoever reads the progress is done with it.
+        """
+        if self.final is None:
+            self.final = self.read()
+            if self.on_close is not None:
+                self.on_close(self)
+
+class ExecutorBusy(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Too many pending operations, retry later.")
+        self.retry_after = retry_after
+
+def parse_routes(value: str) -> Dict[str, str]:
+    """
+    Parses 'operation=kind,...' overrides, e.g. 'halftoning=thread,filtering=process'.
+    """
+    routes = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        operation_type, _, kind = item.partition('=')
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Unsupported executor kind '{kind}' for '{operation_type}'. Choose one of {EXECUTOR_KINDS}.")
+        routes[operation_type.strip()] = kind
+    return routes
+
+class ComputeExecutor:
+    """
+    Runs CPU-bound operations off the event loop, routing each operation type to a process pool,
+    a thread pool or the calling thread. Submissions beyond max_queue_depth raise ExecutorBusy,
+    including the bands operations split themselves into.
+    """
+    def __init__(self, process_workers: int, thread_workers: int, max_queue_depth: int, retry_after: int, routes: Optional[Dict[str, str]] = None):
+        self.process_workers = process_workers
+        self.thread_workers = thread_workers
+        self.max_queue_depth = max_queue_depth
+        self.retry_after = retry_after
+        self.routes = {**DEFAULT_ROUTES, **(routes or {})}
+        self.pending = 0
+        self._process_pool: Optional[Executor] = None
+        self._thread_pool: Optional[Executor] = None
+        self._lock = threading.Lock() # pools, pending and progress slots are also used from the compute threads
+        self._free_progress_slots = list(range(PROGRESS_SLOTS))
+        self._progress_holds = Counter() # pool calls still reporting to a slot
+        self._closed_progress_slots = set()
+
+    @classmethod
+    def from_environment(cls) -> 'ComputeExecutor':
+        cpu_count = os.cpu_count() or 1
+        return cls(
+            process_workers=int(os.environ.get("IMG_PROC_PROCESS_WORKERS", cpu_count)),
+            thread_workers=int(os.environ.get("IMG_PROC_THREAD_WORKERS", cpu_count)),
+            max_queue_depth=int(os.environ.get("IMG_PROC_MAX_QUEUE_DEPTH", 4 * cpu_count)),
+            retry_after=int(os.environ.get("IMG_PROC_RETRY_AFTER", 1)),
+            routes=parse_routes(os.environ.get("IMG_PROC_EXECUTOR_ROUTES", "")),
+        )
+
+    def route(self, operation_type: str) -> str:
+        kind = self.routes.get(operation_type, 'process')
+        if kind == 'process' and self.process_workers <= 0:
+            kind = 'thread'
+        if kind == 'thread' and self.thread_workers <= 0:
+            kind = 'inline'
+        return kind
+
+    def _pool(self, kind: str) -> Executor:
+        with self._lock:
+            if kind == 'process':
+                if self._process_pool is None:
+                    self._process_pool = ProcessPoolExecutor(max_workers=self.process_workers, initializer=_init_process_worker, initargs=(self._shared_progress_counters(),))
+                return self._process_pool
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(max_workers=self.thread_workers, thread_name_prefix="compute")
+            return self._thread_pool
+
+    def _shared_progress_counters(self):
+        # created before the process pool, whose workers inherit it; called with the lock held
+        global _progress_counters
+        if _progress_counters is None:
+            _progress_counters = multiprocessing.Array('q', 2 * PROGRESS_SLOTS)
+        return _progress_counters
+
+    def track_progress(self) -> Optional[Progress]:
+        """
+        A Progress to pass to run, None when every slot is in use. Close it when it is no longer read;
+        its slot is reused once the pool calls reporting to it are done too.
+        """
+        with self._lock:
+            self._shared_progress_counters()
+            if not self._free_progress_slots:
+                return None
+            progress = Progress(self._free_progress_slots.pop(), on_close=self._close_progress)
+        progress.start(0)
+        return progress
+
+    def _close_progress(self, progress: Progress):
+        with self._lock:
+            self._closed_progress_slots.add(progress.slot)
+            self._free_progress_slot(progress.slot)
+
+    def _free_progress_slot(self, slot: int):
+        # with the lock held: a cancelled job's call may still be reporting to the slot
+        if slot in self._closed_progress_slots and not self._progress_holds[slot]:
+            self._closed_progress_slots.discard(slot)
+            del self._progress_holds[slot]
+            self._free_progress_slots.append(slot)
+
+    def band_submitter(self) -> Optional[Callable[..., Future]]:
+        """
+        submit for the bands of one operation, or None where they cannot go to other workers:
+        inside the process workers, which must not start pools of their own, and when bands
+        are not routed to processes. Bands take the free places of the queue; once it is full
+        the operation waits for its own bands to finish, and only gets ExecutorBusy when none
+        of them is left to wait for.
+        """
+        if self.route('bands') != 'process' or multiprocessing.parent_process() is not None:
+            return None
+
+        finished = threading.Condition()
+        state = {'running': 0, 'finished': 0}
+
+        def on_done(_):
+            with finished:
+                state['running'] -= 1
+                state['finished'] += 1
+                finished.notify()
+
+        def submit_band(func: Callable, *args) -> Future:
+            while True:
+                seen = state['finished']
+                try:
+                    future = self.submit('bands', func, *args)
+                except ExecutorBusy:
+                    with finished:
+                        if state['finished'] != seen:
+                            continue # one of ours freed its place meanwhile
+                        if state['running'] == 0:
+                            raise
+                        finished.wait()
+                    continue
+                with finished:
+                    state['running'] += 1
+                future.add_done_callback(on_done) # after the one releasing its place in the queue
+                return future
+
+        return submit_band
+
+    def submit(self, operation_type: str, func: Callable, *args, progress: Optional[Progress] = None) -> Future:
+        """
+        Submits from any thread to the pool the operation type is routed to. The call counts toward
+        max_queue_depth until the pool is done with it: a cancelled caller stops waiting but a
+        started call keeps its worker busy. With a progress, func is called with it as keyword.
+        """
+        kind = self.route(operation_type)
+        if kind == 'inline':
+            raise ValueError(f"'{operation_type}' runs inline, there is no pool to submit it to.")
+        if progress is not None:
+            func = partial(func, progress=progress)
+
+        with self._lock:
+            if self.pending >= self.max_queue_depth:
+                raise ExecutorBusy(self.retry_after)
+            self.pending += 1
+            if progress is not None:
+                self._progress_holds[progress.slot] += 1
+        try:
+            future = self._pool(kind).submit(func, *args)
+        except BaseException:
+            self._release(progress)
+            raise
+        future.add_done_callback(lambda _: self._release(progress))
+        return future
+
+    async def run(self, operation_type: str, func: Callable, *args, progress: Optional[Progress] = None):
+        if self.route(operation_type) == 'inline':
+            return func(*args) if progress is None else func(*args, progress=progress)
+        return await asyncio.wrap_future(self.submit(operation_type, func, *args, progress=progress))
+
+    def _release(self, progress: Optional[Progress]):
+        with self._lock:
+            self.pending -= 1
+            if progress is not None:
+                self._progress_holds[progress.slot] -= 1
+                self._free_progress_slot(progress.slot)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "max_queue_depth": self.max_queue_depth,
+            "process_workers": self.process_workers,
+            "thread_workers": self.thread_workers,
+            "routes": self.routes,
+        }
+
+    def shutdown(self):
+        for pool in (self._process_pool, self._thread_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._process_pool = self._thread_pool = None
+
+compute_executor = ComputeExecutor.from_environment()
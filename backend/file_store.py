@@ -0,0 +1,67 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from uuid import uuid4
+
+import aiofiles
+import aiofiles.os
+
+def temporary_path(path: str) -> str:
+    # next to the target so the final rename stays on one file system
+    return f"{path}.{uuid4().hex}.tmp"
+
+class FileStore:
+    """
+    Reads and writes image and histogram files without blocking the event loop: aiofiles runs
+    each call on a dedicated I/O thread pool, so a slow (e.g. networked) volume only holds up
+    those threads. Writes go to a temporary file renamed over the target, so readers see
+    either the previous file or the complete new one.
+    """
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    @classmethod
+    def from_environment(cls) -> 'FileStore':
+        return cls(workers=int(os.environ.get("IMG_PROC_IO_WORKERS", 4 * (os.cpu_count() or 1))))
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="io")
+        return self._pool
+
+    def open(self, path: str, mode: str):
+        return aiofiles.open(path, mode, executor=self.executor)
+
+    async def read(self, path: str) -> bytes:
+        async with self.open(path, "rb") as f:
+            return await f.read()
+
+    async def write(self, path: str, data: bytes):
+        temp_path = temporary_path(path)
+        try:
+            async with self.open(temp_path, "wb") as f:
+                await f.write(data)
+            await aiofiles.os.replace(temp_path, path, executor=self.executor)
+        except BaseException:
+            if os.path.exists(temp_path): # also on cancellation, when awaiting is no longer possible
+                os.remove(temp_path)
+            raise
+
+    async def exists(self, path: str) -> bool:
+        return await aiofiles.os.path.exists(path, executor=self.executor)
+
+    async def remove(self, path: str, missing_ok: bool = False):
+        try:
+            await aiofiles.os.remove(path, executor=self.executor)
+        except FileNotFoundError:
+            if not missing_ok:
+                raise
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True) # let pending writes land
+        self._pool = None
+
+file_store = FileStore.from_environment()
@@ -0,0 +1,56 @@
+import numpy as np
+import cv2
+from typing import Tuple, Union
+
+from convolution import CV2_DEPTHS, filter2d
+
+# (x, y) derivative kernels, y pointing up so directions turn counter-clockwise from east
+GRADIENT_KERNELS = {
+    'roberts': (np.array([[1, 0],
+                          [0, -1]]),
+                np.array([[0, 1],
+                          [-1, 0]])),
+    'sobel': (np.array([[-1, 0, 1],
+                        [-2, 0, 2],
+                        [-1, 0, 1]]),
+              np.array([[1, 2, 1],
+                        [0, 0, 0],
+                        [-1, -2, -1]])),
+    'prewitt': (np.array([[-1, 0, 1],
+                          [-1, 0, 1],
+                          [-1, 0, 1]]),
+                np.array([[1, 1, 1],
+                          [0, 0, 0],
+                          [-1, -1, -1]])),
+}
+
+WORK_DTYPES = (np.float32, np.float64)
+
+def work_depth(dtype) -> int:
+    if np.dtype(dtype) not in map(np.dtype, WORK_DTYPES):
+        raise ValueError(f"Unsupported working dtype '{np.dtype(dtype)}'. Choose float32 or float64.")
+    return CV2_DEPTHS[np.dtype(dtype)]
+
+def signed_response(image_array: np.ndarray, kernel: np.ndarray, dtype=np.float32) -> np.ndarray:
+    """
+    cv2.filter2D response in dtype instead of the input dtype, so negative and large
+    responses of 8-bit images survive (exactly, as they are small integers).
+    """
+    return filter2d(image_array, kernel, work_depth(dtype))
+
+def gradient_response(image_array: np.ndarray, operator: str, return_direction: bool = False, dtype=np.float32) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Gradient magnitude of a derivative operator, with both derivatives in dtype and the
+    magnitude (and direction in radians from 0 to 2 pi, from cv2.cartToPolar with about
+    0.3 degrees of error) computed in one pass over them.
+    """
+    if operator not in GRADIENT_KERNELS:
+        raise ValueError(f"Unsupported gradient operator '{operator}'")
+
+    kernel_x, kernel_y = GRADIENT_KERNELS[operator]
+    grad_x = signed_response(image_array, kernel_x, dtype)
+    grad_y = signed_response(image_array, kernel_y, dtype)
+
+    if return_direction:
+        return cv2.cartToPolar(grad_x, grad_y)
+    return cv2.magnitude(grad_x, grad_y, grad_x) # in place, grad_x is no longer needed
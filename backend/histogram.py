@@ -0,0 +1,103 @@
+import io
+import numpy as np
+from typing import Iterable, Optional, Tuple
+
+GRAYSCALE_CHANNELS = ('gray',)
+RGB_CHANNELS = ('red', 'green', 'blue')
+
+class Histogram:
+    """
+    Per-channel 256-bin counts stored as a single (channels, 256) int64 array.
+    """
+    __slots__ = ('counts', 'channels')
+
+    def __init__(self, counts: np.ndarray, channels: Tuple[str, ...]):
+        if counts.shape != (len(channels), 256):
+            raise ValueError(f"Histogram counts must have shape ({len(channels)}, 256), got {counts.shape}.")
+        self.counts = counts
+        self.channels = channels
+
+    def __getitem__(self, key) -> np.ndarray:
+        if isinstance(key, str):
+            key = self.channels.index(key)
+        return self.counts[key]
+
+    def __add__(self, other: 'Histogram') -> 'Histogram':
+        return merge_histograms((self, other))
+
+    @property
+    def is_grayscale(self) -> bool:
+        return len(self.channels) == 1
+
+    @property
+    def total(self) -> int:
+        return int(self.counts[0].sum())
+
+    def to_dict(self) -> dict:
+        return {channel: self.counts[i].tolist() for i, channel in enumerate(self.channels)}
+
+def _channel_names(image_array: np.ndarray) -> Tuple[str, ...]:
+    if image_array.ndim == 2:
+        return GRAYSCALE_CHANNELS
+    elif image_array.ndim == 3 and image_array.shape[2] == 3:
+        return RGB_CHANNELS
+    raise ValueError("Input image must be either a 2D grayscale or 3D RGB image array.")
+
+def _count(image_array: np.ndarray, num_channels: int) -> np.ndarray:
+    flat = image_array.reshape(-1, num_channels)
+
+    if image_array.dtype != np.uint8:
+        # only integral values in [0, 255] are counted, other values fall outside every bin
+        valid = (flat >= 0) & (flat <= 255) & (flat == np.floor(flat))
+        flat = np.where(valid, flat, 256).astype(np.intp)
+        bins = 257
+    else:
+        bins = 256
+
+    if num_channels == 1:
+        counts = np.bincount(flat.ravel(), minlength=bins)
+    else:
+        # offset each channel into its own block of bins so all channels are counted in one pass
+        offsets = np.arange(num_channels, dtype=np.intp) * bins
+        counts = np.bincount((flat + offsets).ravel(), minlength=bins * num_channels)
+
+    return counts.reshape(num_channels, bins)[:, :256].astype(np.int64)
+
+def compute_histogram(image_array: np.ndarray, tile_rows: Optional[int] = None) -> Histogram:
+    """
+    Counts all channels of a grayscale or RGB array in a single pass.
+    With tile_rows set, the image is counted in horizontal tiles whose partial histograms are merged.
+    """
+    channels = _channel_names(image_array)
+
+    if tile_rows is None or tile_rows >= image_array.shape[0]:
+        return Histogram(_count(image_array, len(channels)), channels)
+
+    return merge_histograms(
+        Histogram(_count(image_array[y:y + tile_rows], len(channels)), channels)
+        for y in range(0, image_array.shape[0], tile_rows)
+    )
+
+def merge_histograms(histograms: Iterable[Histogram]) -> Histogram:
+    merged = None
+    for histogram in histograms:
+        if merged is None:
+            merged = Histogram(histogram.counts.copy(), histogram.channels)
+        elif merged.channels != histogram.channels:
+            raise ValueError("Cannot merge histograms with different channels.")
+        else:
+            merged.counts += histogram.counts
+
+    if merged is None:
+        raise ValueError("At least one histogram is required.")
+    return merged
+
+def histogram_to_bytes(histogram: Histogram) -> bytes:
+    buf = io.BytesIO()
+    np.save(buf, histogram.counts)
+    return buf.getvalue()
+
+def histogram_from_bytes(data: bytes) -> Histogram:
+    counts = np.load(io.BytesIO(data))
+    channels = GRAYSCALE_CHANNELS if counts.shape[0] == 1 else RGB_CHANNELS
+    return Histogram(counts, channels)
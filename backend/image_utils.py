@@ -1,13 +1,14 @@
 from PIL import Image, ExifTags
 import io
-import heapq
+import os
+import warnings
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import numpy as np
 from numpy.lib.stride_tricks import sliding_window_view
-import cv2
-from typing import Any, List, Tuple, Optional
+from functools import partial
+from typing import Any, BinaryIO, List, NamedTuple, Tuple, Optional
 from operations import (
     GrayscaleOperation,
     HalftoningOperation,
@@ -19,87 +20,124 @@ from operations import (
     SingleImageOperation,
     MultiImageOperation,
     CreateImageOperation,
-    HistogramSegmentationOperation
+    HistogramSegmentationOperation,
+    PipelineStep
 )
+from histogram import Histogram, compute_histogram
+from error_diffusion import error_diffusion
+from labeling import label_components
+from median import median_filter, CV2_MEDIAN_MAX_KERNEL
+from local_stats import local_variance, local_range
+from convolution import convolve
+from kernel_bank import kernel_bank
+from compass import compass_response
+from gradient import gradient_response, signed_response
+from storage import PNG_CODEC, ImageTooLarge, image_to_array, array_mode, as_array
+from tiling import TilePlan, run_tiled, band_shape, tiling_config
+from executor import ExecutorBusy, Progress, compute_executor
+from point_ops import INVERT, LUMINOSITY, LookupTable, PointTable, WeightedLookupTable, channel_table, threshold_table
+
+def image_metadata(image: Image.Image, filename: Optional[str], file_size: int, codec=None) -> dict:
+    width, height = image.size
+    mode = image.mode  # e.g., 'RGB', 'RGBA', 'L' (grayscale)
+    img_format = image.format or codec.name.upper()  # e.g., 'JPEG', 'PNG', 'NPY'
+    is_compressed = img_format not in ['BMP', 'PPM', 'PGM', 'NPY']  # uncompressed formats
+    file_size_kb = round(file_size / 1024, 2)  # convert bytes to kilobytes, rounded to 2 decimals
+    channels = len(mode)  # number of color channels
+
+    # extract EXIF data if available
+    exif_data = {}
+    if hasattr(image, '_getexif') and image._getexif():
+        exif_raw = image._getexif()
+        for tag_id, value in exif_raw.items():
+            tag = ExifTags.TAGS.get(tag_id, tag_id)
+            exif_data[tag] = value
+
+    metadata = {
+        "file_name": filename,
+        "format": img_format,
+        "compressed": is_compressed,
+        "file_size_kilobytes": file_size_kb,
+        "width": width,
+        "height": height,
+        "color_mode": mode,
+        "channels": channels,
+        "exif_tags": exif_data if exif_data else None,
+    }
+
+    return metadata
+
+def histogram_counts(image: Image.Image) -> Histogram:
+    if image.mode in ('L', 'RGB'):
+        image_converted = image
+    elif image.mode in ('I', 'F'):
+        image_converted = image.point(lambda x: x * (255 / (image.getextrema()[1] or 1)))
+        image_converted = image_converted.convert('L')
+    else:
+        image_converted = image.convert('RGB')
 
-def get_metadata(image_bytes: bytes, filename: str) -> dict:
-    try:
-        image = Image.open(io.BytesIO(image_bytes))
-        width, height = image.size
-        mode = image.mode  # e.g., 'RGB', 'RGBA', 'L' (grayscale)
-        img_format = image.format  # e.g., 'JPEG', 'PNG'
-        is_compressed = img_format not in ['BMP', 'PPM', 'PGM']  # uncompressed formats
-        file_size_kb = round(len(image_bytes) / 1024, 2)  # convert bytes to kilobytes, rounded to 2 decimals
-        channels = len(mode)  # number of color channels
-
-        # extract EXIF data if available
-        exif_data = {}
-        if hasattr(image, '_getexif') and image._getexif():
-            exif_raw = image._getexif()
-            for tag_id, value in exif_raw.items():
-                tag = ExifTags.TAGS.get(tag_id, tag_id)
-                exif_data[tag] = value
-
-        metadata = {
-            "file_name": filename,
-            "format": img_format,
-            "compressed": is_compressed,
-            "file_size_kilobytes": file_size_kb,
-            "width": width,
-            "height": height,
-            "color_mode": mode,
-            "channels": channels,
-            "exif_tags": exif_data if exif_data else None,
-        }
-
-        return metadata
+    image_array = np.array(image_converted)
+    return compute_histogram(image_array)
 
-    except Exception as e:
-        return {"error": str(e)}
+def array_histogram(image_array: np.ndarray) -> Histogram:
+    if array_mode(image_array) in ('L', 'RGB'):
+        return compute_histogram(image_array)
+    return histogram_counts(Image.fromarray(image_array)) # converted like a decoded image of that mode
 
-def calculate_histogram(image_array: np.ndarray) -> Any:
-    if image_array.ndim == 2:  # Grayscale image
-        histogram = np.zeros(256, dtype=int)
-        for value in range(256):
-            histogram[value] = np.sum(image_array == value)
-        return histogram
-    elif image_array.ndim == 3 and image_array.shape[2] == 3:  # RGB image
-        histograms = {}
-        color_channels = ('red', 'green', 'blue')
-        for i, color in enumerate(color_channels):
-            channel_histogram = np.zeros(256, dtype=int)
-            for value in range(256):
-                channel_histogram[value] = np.sum(image_array[:, :, i] == value)
-            histograms[color] = channel_histogram
-        return histograms
-    else:
-        raise ValueError("Input image must be either a 2D grayscale or 3D RGB image array.")
-
-def get_histograms(image_bytes: bytes):
-    try:
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        if image.mode in ('L', 'RGB'):
-            image_converted = image
-        elif image.mode in ('I', 'F'):
-            image = image.point(lambda x: x * (255 / (image.getextrema()[1] or 1)))
-            image = image.convert('L')
-        else:
-            image_converted = image.convert('RGB')
+class EncodedImage(NamedTuple):
+    """
+    An operation result with everything the response needs, derived from the array in hand.
+    """
+    array: np.ndarray
+    buf: io.BytesIO # in the storage format
+    metadata: dict # as image_metadata would read it back from buf, file_name left to the caller
+    histogram: Histogram
+
+def encode_result(image_array: np.ndarray, codec=PNG_CODEC, extra_metadata: Optional[dict] = None) -> EncodedImage:
+    buf = codec.encode(image_array)
+    image = Image.fromarray(image_array)
+    metadata = image_metadata(image, None, buf.getbuffer().nbytes, codec)
+    metadata.update(extra_metadata or {})
+    return EncodedImage(image_array, buf, metadata, array_histogram(image_array))
+
+def ingest_image(upload: BinaryIO, filename: str, codec=PNG_CODEC, max_pixels: Optional[int] = None) -> Tuple[io.BytesIO, dict, Histogram]:
+    """
+    Decodes an uploaded image file once and derives its stored copy, metadata and histogram
+    from that one array. Images over max_pixels raise ImageTooLarge from their header alone.
+    upload is read where it is, e.g. the request's spooled file, so this runs in the API process.
+    """
+    file_size = upload.seek(0, os.SEEK_END)
+    upload.seek(0)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', Image.DecompressionBombWarning) # the limit is max_pixels
+        try:
+            image = Image.open(upload)
+        except Image.DecompressionBombError as e: # Pillow's own hard limit, twice its warning size
+            raise ImageTooLarge(str(e))
+        except Image.UnidentifiedImageError: # its message names the spooled file object
+            raise ValueError("Cannot identify image file.")
+
+    with image:
+        width, height = image.size
+        if max_pixels is not None and width * height > max_pixels:
+            raise ImageTooLarge(f"Image of {width}x{height} pixels exceeds the limit of {max_pixels} pixels.")
+        metadata = image_metadata(image, filename, file_size)
+        image_array = image_to_array(image)
 
-        image_array = np.array(image_converted)
-        histograms = calculate_histogram(image_array)
+    return codec.encode(image_array), metadata, array_histogram(image_array)
 
+def render_histogram(histograms: Histogram) -> Any:
+    try:
         buf = io.BytesIO()
 
-        if image_array.ndim == 2:
+        if histograms.is_grayscale:
             plt.figure(figsize=(10, 2))
-            plt.bar(range(256), histograms, color='gray')
+            plt.bar(range(256), histograms[0], color='gray')
             plt.title('Grayscale Histogram')
             plt.xlabel('Pixel Intensity')
             plt.ylabel('Frequency')
             plt.tight_layout()
-        elif image_array.ndim == 3 and image_array.shape[2] == 3:
+        else:
             color_channels = ('Red', 'Green', 'Blue')
             colors = ('red', 'green', 'blue')
 
@@ -111,8 +149,6 @@ def get_histograms(image_bytes: bytes):
                 plt.xlabel('Pixel Intensity')
                 plt.ylabel('Frequency')
                 plt.tight_layout()
-        else:
-            return {"error": "Unsupported image format for histogram generation."}
 
         plt.savefig(buf, format='png')
         plt.close()
@@ -123,203 +159,100 @@ def get_histograms(image_bytes: bytes):
     except Exception as e:
         return {"error": str(e)}
 
-def to_png_bytes(image_bytes: bytes) -> Any: # for storing images
-    try:
-        image = Image.open(io.BytesIO(image_bytes))
-        buf = io.BytesIO()
-        image.save(buf, format='PNG')
-        buf.seek(0)
-        return buf
-    except Exception as e:
-        return {"error": str(e)}
+def decode_image(image_bytes: bytes) -> np.ndarray:
+    return image_to_array(Image.open(io.BytesIO(image_bytes)))
+
+def convert_array(image_array: np.ndarray, mode: str) -> np.ndarray:
+    if array_mode(image_array) == mode: # no Image.fromarray copy, e.g. of a memory-mapped image
+        return image_array
+    image = Image.fromarray(image_array)
+    if image.mode == mode:
+        return image_array
+    return np.array(image.convert(mode))
+
+def grayscale_array(image_array: np.ndarray, operation: GrayscaleOperation) -> np.ndarray:
+    if operation.mode == 'luminosity':
+        return LUMINOSITY.apply(image_array)
+    elif operation.mode == 'lightness':
+        max_rgb = image_array.max(axis=2)
+        min_rgb = image_array.min(axis=2)
+        gray_image_array = (max_rgb.astype(np.uint16) + min_rgb) // 2 # uint8 sums would wrap around
+    else:
+        raise ValueError("Invalid mode specified.")
 
-def apply_grayscale(image_bytes: bytes, operation: GrayscaleOperation) -> Any:
-    try:
-        image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-        image_array = np.array(image)
-
-        if operation.mode == 'luminosity':
-            luminosity_weights = np.array([0.21, 0.72, 0.07])
-            gray_image_array = image_array.dot(luminosity_weights)
-        elif operation.mode == 'lightness':
-            max_rgb = image_array.max(axis=2)
-            min_rgb = image_array.min(axis=2)
-            gray_image_array = ((max_rgb + min_rgb) / 2)
-        else:
-            return {"error": "Invalid mode specified."}
+    return np.uint8(gray_image_array)
 
-        greyscale_image = Image.fromarray(np.uint8(gray_image_array), mode='L')
+def apply_grayscale(image_bytes: bytes, operation: GrayscaleOperation) -> Any:
+    return apply_array_operation('grayscale', image_bytes, operation)
 
-        buf = io.BytesIO()
-        greyscale_image.save(buf, format='PNG')
-        buf.seek(0)
-        return buf
+def halftoning_array(image_array: np.ndarray, operation: HalftoningOperation) -> np.ndarray:
+    mode = operation.mode
+    method = operation.method
+    threshold = operation.threshold
+    
+    if mode == 'grayscale':
+        if method == 'thresholding':
+            halftoned_image_array = halftone_greyscale_thresholding(image_array, threshold)
+        elif method == 'error_diffusion':
+            halftoned_image_array = halftone_greyscale_error_diffusion(image_array, threshold, operation.kernel, operation.serpentine)
+        else:
+            raise ValueError(f"Unsupported halftoning method '{method}' for mode 'grayscale'.")
+    elif mode == 'RGB':
+        if method == 'thresholding':
+            halftoned_image_array = halftone_rgb_thresholding(image_array, threshold)
+        elif method == 'error_diffusion':
+            halftoned_image_array = halftone_rgb_error_diffusion(image_array, threshold, operation.kernel, operation.serpentine)
+        else:
+            raise ValueError(f"Unsupported halftoning method '{method}' for mode 'RGB'.")
+    else:
+        raise ValueError(f"Unsupported halftoning mode '{mode}'.")
 
-    except Exception as e:
-        return {"error": str(e)}
+    return np.uint8(halftoned_image_array)
 
 def apply_halftoning(image_bytes: bytes, operation: HalftoningOperation) -> Any:
-    try:
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        mode = operation.mode
-        method = operation.method
-        threshold = operation.threshold
-        
-        if mode == 'grayscale':
-            image = image.convert('L')
-            if method == 'thresholding':
-                halftoned_image_array = halftone_greyscale_thresholding(image, threshold)
-            elif method == 'error_diffusion':
-                halftoned_image_array = halftone_greyscale_error_diffusion(image, threshold)
-            else:
-                return {"error": f"Unsupported halftoning method '{method}' for mode 'grayscale'."}
-            
-            halftoned_image = Image.fromarray(np.uint8(halftoned_image_array), mode='L')
-        elif mode == 'RGB':
-            image = image.convert('RGB')
-            if method == 'thresholding':
-                halftoned_image_array = halftone_rgb_thresholding(image, threshold)
-            elif method == 'error_diffusion':
-                halftoned_image_array = halftone_rgb_error_diffusion(image, threshold)
-            else:
-                return {"error": f"Unsupported halftoning method '{method}' for mode 'RGB'."}
-            
-            halftoned_image = Image.fromarray(np.uint8(halftoned_image_array), mode='RGB')
-        else:
-            return {"error": f"Unsupported halftoning mode '{mode}'."}
-        
-        buf = io.BytesIO()
-        halftoned_image.save(buf, format='PNG')
-        buf.seek(0)
-        return buf
-
-    except Exception as e:
-        return {"error": str(e)}
+    return apply_array_operation('halftoning', image_bytes, operation)
 
 def halftone_greyscale_thresholding(image: Image.Image, threshold: int) -> Image.Image:
-    image_array = np.array(image)
-    halftoned_image_array = np.where(image_array > threshold, 255, 0)
-    
-    return halftoned_image_array
+    return threshold_table(threshold).apply(np.asarray(image))
 
-def halftone_greyscale_error_diffusion(image, threshold):
+def halftone_greyscale_error_diffusion(image, threshold, kernel='floyd_steinberg', serpentine=False):
     image_array = np.array(image, dtype=float)
-    height, width = image_array.shape
-
-    # Floyd-Steinberg kernel
-    error_diffusion = [
-        (0, 1, 7 / 16),
-        (1, -1, 3 / 16),
-        (1, 0, 5 / 16),
-        (1, 1, 1 / 16)
-    ]
-
-    for y in range(height):
-        for x in range(width):
-            old_pixel = image_array[y, x]
-            new_pixel = 255 if old_pixel > threshold else 0
-            image_array[y, x] = new_pixel
-            quant_error = old_pixel - new_pixel
-
-            for dy, dx, coefficient in error_diffusion:
-                    ny, nx = y + dy, x + dx
-                    if 0 <= ny < height and 0 <= nx < width:
-                        image_array[ny, nx] += quant_error * coefficient
-
-    halftoned_image_array = np.clip(image_array, 0, 255)
+    halftoned_image_array = error_diffusion(image_array, (threshold,), kernel, serpentine)
     
     return halftoned_image_array
 
 def halftone_rgb_thresholding(image: Image.Image, threshold: Tuple[int, int, int]) -> Image.Image:
-    image_array = np.array(image)
+    # one table column per channel threshold
+    return threshold_table(tuple(threshold)).apply(np.asarray(image))
 
-    threshold_r, threshold_g, threshold_b = threshold
-    
-    halftoned_image_array = np.zeros_like(image_array)
-    halftoned_image_array[:, :, 0] = np.where(image_array[:, :, 0] > threshold_r, 255, 0)
-    halftoned_image_array[:, :, 1] = np.where(image_array[:, :, 1] > threshold_g, 255, 0)
-    halftoned_image_array[:, :, 2] = np.where(image_array[:, :, 2] > threshold_b, 255, 0)
-    
-    return halftoned_image_array
-
-def halftone_rgb_error_diffusion(image: Image.Image, threshold: Tuple[int, int, int]) -> Image.Image:
+def halftone_rgb_error_diffusion(image: Image.Image, threshold: Tuple[int, int, int], kernel='floyd_steinberg', serpentine=False) -> Image.Image:
     image_array = np.array(image, dtype=float)
-    height, width, channels = image_array.shape
-    
-    threshold_r, threshold_g, threshold_b = threshold
-    
-    # Floyd-Steinberg kernel
-    error_diffusion = [
-        (0, 1, 7 / 16),
-        (1, -1, 3 / 16),
-        (1, 0, 5 / 16),
-        (1, 1, 1 / 16)
-    ]
-    
-    for y in range(height):
-        for x in range(width):
-            for c in range(channels):
-                old_pixel = image_array[y, x, c]
-                current_threshold = [threshold_r, threshold_g, threshold_b][c]
-                new_pixel = 255 if old_pixel > current_threshold else 0
-                image_array[y, x, c] = new_pixel
-                quant_error = old_pixel - new_pixel
-
-                for dy, dx, coefficient in error_diffusion:
-                    ny, nx = y + dy, x + dx
-                    if 0 <= ny < height and 0 <= nx < width:
-                        image_array[ny, nx, c] += quant_error * coefficient
-
-    halftoned_image_array = np.clip(image_array, 0, 255)
+    halftoned_image_array = error_diffusion(image_array, threshold, kernel, serpentine)
     
     return halftoned_image_array
 
-def apply_histogram_smoothing(image_bytes: bytes, operation: HistogramSmoothingOperation) -> Any:
-    try:
-        image = Image.open(io.BytesIO(image_bytes))
-
-        kernel_size = operation.kernel_size
-
-        if operation.mode == 'grayscale':
-            image = image.convert('L') 
-            image_array = np.array(image)
-
-            image_histogram = calculate_histogram(image_array)
-
-            smoothed_histogram = smooth_histogram(image_histogram, kernel_size)
-            smoothed_image_array = map_hist_to_image(image_array, smoothed_histogram)
-
-            smoothed_image = Image.fromarray(np.uint8(smoothed_image_array), mode='L')
-        elif operation.mode == 'RGB':
-            image = image.convert('RGB')
-            image_array = np.array(image)
-
-            smoothed_image_array = np.zeros_like(image_array)
-
-            for i in range(3):
-                channel_array = image_array[:, :, i]
-                source_histogram = calculate_histogram(channel_array)
-
-                smoothed_histogram = smooth_histogram(source_histogram, kernel_size)
-
-                smoothed_channel_array = map_hist_to_image(channel_array, smoothed_histogram)
-
-                smoothed_image_array[:, :, i] = smoothed_channel_array
-
-            smoothed_image = Image.fromarray(smoothed_image_array, mode='RGB')
+def histogram_smoothing_array(image_array: np.ndarray, operation: HistogramSmoothingOperation, source_histograms: Optional[Histogram] = None) -> np.ndarray:
+    """
+    source_histograms replaces the histograms of image_array, e.g. those of the whole image when image_array is one tile of it.
+    """
+    kernel_size = operation.kernel_size
+    if source_histograms is None:
+        source_histograms = compute_histogram(image_array)
 
-        else:
-            raise ValueError(f"Unsupported mode '{operation.mode}'. Choose 'grayscale' or 'rgb'.")
+    if operation.mode not in ('grayscale', 'RGB'):
+        raise ValueError(f"Unsupported mode '{operation.mode}'. Choose 'grayscale' or 'rgb'.")
 
-        buf = io.BytesIO()
-        smoothed_image.save(buf, format='PNG')
-        buf.seek(0)
+    return histogram_smoothing_table(source_histograms, kernel_size).apply(image_array)
 
-        return buf
+def histogram_smoothing_table(source_histograms: Histogram, kernel_size: int) -> LookupTable:
+    """
+    Per-channel lookup table moving each channel's histogram towards its smoothed version.
+    """
+    luts = [histogram_mapping(smooth_histogram(source_histogram, kernel_size), source_histogram) for source_histogram in source_histograms.counts]
+    return LookupTable(np.uint8(luts[0] if len(luts) == 1 else np.stack(luts, axis=1)))
 
-    except Exception as e:
-        return {"error": str(e)}
+def apply_histogram_smoothing(image_bytes: bytes, operation: HistogramSmoothingOperation) -> Any:
+    return apply_array_operation('histogram_smoothing', image_bytes, operation)
 
 def smooth_histogram(histogram: np.ndarray, kernel_size):
     kernel = np.ones(kernel_size) / kernel_size
@@ -327,456 +260,270 @@ def smooth_histogram(histogram: np.ndarray, kernel_size):
     histogram_smooth = np.round(histogram_smooth).astype(int)
     return histogram_smooth
 
-def map_hist_to_image(image_array: np.ndarray, target_histogram: np.ndarray):
-    source_histogram = calculate_histogram(image_array)
-    
+def histogram_mapping(target_histogram: np.ndarray, source_histogram: np.ndarray) -> np.ndarray:
+    # value for each source level, matching the cumulative distributions
     cdf_source = np.cumsum(source_histogram).astype(np.float64)
     cdf_source /= cdf_source[-1]
 
     cdf_target = np.cumsum(target_histogram).astype(np.float64)
     cdf_target /= cdf_target[-1]
 
-    mapping = np.interp(cdf_source, cdf_target, np.arange(256))
-
-    for src_value in range(256):
-        diff = np.abs(cdf_source[src_value] - cdf_target)
-        mapping[src_value] = np.argmin(diff)
+    return np.interp(cdf_source, cdf_target, np.arange(256))
 
-    mapping = np.interp(cdf_source, cdf_target, np.arange(256))
-
-    mapped_image_array = mapping[image_array]
+def histogram_equalization_array(image_array: np.ndarray, operation: HistogramEqualizationOperation, histogram: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    histogram replaces the histogram of the equalized channel (see histogram_smoothing_array).
+    """
+    if operation.mode == 'grayscale':
+        equalized_image_array = equalize_channel(image_array, histogram)
+        return np.uint8(equalized_image_array)
+    elif operation.mode == 'RGB':
+        # the array arrives in YCbCr color space for luminance handling
+        Y_channel = image_array[:, :, 0]  # channel to equalize
+
+        if histogram is None:
+            histogram = compute_histogram(Y_channel)[0]
+        equalized_image_array = channel_table(equalization_lut(histogram), 0, 3).apply(image_array) # Cb and Cr unchanged
+        
+        equalized_image = Image.fromarray(equalized_image_array, mode='YCbCr')
+        return np.array(equalized_image.convert('RGB'))
 
-    return mapped_image_array
+    raise ValueError(f"Unsupported equalization mode '{operation.mode}'.")
 
 def apply_histogram_equalization(image_bytes: bytes, operation: HistogramEqualizationOperation) -> Any:
-    try:
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        if operation.mode == 'grayscale':
-            image = image.convert('L')
-            image_array = np.array(image)
-            equalized_image_array = equalize_channel(image_array)
-            equalized_image = Image.fromarray(np.uint8(equalized_image_array), mode='L')
-        elif operation.mode == 'RGB':
-            # convert to YCbCr color space for luminance handling
-            image = image.convert('YCbCr')
-            image_array = np.array(image)
-
-            Y_channel = image_array[:, :, 0]  # channel to equalize
-            Cb_channel = image_array[:, :, 1]  
-            Cr_channel = image_array[:, :, 2]
-
-            equalized_Y_channel = equalize_channel(Y_channel)
-            equalized_image_array = np.stack((equalized_Y_channel, Cb_channel, Cr_channel), axis=2)
-            
-            equalized_image = Image.fromarray(np.uint8(equalized_image_array), mode='YCbCr')
-            equalized_image = equalized_image.convert('RGB')
-        else:
-            return {"error": f"Unsupported equalization mode '{operation.mode}'."}
-        
-        buf = io.BytesIO()
-        equalized_image.save(buf, format='PNG')
-        buf.seek(0)
-        return buf
+    return apply_array_operation('histogram_equalization', image_bytes, operation)
 
-    except Exception as e:
-        return {"error": str(e)}
-    
-def equalize_channel(channel_array: np.ndarray) -> np.ndarray:
-    histogram = calculate_histogram(channel_array)
+def equalize_channel(channel_array: np.ndarray, histogram: Optional[np.ndarray] = None) -> np.ndarray:
+    if histogram is None:
+        histogram = compute_histogram(channel_array)[0]
+
+    return LookupTable(equalization_lut(histogram)).apply(channel_array)
 
+def equalization_lut(histogram: np.ndarray) -> np.ndarray:
     cdf = histogram.cumsum()
     cdf_normalized = (cdf - cdf.min()) * 255 / (cdf.max() - cdf.min())
-    cdf_normalized = cdf_normalized.astype(np.uint8)
+    return cdf_normalized.astype(np.uint8)
 
-    equalized_channel_array = cdf_normalized[channel_array]
-
-    return equalized_channel_array
-
-def apply_convolution(image_array, kernel, stride=1): # fast convolution using opencv
-    if image_array.ndim == 3:
-        convolved_image = np.zeros_like(image_array)
-        for c in range(image_array.shape[2]):
-            convolved_image[:, :, c] = cv2.filter2D(image_array[:, :, c], -1, kernel)
-    elif image_array.ndim == 2:
-        convolved_image = cv2.filter2D(image_array, -1, kernel)
-    else:
-        raise ValueError("Input image must be a 2D or 3D numpy array.")
+def apply_convolution(image_array, kernel=None, stride=1, terms=None): # fast convolution using opencv, see convolution.convolve
+    convolved_image = convolve(image_array, kernel, terms)
 
     if stride > 1:
         convolved_image = convolved_image[::stride, ::stride]
 
     return convolved_image
 
+BASIC_EDGE_OPERATORS = (
+    'roberts', 'sobel', 'prewitt', 
+    'kirsch', 'robinson', 
+    'laplacian_1', 'laplacian_2'
+)
+
+def basic_edge_detection_array(image_array: np.ndarray, operation: BasicEdgeDetectionOperation, response_max: Optional[float] = None) -> np.ndarray:
+    """
+    response_max normalizes the response instead of its maximum over image_array,
+    e.g. the maximum over the whole image when image_array is one tile of it.
+    """
+    operator = operation.operator
+    if operator not in BASIC_EDGE_OPERATORS:
+        raise ValueError(f"Unsupported operator '{operator}' for edge detection")
+
+    edge_image_array = basic_edge_response(image_array, operator)
+    if response_max is None:
+        response_max = edge_image_array.max()
+    if response_max > 0: # otherwise a flat image, with no edges to scale
+        edge_image_array *= np.float32(255) / response_max
+
+    return finish_edge_detection(edge_image_array, operation)
+
+def basic_edge_response(image_array: np.ndarray, operator: str, dtype=np.float32) -> np.ndarray:
+    """
+    Unnormalized response of a basic edge operator in dtype (float32 or float64): gradient magnitude,
+    strongest compass response or absolute Laplacian, without saturating to the input dtype.
+    """
+    gradient_based = ('roberts', 'sobel', 'prewitt')
+    compass_based = ('kirsch', 'robinson')
+    laplacian_based = ('laplacian_1', 'laplacian_2')
+
+    if operator in gradient_based:
+        # both derivatives in dtype, magnitude in one pass over them
+        return gradient_response(image_array, operator, dtype=dtype)
+
+    elif operator in compass_based:
+        # one running maximum over the eight rotated kernels, from shared neighbour sums
+        return compass_response(image_array, operator, dtype=dtype)
+
+    elif operator in laplacian_based:
+        if operator == 'laplacian_1':
+            laplacian_kernel = np.array([[ 0, -1,  0],
+                                         [-1,  4, -1],
+                                         [ 0, -1,  0]])
+        elif operator == 'laplacian_2':
+            laplacian_kernel = np.array([[-1, -1, -1],
+                                         [-1,  8, -1],
+                                         [-1, -1, -1]])
+
+        laplacian_response = signed_response(image_array, laplacian_kernel, dtype)
+
+        return np.abs(laplacian_response, out=laplacian_response)
+
+    raise ValueError(f"Unhandled operator '{operator}' for edge detection")
+
+def finish_edge_detection(edge_image_array: np.ndarray, operation) -> np.ndarray:
+    """
+    Optional contrast-based normalization and thresholding shared by the edge detectors.
+    """
+    if operation.contrast_based:
+        box = kernel_bank.get_kernel('box', operation.smoothing_kernel_size)
+        smoothed_image = apply_convolution(edge_image_array, box.kernel, terms=box.terms)
+
+        with np.errstate(divide='ignore', invalid='ignore'): # avoid division by 0
+            smoothed_image_array = np.divide(edge_image_array, smoothed_image)
+            smoothed_image_array = np.nan_to_num(smoothed_image_array, nan=0.0, posinf=0.0, neginf=0.0)
+
+        edge_image_array = smoothed_image_array
+
+    if operation.thresholding:
+        threshold = operation.threshold
+        edge_image_array = np.where(edge_image_array >= threshold, 255, 0)
+
+    return np.uint8(edge_image_array)
+
 def apply_basic_edge_detection(image_bytes: bytes, operation: BasicEdgeDetectionOperation) -> Any:
-    try:
-        supported_operators = (
-            'roberts', 'sobel', 'prewitt', 
-            'kirsch', 'robinson', 
-            'laplacian_1', 'laplacian_2'
-        )
-        operator = operation.operator
-        if operator not in supported_operators:
-            return {"error": f"Unsupported operator '{operator}' for edge detection"}
-        
-        gradient_based = ('roberts', 'sobel', 'prewitt')
-        compass_based = ('kirsch', 'robinson')
-        laplacian_based = ('laplacian_1', 'laplacian_2')
+    return apply_array_operation('basic_edge_detection', image_bytes, operation)
 
-        image = Image.open(io.BytesIO(image_bytes)).convert('L')
-        image_array = np.array(image)
-        height, width = image_array.shape
-        
-        edge_image_array = np.zeros((height, width))
-        
-        if operator in gradient_based:
-            # gradient-based kernels
-            if operator == 'roberts':
-                Gx = np.array([[1, 0],
-                               [0, -1]])
-                Gy = np.array([[0, 1],
-                               [-1, 0]])
-            elif operator == 'sobel':
-                Gx = np.array([[-1, 0, 1],
-                               [-2, 0, 2],
-                               [-1, 0, 1]])
-                Gy = np.array([[1, 2, 1],
-                               [0, 0, 0],
-                               [-1, -2, -1]])
-            elif operator == 'prewitt':
-                Gx = np.array([[-1, 0, 1],
-                               [-1, 0, 1],
-                               [-1, 0, 1]])
-                Gy = np.array([[1, 1, 1],
-                               [0, 0, 0],
-                               [-1, -1, -1]])
-
-            grad_x = apply_convolution(image_array, Gx, stride=1)
-            grad_y = apply_convolution(image_array, Gy, stride=1)
-
-            gradient_magnitude = np.sqrt(grad_x**2 + grad_y**2)
-            gradient_magnitude = (gradient_magnitude / gradient_magnitude.max()) * 255
-            edge_image_array = gradient_magnitude
-
-        elif operator in compass_based:
-            # compass-based kernels
-            if operator == 'kirsch':
-                kirsch_kernels = [
-                    np.array([[-3, -3,  5],
-                              [-3,  0,  5],
-                              [-3, -3,  5]]),
-                    np.array([[-3,  5,  5],
-                              [-3,  0,  5],
-                              [-3, -3, -3]]),
-                    np.array([[ 5,  5,  5],
-                              [-3,  0, -3],
-                              [-3, -3, -3]]),
-                    np.array([[ 5,  5, -3],
-                              [ 5,  0, -3],
-                              [-3, -3, -3]]),
-                    np.array([[ 5, -3, -3],
-                              [ 5,  0, -3],
-                              [ 5, -3, -3]]),
-                    np.array([[-3, -3, -3],
-                              [ 5,  0, -3],
-                              [ 5,  5, -3]]),
-                    np.array([[-3, -3, -3],
-                              [-3,  0, -3],
-                              [ 5,  5,  5]]),
-                    np.array([[-3, -3, -3],
-                              [-3,  0,  5],
-                              [-3,  5,  5]])
-                ]
-            elif operator == 'robinson':
-                robinson_kernels = [
-                    np.array([[-1,  0,  1],
-                              [-2,  0,  2],
-                              [-1,  0,  1]]),
-                    np.array([[ 0,  1,  2],
-                              [-1,  0,  1],
-                              [-2, -1,  0]]),
-                    np.array([[ 1,  2,  1],
-                              [ 0,  0,  0],
-                              [-1, -2, -1]]),
-                    np.array([[ 2,  1,  0],
-                              [ 1,  0, -1],
-                              [ 0, -1, -2]]),
-                    np.array([[ 1,  0, -1],
-                              [ 2,  0, -2],
-                              [ 1,  0, -1]]),
-                    np.array([[ 0, -1, -2],
-                              [ 1,  0, -1],
-                              [ 2,  1,  0]]),
-                    np.array([[-1, -2, -1],
-                              [ 0,  0,  0],
-                              [ 1,  2,  1]]),
-                    np.array([[-2, -1,  0],
-                              [-1,  0,  1],
-                              [ 0,  1,  2]])
-                ]
-
-            if operator == 'kirsch':
-                kernels = kirsch_kernels
-            elif operator == 'robinson':
-                kernels = robinson_kernels
-
-            responses = []
-            for kernel in kernels:
-                response = apply_convolution(image_array, kernel, stride=1)
-                responses.append(response)
-
-            stacked_responses = np.stack(responses, axis=0)
-            max_response = np.max(stacked_responses, axis=0)
-
-            max_response = (max_response / np.max(max_response)) * 255
-            edge_image_array = max_response
-    
-        elif operator in laplacian_based:
-            if operator == 'laplacian_1':
-                laplacian_kernel = np.array([[ 0, -1,  0],
-                                             [-1,  4, -1],
-                                             [ 0, -1,  0]])
-            elif operator == 'laplacian_2':
-                laplacian_kernel = np.array([[-1, -1, -1],
-                                             [-1,  8, -1],
-                                             [-1, -1, -1]])
-
-            laplacian_response = apply_convolution(image_array, laplacian_kernel, stride=1)
-
-            laplacian_response = np.abs(laplacian_response)
-
-            laplacian_response = (laplacian_response / laplacian_response.max()) * 255
-            edge_image_array = laplacian_response
-        
-        else:
-            return {"error": f"Unhandled operator '{operator}' for edge detection"}
-
-        if operation.contrast_based:
-            smoothing_kernel_size = operation.smoothing_kernel_size
-            smoothing_kernel = np.ones((smoothing_kernel_size, smoothing_kernel_size)) / (smoothing_kernel_size ** 2)
-
-            smoothed_image = apply_convolution(edge_image_array, smoothing_kernel)
-            
-            with np.errstate(divide='ignore', invalid='ignore'): # avoid division by 0
-                smoothed_image_array = np.divide(edge_image_array, smoothed_image)
-                smoothed_image_array = np.nan_to_num(smoothed_image_array, nan=0.0, posinf=0.0, neginf=0.0)
-            
-            edge_image_array = smoothed_image_array
-            
-        if operation.thresholding:
-            threshold = operation.threshold
-            edge_image_array = np.where(edge_image_array >= threshold, 255, 0)
-
-        edge_image = Image.fromarray(np.uint8(edge_image_array), mode='L')
+ADVANCED_EDGE_OPERATORS = (
+    'homogeneity', 'difference',
+    'gaussian_1', 'gaussian_2',
+    'variance', 'range'
+)
 
-        buf = io.BytesIO()
-        edge_image.save(buf, format='PNG')
-        buf.seek(0)
-        
-        return buf
-        
-    except Exception as e:
-        return {"error": str(e)}
-    
-def apply_advanced_edge_detection(image_bytes: bytes, operation: AdvancedEdgeDetectionOperation) -> Any:
-    try:
-        supported_operators = (
-            'homogeneity', 'difference', 
-            'gaussian_1', 'gaussian_2', 
-            'variance', 'range'
-        )
-        operator = operation.operator
-        if operator not in supported_operators:
-            return {"error": f"Unsupported operator '{operator}' for edge detection"}
-
-        image = Image.open(io.BytesIO(image_bytes)).convert('L')
-        image_array = np.array(image)
-        height, width = image_array.shape
-
-        edge_image_array = np.zeros((height, width))
-
-        if operator == 'homogeneity':
-            threshold = operation.threshold
-            window_size = operation.kernel_size if operation.kernel_size is not None else 3
-            pad_width = window_size // 2
-            padded = padded = np.pad(image_array, pad_width=pad_width, mode='constant', constant_values=0)
-            
-            windows = sliding_window_view(padded, (window_size, window_size))
-
-            center = image_array
-            
-            max_diff = np.max(np.abs(windows - center[:, :, np.newaxis, np.newaxis]), axis=(2, 3))
-
-            edge_image_array = np.where(max_diff >= threshold, 255, 0)
-
-        elif operator == 'difference':
-            threshold = operation.threshold
-            window_size = 3
-            pad_width = window_size // 2
-            padded = np.pad(image_array, pad_width=pad_width, mode='reflect')
-            
-            windows = sliding_window_view(padded, (window_size, window_size))
-
-            top_left = windows[:, :, 0, 0]  
-            bottom_right = windows[:, :, 2, 2]  
-            top_right = windows[:, :, 0, 2] 
-            bottom_left = windows[:, :, 2, 0]  
-            top_center = windows[:, :, 0, 1]  
-            bottom_center = windows[:, :, 2, 1]  
-            middle_left = windows[:, :, 1, 0]  
-            middle_right = windows[:, :, 1, 2]
-
-            diff1 = np.abs(top_left - bottom_right)
-            diff2 = np.abs(top_right - bottom_left)
-            diff3 = np.abs(top_center - bottom_center)
-            diff4 = np.abs(middle_left - middle_right)
-
-            diffs = np.stack((diff1, diff2, diff3, diff4), axis=2)
-            max_diffs = diffs.max(axis=2)
-            
-            edge_image_array = np.where(max_diffs >= threshold, 255, 0)
-
-        elif operator in ('gaussian_1', 'gaussian_2'):
-            kernel = None
-            if operator == 'gaussian_1':
-                kernel = np.array([
-                    [0, 0, -1, -1, -1, 0, 0],
-                    [0, -2, -3, -3, -3, -2, 0],
-                    [-1, -3, 5, 5, 5, -3, -1],
-                    [-1, -3, 5, 16, 5, -3, -1],
-                    [-1, -3, 5, 5, 5, -3, -1],
-                    [0, -2, -3, -3, -3, -2, 0],
-                    [0, 0, -1, -1, -1, 0, 0]
-                ])
-            elif operator == 'gaussian_2':
-                kernel = np.array([
-                    [0, 0, 0, -1, -1, -1, 0, 0, 0],
-                    [0, -2, -3, -3, -3, -3, -3, -2, 0],
-                    [0, -3, -2, -1, -1, -1, -2, -3, 0],
-                    [-1, -3, -1, 9, 9, 9, -1, -3, -1],
-                    [-1, -3, -1, 9, 19, 9, -1, -3, -1],
-                    [-1, -3, -1, 9, 9, 9, -1, -3, -1],
-                    [0, -3, -2, -1, -1, -1, -2, -3, 0],
-                    [0, -2, -3, -3, -3, -3, -3, -2, 0],
-                    [0, 0, 0, -1, -1, -1, 0, 0, 0]
-                ])
-
-            convolved_image = apply_convolution(image_array, kernel)
-            convolved_abs = np.abs(convolved_image)
-            
-            edge_image_array = (convolved_abs / convolved_abs.max()) * 255
-
-        elif operator == 'variance':
-            threshold = operation.threshold
-            kernel_size = operation.kernel_size
-            pad_width = kernel_size // 2
-            padded = np.pad(image_array, pad_width=pad_width, mode='reflect')
-            windows = sliding_window_view(padded, (kernel_size, kernel_size))
-
-            edge_image_array = np.var(windows, axis=(2, 3))
-
-        elif operator == 'range':
-            threshold = operation.threshold
-            kernel_size = operation.kernel_size
-            pad_width = kernel_size // 2
-            padded = np.pad(image_array, pad_width=pad_width, mode='reflect')
-            windows = sliding_window_view(padded, (kernel_size, kernel_size))
- 
-            edge_image_array = np.max(windows, axis=(2, 3)) - np.min(windows, axis=(2, 3))
-        else:
-            return {"error": f"Unhandled operator '{operator}' for edge detection"}
-
-        if operation.contrast_based:
-            smoothing_kernel_size = operation.smoothing_kernel_size
-            smoothing_kernel = np.ones((smoothing_kernel_size, smoothing_kernel_size)) / (smoothing_kernel_size ** 2)
-
-            smoothed_image = apply_convolution(edge_image_array, smoothing_kernel)
-            
-            with np.errstate(divide='ignore', invalid='ignore'): # avoid division by 0
-                smoothed_image_array = np.divide(edge_image_array, smoothed_image)
-                smoothed_image_array = np.nan_to_num(smoothed_image_array, nan=0.0, posinf=0.0, neginf=0.0)
-            
-            edge_image_array = smoothed_image_array
-            
-        if operation.thresholding:
-            threshold = operation.threshold
-            edge_image_array = np.where(edge_image_array >= threshold, 255, 0)
-
-        edge_image = Image.fromarray(np.uint8(edge_image_array), mode='L')
-        
-        buf = io.BytesIO()
-        edge_image.save(buf, format='PNG')
-        buf.seek(0)
+def advanced_edge_detection_array(image_array: np.ndarray, operation: AdvancedEdgeDetectionOperation, response_max: Optional[float] = None) -> np.ndarray:
+    """
+    response_max normalizes the gaussian responses instead of their maximum over image_array (see basic_edge_detection_array).
+    """
+    operator = operation.operator
+    if operator not in ADVANCED_EDGE_OPERATORS:
+        raise ValueError(f"Unsupported operator '{operator}' for edge detection")
 
-        return buf
-    except Exception as e:
-        return {"error": str(e)}   
-    
-def apply_filtering(image_bytes: bytes, operation: FilteringOperation) -> Any:
-    try:
-        image = Image.open(io.BytesIO(image_bytes))
-        image_array = np.array(image)
-        
-        kernel_size = operation.kernel_size
-        sigma = operation.sigma
-        mode = operation.mode
+    if operator == 'homogeneity':
+        threshold = operation.threshold
+        window_size = operation.kernel_size if operation.kernel_size is not None else 3
+        pad_width = window_size // 2
+        padded = padded = np.pad(image_array, pad_width=pad_width, mode='constant', constant_values=0)
 
-        if mode == 'low':
-            kernel = generate_gaussian_kernel(kernel_size, sigma)
-            filtered_image_array = apply_convolution(image_array, kernel)
-        elif mode == 'high':
-            kernel = generate_log_kernel(kernel_size, sigma)
-            filtered_image_array = apply_convolution(image_array, kernel)
-        elif mode == 'median':
-            pad_size = kernel_size // 2
-            padded_array = np.pad(image_array, pad_size, mode='constant', constant_values=0)
-
-            windows = sliding_window_view(padded_array, (kernel_size, kernel_size))
-            filtered_image_array = np.median(windows, axis=(-2, -1))
-        else:
-            raise ValueError(f"Unsupported mode: {mode}. Supported modes are 'low', 'high', 'median'.")
+        windows = sliding_window_view(padded, (window_size, window_size))
 
-        filtered_image = Image.fromarray(np.uint8(filtered_image_array))
+        center = image_array
 
-        buf = io.BytesIO()
-        filtered_image.save(buf, format='PNG')
-        buf.seek(0)
+        max_diff = np.max(np.abs(windows - center[:, :, np.newaxis, np.newaxis]), axis=(2, 3))
 
-        return buf
-    except Exception as e:
-        print(f"Error: {e}")
-        return None
-    
-def generate_gaussian_kernel(size, sigma=None):
-    if sigma is None:
-        sigma = size / 6.0 
+        edge_image_array = np.where(max_diff >= threshold, 255, 0)
 
-    ax = np.linspace(-(size // 2), size // 2, size)
-    xx, yy = np.meshgrid(ax, ax)
-    kernel = np.exp(-(xx**2 + yy**2) / (2. * sigma**2))
-    kernel /= np.sum(kernel)
-    return kernel
+    elif operator == 'difference':
+        threshold = operation.threshold
+        window_size = 3
+        pad_width = window_size // 2
+        padded = np.pad(image_array, pad_width=pad_width, mode='reflect')
 
-def generate_log_kernel(size, sigma=None):
-    if sigma is None:
-        sigma = size / 6.0
+        windows = sliding_window_view(padded, (window_size, window_size))
 
-    ax = np.arange(-size // 2 + 1., size // 2 + 1.)
-    xx, yy = np.meshgrid(ax, ax)
-    xy_squared = xx**2 + yy**2
+        top_left = windows[:, :, 0, 0]  
+        bottom_right = windows[:, :, 2, 2]  
+        top_right = windows[:, :, 0, 2] 
+        bottom_left = windows[:, :, 2, 0]  
+        top_center = windows[:, :, 0, 1]  
+        bottom_center = windows[:, :, 2, 1]  
+        middle_left = windows[:, :, 1, 0]  
+        middle_right = windows[:, :, 1, 2]
 
-    normalization = -1 / (np.pi * sigma**4)
-    laplacian = (1 - (xy_squared) / (2 * sigma**2))
-    gaussian = np.exp(-xy_squared / (2 * sigma**2))
+        diff1 = np.abs(top_left - bottom_right)
+        diff2 = np.abs(top_right - bottom_left)
+        diff3 = np.abs(top_center - bottom_center)
+        diff4 = np.abs(middle_left - middle_right)
 
-    kernel = normalization * laplacian * gaussian
-    kernel -= kernel.mean()
-    return kernel
+        diffs = np.stack((diff1, diff2, diff3, diff4), axis=2)
+        max_diffs = diffs.max(axis=2)
 
-def apply_single_image_operation(image_bytes: bytes, operation: SingleImageOperation) -> Any:
-    image = Image.open(io.BytesIO(image_bytes)).convert('RGB') # for simplicity all images converted to RGB
-    image_array = np.array(image)
-    
+        edge_image_array = np.where(max_diffs >= threshold, 255, 0)
+
+    elif operator in ('gaussian_1', 'gaussian_2'):
+        convolved_abs = gaussian_edge_response(image_array, operator)
+        if response_max is None:
+            response_max = convolved_abs.max()
+
+        edge_image_array = (convolved_abs / response_max) * 255
+
+    elif operator == 'variance':
+        threshold = operation.threshold
+        kernel_size = operation.kernel_size
+        edge_image_array = local_variance(image_array, kernel_size)
+
+    elif operator == 'range':
+        threshold = operation.threshold
+        kernel_size = operation.kernel_size
+        edge_image_array = local_range(image_array, kernel_size)
+    else:
+        raise ValueError(f"Unhandled operator '{operator}' for edge detection")
+
+    return finish_edge_detection(edge_image_array, operation)
+
+def gaussian_edge_response(image_array: np.ndarray, operator: str) -> np.ndarray:
+    """
+    Absolute response of the 7x7 'gaussian_1' or 9x9 'gaussian_2' edge kernel.
+    """
+    if operator == 'gaussian_1':
+        kernel = np.array([
+            [0, 0, -1, -1, -1, 0, 0],
+            [0, -2, -3, -3, -3, -2, 0],
+            [-1, -3, 5, 5, 5, -3, -1],
+            [-1, -3, 5, 16, 5, -3, -1],
+            [-1, -3, 5, 5, 5, -3, -1],
+            [0, -2, -3, -3, -3, -2, 0],
+            [0, 0, -1, -1, -1, 0, 0]
+        ])
+    elif operator == 'gaussian_2':
+        kernel = np.array([
+            [0, 0, 0, -1, -1, -1, 0, 0, 0],
+            [0, -2, -3, -3, -3, -3, -3, -2, 0],
+            [0, -3, -2, -1, -1, -1, -2, -3, 0],
+            [-1, -3, -1, 9, 9, 9, -1, -3, -1],
+            [-1, -3, -1, 9, 19, 9, -1, -3, -1],
+            [-1, -3, -1, 9, 9, 9, -1, -3, -1],
+            [0, -3, -2, -1, -1, -1, -2, -3, 0],
+            [0, -2, -3, -3, -3, -3, -3, -2, 0],
+            [0, 0, 0, -1, -1, -1, 0, 0, 0]
+        ])
+    else:
+        raise ValueError(f"Unsupported gaussian operator '{operator}'")
+
+    convolved_image = apply_convolution(image_array, kernel)
+    return np.abs(convolved_image)
+
+def apply_advanced_edge_detection(image_bytes: bytes, operation: AdvancedEdgeDetectionOperation) -> Any:
+    return apply_array_operation('advanced_edge_detection', image_bytes, operation)
+
+def filtering_array(image_array: np.ndarray, operation: FilteringOperation) -> np.ndarray:
+    kernel_size = operation.kernel_size
+    sigma = operation.sigma
+    mode = operation.mode
+
+    if mode == 'low':
+        gaussian = kernel_bank.get_kernel('gaussian', kernel_size, sigma)
+        filtered_image_array = apply_convolution(image_array, gaussian.kernel, terms=gaussian.terms)
+    elif mode == 'high':
+        log = kernel_bank.get_kernel('log', kernel_size, sigma)
+        filtered_image_array = apply_convolution(image_array, log.kernel, terms=log.terms)
+    elif mode == 'median':
+        filtered_image_array = median_filter(image_array, kernel_size)
+    else:
+        raise ValueError(f"Unsupported mode: {mode}. Supported modes are 'low', 'high', 'median'.")
+
+    return np.uint8(filtered_image_array)
+
+def apply_filtering(image_bytes: bytes, operation: FilteringOperation) -> Any:
+    return apply_array_operation('filtering', image_bytes, operation)
+
+def single_image_operation_array(image_array: np.ndarray, operation: SingleImageOperation) -> np.ndarray:
     if operation.operation == 'rotate':
         angle = operation.angle
         result_image_array = rotate_image(image_array, angle)
@@ -791,13 +538,10 @@ def apply_single_image_operation(image_bytes: bytes, operation: SingleImageOpera
     else:
         raise ValueError(f"Unsupported operation: {operation.operation}")
 
-    result_image = Image.fromarray(np.uint8(result_image_array), mode='RGB')
+    return np.uint8(result_image_array)
 
-    buf = io.BytesIO()
-    result_image.save(buf, format='PNG')
-    buf.seek(0)
-
-    return buf
+def apply_single_image_operation(image_bytes: bytes, operation: SingleImageOperation) -> Any:
+    return apply_array_operation('single_operation', image_bytes, operation)
 
 def rotate_image(image_array: np.ndarray, angle: float) -> np.ndarray:
     theta = np.radians(angle)
@@ -898,163 +642,132 @@ def flip_image(image_array: np.ndarray, mode: str) -> np.ndarray:
         return image_array[::-1, :, :]
     
 def invert_image(image_array: np.ndarray) -> np.ndarray:
-    return 255 - image_array
+    return INVERT.apply(image_array)
 
-def apply_multi_image_operation(image_bytes_list: List[bytes], operation: MultiImageOperation) -> Any:
-    try:
-        image_arrays = []
-        for idx, img_bytes in enumerate(image_bytes_list):
-            try:
-                img = Image.open(io.BytesIO(img_bytes)).convert('RGB')
-                img_array = np.array(img)
-                image_arrays.append(img_array)
-            except Exception as e:
-                return {"error": f"Error loading image {idx + 1}: {str(e)}"}
-        
-        base_shape = image_arrays[0].shape
-
-        if operation.operation == 'add':
-            for idx, img_array in enumerate(image_arrays):
-                if img_array.shape != base_shape:
-                    return {"error": f"All images must have the same dimensions for 'add' operation. Image {idx + 1} has shape {img_array.shape}, expected {base_shape}."}
-            
-            result_array = np.zeros_like(image_arrays[0], dtype=np.float32)
-            for img in image_arrays:
-                result_array += img.astype(np.float32)
-
-        elif operation.operation == 'subtract':
+def multi_image_operation_array(image_arrays: List[np.ndarray], operation: MultiImageOperation) -> np.ndarray:
+    base_shape = image_arrays[0].shape
+
+    if operation.operation in ('add', 'subtract'):
+        for idx, img_array in enumerate(image_arrays):
             if img_array.shape != base_shape:
-                    return {"error": f"All images must have the same dimensions for 'add' operation. Image {idx + 1} has shape {img_array.shape}, expected {base_shape}."}
-            
-            result_array = image_arrays[0].astype(np.float32)
+                raise ValueError(f"All images must have the same dimensions for '{operation.operation}' operation. Image {idx + 1} has shape {img_array.shape}, expected {base_shape}.")
 
-            for img in image_arrays[1:]:
-                result_array -= img.astype(np.float32)
+    if operation.operation == 'add':
+        result_array = np.zeros_like(image_arrays[0], dtype=np.float32)
+        for img in image_arrays:
+            result_array += img.astype(np.float32)
 
-        elif operation.operation == 'cut_paste':
-            source_array = image_arrays[0]
-            dest_array = image_arrays[1]
-            src_region = operation.src_region
-            dest_position = operation.dest_position
+    elif operation.operation == 'subtract':
+        result_array = image_arrays[0].astype(np.float32)
 
-            x1, y1, x2, y2 = src_region
-            dest_x, dest_y = dest_position
+        for img in image_arrays[1:]:
+            result_array -= img.astype(np.float32)
 
-            src_height, src_width, _ = source_array.shape
-            if not (0 <= x1 < x2 <= src_width and 0 <= y1 < y2 <= src_height):
-                raise ValueError("Invalid src_region coordinates.")
+    elif operation.operation == 'cut_paste':
+        source_array = image_arrays[0]
+        dest_array = image_arrays[1].copy() # inputs are never modified in place
+        src_region = operation.src_region
+        dest_position = operation.dest_position
 
-            region = source_array[y1:y2, x1:x2].copy()
+        x1, y1, x2, y2 = src_region
+        dest_x, dest_y = dest_position
 
-            region_height, region_width, _ = region.shape
+        src_height, src_width, _ = source_array.shape
+        if not (0 <= x1 < x2 <= src_width and 0 <= y1 < y2 <= src_height):
+            raise ValueError("Invalid src_region coordinates.")
 
-            dest_height, dest_width, _ = dest_array.shape
-            if not (0 <= dest_x < dest_width and 0 <= dest_y < dest_height):
-                raise ValueError("Invalid dest_position coordinates.")
+        region = source_array[y1:y2, x1:x2]
 
-            end_x = min(dest_x + region_width, dest_width)
-            end_y = min(dest_y + region_height, dest_height)
+        region_height, region_width, _ = region.shape
 
-            paste_width = end_x - dest_x
-            paste_height = end_y - dest_y
+        dest_height, dest_width, _ = dest_array.shape
+        if not (0 <= dest_x < dest_width and 0 <= dest_y < dest_height):
+            raise ValueError("Invalid dest_position coordinates.")
 
-            if paste_width <= 0 or paste_height <= 0:
-                raise ValueError("Destination position is out of bounds for the region to paste.")
+        end_x = min(dest_x + region_width, dest_width)
+        end_y = min(dest_y + region_height, dest_height)
 
-            dest_array[dest_y:end_y, dest_x:end_x] = region[0:paste_height, 0:paste_width]
+        paste_width = end_x - dest_x
+        paste_height = end_y - dest_y
 
-            result_array = dest_array
+        if paste_width <= 0 or paste_height <= 0:
+            raise ValueError("Destination position is out of bounds for the region to paste.")
 
-        result_array = np.clip(result_array, 0, 255)
-        result_image = Image.fromarray(np.uint8(result_array), mode='RGB')
+        dest_array[dest_y:end_y, dest_x:end_x] = region[0:paste_height, 0:paste_width]
 
-        buf = io.BytesIO()
-        result_image.save(buf, format='PNG')
-        buf.seek(0)
+        result_array = dest_array
 
-        return buf
-    except Exception as e:
-        return {"error": str(e)}
-    
-def create_image(operation: CreateImageOperation) -> Any:
-    try:
-        width = operation.width
-        height = operation.height
-        color = operation.color
-
-        color_map = {
-            'white': (255),
-            'black': (0)
-        }
-        
-        if color not in color_map:
-            return {"error": f"Unsupported color '{color}'. Choose 'white' or 'black'."}
+    result_array = np.clip(result_array, 0, 255)
+    return np.uint8(result_array)
 
-        image_array = np.full((height, width), color_map[color], dtype=np.uint8)
+def create_image_array(operation: CreateImageOperation) -> np.ndarray:
+    width = operation.width
+    height = operation.height
+    color = operation.color
 
-        image = Image.fromarray(image_array, mode='L')
-
-        buf = io.BytesIO()
-        image.save(buf, format='PNG')
-        buf.seek(0)
-        
-        return buf
+    color_map = {
+        'white': (255),
+        'black': (0)
+    }
     
+    if color not in color_map:
+        raise ValueError(f"Unsupported color '{color}'. Choose 'white' or 'black'.")
+
+    return np.full((height, width), color_map[color], dtype=np.uint8)
+
+def create_image(operation: CreateImageOperation, codec=PNG_CODEC) -> Any:
+    try:
+        return encode_result(create_image_array(operation), codec)
     except Exception as e:
         return {"error": str(e)}
     
-def apply_histogram_segmentation(image_bytes: bytes, operation) -> Any:
-    try:
-        image = Image.open(io.BytesIO(image_bytes)).convert('L')
-        image_array = np.array(image)
-
-        hi = None
-        low = None
-
-        histogram = calculate_histogram(image_array)
-
-        histogram_smooth = smooth_histogram(histogram, kernel_size=5)
-
-        if operation.mode == 'manual':
-            hi = operation.hi
-            low = operation.low
-        elif operation.mode == 'peak':
-            peaks = find_peaks(histogram_smooth)
-            peak1, peak2 = peaks[:2]
-            hi, low = peaks_high_low(histogram, peak1, peak2)
-        elif operation.mode == 'valley':
-            peaks = find_peaks(histogram_smooth)
-            valleys = find_valleys(histogram_smooth, peaks)
-            valley_point = valleys[0] if valleys else (peaks[0] + peaks[1]) // 2
-            hi, low = valley_high_low(histogram, valley_point)
-        elif operation.mode == 'adaptive':
-            peaks = find_peaks(histogram_smooth)
-            peak1, peak2 = peaks[:2]
-            hi, low = peaks_high_low(histogram, peak1, peak2)
-            thresholded_image = threshold_image_array(image_array, hi, low, operation.value)
-            object_mean, background_mean = compute_means(image_array, thresholded_image, operation.value)
-            hi, low = peaks_high_low(histogram, object_mean, background_mean)
-        else:
-            return {"error": "Invalid mode specified."}
-        
+def histogram_segmentation_array(image_array: np.ndarray, operation: HistogramSegmentationOperation) -> Any:
+    hi = None
+    low = None
+
+    histogram = compute_histogram(image_array)[0]
+
+    histogram_smooth = smooth_histogram(histogram, kernel_size=5)
+
+    if operation.mode == 'manual':
+        hi = operation.hi
+        low = operation.low
+    elif operation.mode == 'peak':
+        peaks = find_peaks(histogram_smooth)
+        peak1, peak2 = peaks[:2]
+        hi, low = peaks_high_low(histogram, peak1, peak2)
+    elif operation.mode == 'valley':
+        peaks = find_peaks(histogram_smooth)
+        valleys = find_valleys(histogram_smooth, peaks)
+        valley_point = valleys[0] if valleys else (peaks[0] + peaks[1]) // 2
+        hi, low = valley_high_low(histogram, valley_point)
+    elif operation.mode == 'adaptive':
+        peaks = find_peaks(histogram_smooth)
+        peak1, peak2 = peaks[:2]
+        hi, low = peaks_high_low(histogram, peak1, peak2)
         thresholded_image = threshold_image_array(image_array, hi, low, operation.value)
+        object_mean, background_mean = compute_means(image_array, thresholded_image, operation.value)
+        hi, low = peaks_high_low(histogram, object_mean, background_mean)
+    else:
+        raise ValueError("Invalid mode specified.")
 
-        if operation.segment:
-            labeled_image = label_regions(thresholded_image, operation.value)
-            max_label = labeled_image.max()
-            if max_label > 0:
-                labeled_image = (labeled_image * (255 / max_label))
-        else:
-            labeled_image = thresholded_image
-        
-        result_image = Image.fromarray(np.uint8(labeled_image))
-        buf = io.BytesIO()
-        result_image.save(buf, format='PNG')
-        buf.seek(0)
+    thresholded_image = threshold_image_array(image_array, hi, low, operation.value)
 
-        return buf
-    except Exception as e:
-        return {"error": str(e)}
+    regions = None
+    if operation.segment:
+        labeled_image, regions = label_regions(thresholded_image, operation.value, operation.connectivity)
+        max_label = len(regions)
+        if max_label > 0:
+            labeled_image = (labeled_image * (255 / max_label))
+    else:
+        labeled_image = thresholded_image
+
+    if regions is not None:
+        return np.uint8(labeled_image), {"regions": regions}
+    return np.uint8(labeled_image)
+
+def apply_histogram_segmentation(image_bytes: bytes, operation: HistogramSegmentationOperation) -> Any:
+    return apply_array_operation('histogram_segmentation', image_bytes, operation)
 
 def find_peaks(histogram, num_peaks=5):
     peaks = []
@@ -1227,33 +940,304 @@ def compute_means(image_array, thresholded_image, value):
         background_mean = np.mean(background_pixels)
     return int(object_mean), int(background_mean)
 
-def label_regions(thresholded_image, value):
-    labeled_image = np.zeros_like(thresholded_image, dtype=int)
-    label = 1
-    rows, cols = thresholded_image.shape
-
-    mask = (thresholded_image == value)
-
-    neighbor_offsets = [(-1, -1), (-1, 0), (-1, 1),
-                        ( 0, -1),         ( 0, 1),
-                        ( 1, -1), ( 1, 0), ( 1, 1)]
-
-    for i in range(rows):
-        for j in range(cols):
-            if mask[i, j]:
-
-                stack = [(i, j)]
-                mask[i, j] = False
-                labeled_image[i, j] = label
-                while stack:
-                    x, y = stack.pop()
-
-                    for dx, dy in neighbor_offsets:
-                        nx, ny = x + dx, y + dy
-                        if 0 <= nx < rows and 0 <= ny < cols:
-                            if mask[nx, ny]:
-                                mask[nx, ny] = False
-                                labeled_image[nx, ny] = label
-                                stack.append((nx, ny))
-                label += 1
-    return labeled_image
\ No newline at end of file
+def label_regions(thresholded_image, value, connectivity=8):
+    labeled_image, regions = label_components(thresholded_image == value, connectivity)
+    return labeled_image, regions
+
+class ArrayOperation:
+    """
+    An ndarray -> ndarray operation with its declared input mode and output dtype.
+    input_mode is a PIL mode the input is converted to before the call, a callable
+    choosing the mode from the operation parameters, or None to take the array as-is.
+    tiling returns the TilePlan of the operation parameters, or None when they need the
+    whole image at once; images of tiling_config.min_pixels and more then run tile by tile,
+    smaller ones in row bands when the operation asks for several workers.
+    """
+    def __init__(self, func, input_mode=None, output_dtype=np.uint8, tiling=None):
+        self.func = func
+        self.input_mode = input_mode
+        self.output_dtype = np.dtype(output_dtype)
+        self.tiling = tiling
+
+    def mode_for(self, operation) -> Optional[str]:
+        return self.input_mode(operation) if callable(self.input_mode) else self.input_mode
+
+    def tile_plan(self, operation, mode: Optional[str]) -> Optional[TilePlan]:
+        plan = self.tiling(operation) if self.tiling is not None else None
+        if plan is None or mode is None:
+            return plan
+
+        # mode conversion is per pixel, so tiles are converted one at a time too
+        func, statistic = plan.func, plan.statistic
+        return plan._replace(
+            func=lambda tile, value: func(convert_array(tile, mode), value),
+            statistic=statistic and (lambda tile, core: statistic(convert_array(tile, mode), core))
+        )
+
+    def __call__(self, image_array: np.ndarray, operation, remote=None, progress: Optional[Progress] = None) -> Any:
+        mode = self.mode_for(operation)
+        height, width = image_array.shape[:2]
+        workers = getattr(operation, 'workers', None) or 1
+        tiled = height * width >= tiling_config.min_pixels
+        plan = self.tile_plan(operation, mode) if tiled or workers > 1 else None
+        # tiles that hold the GIL go to the compute executor's processes
+        submit = compute_executor.band_submitter() if remote is not None and plan is not None and not plan.releases_gil else None
+
+        if plan is not None and tiled:
+            tile_shape = (tiling_config.tile_size, tiling_config.tile_size)
+            result = run_tiled(image_array, plan, tile_shape, max(workers, tiling_config.workers), remote, submit, progress)
+        elif plan is not None:
+            result = run_tiled(image_array, plan, band_shape(height, width, workers), workers, remote, submit, progress)
+        else:
+            if progress is not None: # the whole image is one unit of work
+                progress.start(1)
+            if mode is not None:
+                image_array = convert_array(image_array, mode)
+            result = self.func(image_array, operation)
+            if progress is not None:
+                progress.advance()
+
+        output_array = result[0] if isinstance(result, tuple) else result
+        if output_array.dtype != self.output_dtype:
+            raise TypeError(f"{self.func.__name__} returned {output_array.dtype}, expected {self.output_dtype}.")
+        return result
+
+def _grayscale_or_rgb(operation) -> str:
+    return 'L' if operation.mode == 'grayscale' else 'RGB'
+
+def _contrast_halo(operation) -> int:
+    return operation.smoothing_kernel_size // 2 if operation.contrast_based else 0
+
+def _pointwise(array_func):
+    return lambda operation: TilePlan(halo=0, func=lambda tile, _: array_func(tile, operation))
+
+def _halftoning_tiling(operation) -> Optional[TilePlan]:
+    if operation.method == 'error_diffusion': # the error travels through the whole image
+        return None
+    return _pointwise(halftoning_array)(operation)
+
+def _histogram_equalization_tiling(operation) -> TilePlan:
+    def channel_histogram(tile, core):
+        channel = tile[core] if operation.mode == 'grayscale' else tile[core][:, :, 0] # Y of YCbCr
+        return compute_histogram(channel)[0]
+
+    return TilePlan(
+        halo=0,
+        func=lambda tile, histogram: histogram_equalization_array(tile, operation, histogram),
+        statistic=channel_histogram
+    )
+
+def _histogram_smoothing_tiling(operation) -> TilePlan:
+    return TilePlan(
+        halo=0,
+        func=lambda tile, histograms: histogram_smoothing_array(tile, operation, histograms),
+        statistic=lambda tile, core: compute_histogram(tile[core])
+    )
+
+def _basic_edge_detection_tiling(operation) -> TilePlan:
+    # every basic operator is 3x3 (roberts 2x2), normalization needs the global maximum response
+    return TilePlan(
+        halo=1 + _contrast_halo(operation),
+        func=lambda tile, response_max: basic_edge_detection_array(tile, operation, response_max),
+        statistic=lambda tile, core: basic_edge_response(tile, operation.operator)[core].max(),
+        combine=max
+    )
+
+def _advanced_edge_detection_tiling(operation) -> TilePlan:
+    operator = operation.operator
+    radius = {
+        'homogeneity': (operation.kernel_size or 3) // 2,
+        'difference': 1,
+        'gaussian_1': 3,
+        'gaussian_2': 4,
+        'variance': (operation.kernel_size or 0) // 2,
+        'range': (operation.kernel_size or 0) // 2,
+    }[operator]
+    halo = radius + _contrast_halo(operation)
+
+    if operator in ('gaussian_1', 'gaussian_2'):
+        return TilePlan(
+            halo=halo,
+            func=lambda tile, response_max: advanced_edge_detection_array(tile, operation, response_max),
+            statistic=lambda tile, core: gaussian_edge_response(tile, operator)[core].max(),
+            combine=max
+        )
+    return TilePlan(halo=halo, func=lambda tile, _: advanced_edge_detection_array(tile, operation))
+
+def _filtering_tiling(operation) -> TilePlan:
+    # the running-histogram median behind large 8-bit kernels loops over rows in Python
+    python_bound = operation.mode == 'median' and operation.kernel_size > CV2_MEDIAN_MAX_KERNEL
+    return TilePlan(halo=operation.kernel_size // 2, func=lambda tile, _: filtering_array(tile, operation), releases_gil=not python_bound)
+
+def _single_image_operation_tiling(operation) -> Optional[TilePlan]:
+    if operation.operation != 'invert': # geometric operations move pixels across tiles
+        return None
+    return _pointwise(single_image_operation_array)(operation)
+
+ARRAY_OPERATIONS = {
+    'grayscale': ArrayOperation(grayscale_array, input_mode='RGB', tiling=_pointwise(grayscale_array)),
+    'halftoning': ArrayOperation(halftoning_array, input_mode=_grayscale_or_rgb, tiling=_halftoning_tiling),
+    'histogram_equalization': ArrayOperation(histogram_equalization_array, input_mode=lambda operation: 'L' if operation.mode == 'grayscale' else 'YCbCr', tiling=_histogram_equalization_tiling),
+    'histogram_smoothing': ArrayOperation(histogram_smoothing_array, input_mode=_grayscale_or_rgb, tiling=_histogram_smoothing_tiling),
+    'basic_edge_detection': ArrayOperation(basic_edge_detection_array, input_mode='L', tiling=_basic_edge_detection_tiling),
+    'advanced_edge_detection': ArrayOperation(advanced_edge_detection_array, input_mode='L', tiling=_advanced_edge_detection_tiling),
+    'filtering': ArrayOperation(filtering_array, tiling=_filtering_tiling), # filters every channel of the image as stored
+    'single_operation': ArrayOperation(single_image_operation_array, input_mode='RGB', tiling=_single_image_operation_tiling), # for simplicity all images converted to RGB
+    'histogram_segmentation': ArrayOperation(histogram_segmentation_array, input_mode='L'), # region labels span the whole image
+}
+
+MULTI_IMAGE_INPUT_MODE = 'RGB'
+
+def run_array_operation(operation_type: str, image_array: np.ndarray, operation, progress: Optional[Progress] = None) -> Any:
+    array_operation = ARRAY_OPERATIONS.get(operation_type)
+    if array_operation is None:
+        raise ValueError(f"Unsupported operation type '{operation_type}'.")
+
+    remote = None
+    if getattr(operation, 'workers', None): # bands sent to other processes run with one worker each
+        remote = partial(run_array_operation, operation_type, operation=operation.model_copy(update={'workers': None}))
+    return array_operation(image_array, operation, remote, progress)
+
+def run_multi_image_operation(image_arrays: List[np.ndarray], operation: MultiImageOperation) -> np.ndarray:
+    return multi_image_operation_array([convert_array(image_array, MULTI_IMAGE_INPUT_MODE) for image_array in image_arrays], operation)
+
+def transform_array(operation_type: str, image_array: np.ndarray, operation, codec=PNG_CODEC, progress: Optional[Progress] = None) -> Any:
+    """
+    Runs an operation on a decoded array and encodes the result with the given storage codec.
+    Extra metadata reported by the operation (e.g. labeled regions) joins the result metadata.
+    progress counts its tiles or bands, or the whole image as one.
+    """
+    try:
+        result = run_array_operation(operation_type, as_array(image_array), operation, progress)
+        if isinstance(result, tuple): # e.g. labeled regions from segmentation
+            result_array, extra_metadata = result
+            return encode_result(result_array, codec, extra_metadata)
+        return encode_result(result, codec)
+    except ExecutorBusy:
+        raise # its bands did not fit in the executor's queue, answered with 503
+    except Exception as e:
+        return {"error": str(e)}
+
+def apply_array_operation(operation_type: str, image_bytes: bytes, operation) -> Any:
+    """
+    Bytes in/bytes out adapter over the array core: decode, run, encode as PNG.
+    """
+    try:
+        image_array = decode_image(image_bytes)
+    except Exception as e:
+        return {"error": str(e)}
+    try:
+        result = run_array_operation(operation_type, image_array, operation)
+        if isinstance(result, tuple): # e.g. labeled regions from segmentation
+            result_array, extra_metadata = result
+            return PNG_CODEC.encode(result_array), extra_metadata
+        return PNG_CODEC.encode(result)
+    except Exception as e:
+        return {"error": str(e)}
+
+def transform_arrays(image_arrays: List[np.ndarray], operation: MultiImageOperation, codec=PNG_CODEC, progress: Optional[Progress] = None) -> Any:
+    try:
+        if progress is not None:
+            progress.start(1)
+        result = encode_result(run_multi_image_operation([as_array(image_array) for image_array in image_arrays], operation), codec)
+        if progress is not None:
+            progress.advance()
+        return result
+    except Exception as e:
+        return {"error": str(e)}
+
+def point_table(operation_type: str, operation, histograms) -> Optional[PointTable]:
+    """
+    The lookup table of an operation that maps every pixel by its own value (on the input mode of
+    ARRAY_OPERATIONS), or None. histograms() returns those of the input, for the histogram-based ones.
+    """
+    if operation_type == 'grayscale' and operation.mode == 'luminosity':
+        return LUMINOSITY
+    if operation_type == 'halftoning' and operation.method == 'thresholding':
+        return threshold_table(operation.threshold)
+    if operation_type == 'single_operation' and operation.operation == 'invert':
+        return INVERT
+    if operation_type == 'histogram_equalization' and operation.mode == 'grayscale': # RGB goes through YCbCr
+        return LookupTable(equalization_lut(histograms()[0]))
+    if operation_type == 'histogram_smoothing':
+        return histogram_smoothing_table(histograms(), operation.kernel_size)
+    return None
+
+class PointChain:
+    """
+    Consecutive pipeline steps that are lookup tables, fused into one table and applied in a
+    single pass when the chain is flushed. Histogram-based steps read the histograms of the
+    chain's input mapped through the table so far instead of those of an intermediate image.
+    """
+    def __init__(self, image_array: np.ndarray):
+        self.image_array = image_array
+        self.mode = array_mode(image_array)
+        self.table: Optional[PointTable] = None
+        self._histograms: Optional[Histogram] = None # of image_array
+
+    def add(self, operation_type: str, operation) -> bool:
+        """
+        Folds the step into the table, or returns False when it is not a lookup table on the current mode.
+        """
+        mode = ARRAY_OPERATIONS[operation_type].mode_for(operation)
+        if mode != self.mode and self.table is not None:
+            return False # mode conversions mix channels, the table so far has to be applied first
+
+        table = point_table(operation_type, operation, lambda: self.histograms(mode))
+        if table is None:
+            return False
+        self._convert(mode)
+        self.table = table if self.table is None else self.table.then(table)
+        if isinstance(self.table, WeightedLookupTable):
+            self.mode = 'L'
+        return True
+
+    def histograms(self, mode: str) -> Histogram:
+        if isinstance(self.table, WeightedLookupTable): # joint channel values are gone, count the result
+            self.flush()
+        self._convert(mode)
+        if self._histograms is None:
+            self._histograms = compute_histogram(self.image_array)
+        return self._histograms if self.table is None else self.table.map_histograms(self._histograms)
+
+    def flush(self) -> np.ndarray:
+        if self.table is not None:
+            self.image_array = self.table.apply(self.image_array)
+            self.table = None
+            self._histograms = None
+        return self.image_array
+
+    def _convert(self, mode: Optional[str]):
+        if mode is not None and mode != self.mode and self.table is None:
+            self.image_array = convert_array(self.image_array, mode)
+            self.mode = mode
+            self._histograms = None
+
+def run_pipeline(image_array: np.ndarray, steps: List[PipelineStep], codec=PNG_CODEC, progress: Optional[Progress] = None) -> Any:
+    """
+    Runs the steps back to back on the decoded array and encodes only the final result
+    and the steps marked with 'keep'. Returns a list of (step index, EncodedImage).
+    Consecutive lookup-table steps (see point_table) run as one fused table.
+    progress counts the finished steps.
+    """
+    if progress is not None:
+        progress.start(len(steps))
+    chain = PointChain(as_array(image_array))
+    outputs = []
+    for index, step in enumerate(steps):
+        extra_metadata = {}
+        try:
+            if not chain.add(step.operation_type, step.operation):
+                result = run_array_operation(step.operation_type, chain.flush(), step.operation)
+                if isinstance(result, tuple):
+                    result, extra_metadata = result
+                chain = PointChain(result)
+
+            if step.keep or index == len(steps) - 1:
+                outputs.append((index, encode_result(chain.flush(), codec, {**extra_metadata, 'pipeline_step': index})))
+            if progress is not None:
+                progress.advance()
+        except Exception as e:
+            return {"error": f"Step {index + 1} ({step.operation_type}) failed: {e}"}
+
+    return outputs
@@ -0,0 +1,159 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Optional
+from uuid import uuid4
+
+from fastapi import HTTPException
+
+JOB_STATES = ('queued', 'running', 'succeeded', 'failed', 'cancelled')
+FINISHED_STATES = ('succeeded', 'failed', 'cancelled')
+
+class JobQueueFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Too many queued jobs, retry later.")
+        self.retry_after = retry_after
+
+class Job:
+    """
+    A request running in the background. run is called once a slot frees up and its result
+    (or the HTTPException it raises) is kept until the job is evicted from the history.
+    progress is the executor Progress run reports to, if any, closed when the job finishes.
+    """
+    def __init__(self, operation_type: str, run: Callable[[], Awaitable[Any]], progress=None):
+        self.job_id = str(uuid4())
+        self.operation_type = operation_type
+        self.run = run
+        self.progress = progress
+        self.status = 'queued'
+        self.result = None
+        self.error: Optional[str] = None
+        self.status_code: Optional[int] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def fraction_done(self) -> float:
+        if self.status == 'succeeded':
+            return 1.0
+        if self.progress is None:
+            return 0.0
+        done, total = self.progress.read()
+        return done / total if total else 0.0
+
+    def finish(self, status: str, status_code: Optional[int], result=None, error: Optional[str] = None):
+        self.status = status
+        self.status_code = status_code
+        self.result = result
+        self.error = error
+        self.finished_at = time.time()
+        self.run = None # drop the request parameters
+        if self.progress is not None:
+            self.progress.close()
+
+    async def execute(self):
+        self.status = 'running'
+        self.started_at = time.time()
+        try:
+            result = await self.run()
+        except asyncio.CancelledError:
+            self.finish('cancelled', None, error="Job cancelled")
+        except HTTPException as e:
+            self.finish('failed', e.status_code, error=str(e.detail))
+        except Exception as e:
+            self.finish('failed', 500, error=str(e))
+        else:
+            self.finish('succeeded', 201, result=result)
+
+class JobQueue:
+    """
+    Runs jobs on the event loop, at most max_running at a time; the compute work they await
+    still goes through the compute executor. Up to max_queued jobs wait for a slot, more raise
+    JobQueueFull. The last max_history jobs are kept for status requests.
+    """
+    def __init__(self, max_running: int, max_queued: int, max_history: int, retry_after: int):
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.max_history = max_history
+        self.retry_after = retry_after
+        self.jobs: OrderedDict = OrderedDict()
+        self.queued: deque = deque()
+        self.running = 0
+
+    @classmethod
+    def from_environment(cls) -> 'JobQueue':
+        cpu_count = os.cpu_count() or 1
+        return cls(
+            max_running=int(os.environ.get("IMG_PROC_JOB_WORKERS", cpu_count)),
+            max_queued=int(os.environ.get("IMG_PROC_JOB_QUEUE_SIZE", 64)),
+            max_history=int(os.environ.get("IMG_PROC_JOB_HISTORY", 1024)),
+            retry_after=int(os.environ.get("IMG_PROC_RETRY_AFTER", 1)),
+        )
+
+    def submit(self, operation_type: str, run: Callable[[], Awaitable[Any]], progress=None) -> Job:
+        if len(self.queued) >= self.max_queued:
+            raise JobQueueFull(self.retry_after)
+
+        job = Job(operation_type, run, progress)
+        self.jobs[job.job_id] = job
+        self.queued.append(job)
+        self._evict()
+        self._start_next()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancels a queued or running job. A running operation already handed to a process
+        is not interrupted, its result is discarded.
+        """
+        job = self.jobs.get(job_id)
+        if job is None or job.finished:
+            return job
+        if job.task is None:
+            self.queued.remove(job)
+            job.finish('cancelled', None, error="Job cancelled")
+        else:
+            job.task.cancel()
+        return job
+
+    def _start_next(self):
+        while self.queued and self.running < max(self.max_running, 1):
+            job = self.queued.popleft()
+            self.running += 1
+            job.task = asyncio.create_task(job.execute())
+            job.task.add_done_callback(lambda task, job=job: self._on_done(job))
+
+    def _on_done(self, job: Job):
+        self.running -= 1
+        if not job.finished: # cancelled before it got to run
+            job.finish('cancelled', None, error="Job cancelled")
+        self._start_next()
+
+    def _evict(self):
+        # only finished jobs leave the history, pending ones are always reachable
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished][:max(len(self.jobs) - self.max_history, 0)]:
+            del self.jobs[job_id]
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": len(self.queued),
+            "max_running": self.max_running,
+            "max_queued": self.max_queued,
+        }
+
+    def shutdown(self):
+        for job in list(self.jobs.values()):
+            if not job.finished:
+                self.cancel(job.job_id)
+
+job_queue = JobQueue.from_environment()
@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from cache import LRUCache
+from convolution import box_terms, gaussian_terms, log_terms, separable_is_cheaper
+
+KERNEL_TERMS = {
+    'gaussian': gaussian_terms,
+    'log': log_terms,
+    'box': lambda size, sigma: box_terms(size),
+}
+
+class BankedKernel(NamedTuple):
+    terms: List[Tuple[np.ndarray, np.ndarray]] # separable (column, row) factors
+    kernel: Optional[np.ndarray] # 2D kernel, only kept when convolve correlates it directly
+    generation_seconds: float
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes + row.nbytes for column, row in self.terms) + (self.kernel.nbytes if self.kernel is not None else 0)
+
+    def full(self) -> np.ndarray:
+        if self.kernel is not None:
+            return self.kernel
+        return sum(np.outer(column, row) for column, row in self.terms)
+
+class KernelBank(LRUCache):
+    """
+    Memoizes generated kernels by (type, size, sigma), bounded by max_size bytes, so repeated
+    requests and the tiles of one request share them. Kernels are read-only since callers share them.
+    Each process (API and compute workers) keeps its own bank.
+    """
+    def __init__(self, max_size: int):
+        super().__init__(max_size)
+        self.generation_seconds = 0.0
+        self.seconds_saved = 0.0
+        self._lock = threading.Lock() # kernels are requested from the compute threads
+
+    @classmethod
+    def from_environment(cls) -> 'KernelBank':
+        return cls(max_size=int(os.environ.get("IMG_PROC_KERNEL_CACHE_BYTES", 64 * 1024 * 1024)))
+
+    def size_of(self, value: BankedKernel) -> int:
+        return value.nbytes
+
+    def get_kernel(self, kind: str, size: int, sigma: Optional[float] = None) -> BankedKernel:
+        if kind not in KERNEL_TERMS:
+            raise ValueError(f"Unsupported kernel type '{kind}'. Choose one of {tuple(KERNEL_TERMS)}.")
+        if kind == 'box':
+            sigma = None
+        elif sigma is None:
+            sigma = size / 6.0 # the default of the generators, so both spellings share an entry
+        key = (kind, size, float(sigma) if sigma is not None else None)
+
+        with self._lock:
+            banked = self.get(key)
+            if banked is not None:
+                self.seconds_saved += banked.generation_seconds
+                return banked
+
+            banked = generate_kernel(kind, size, sigma)
+            self.generation_seconds += banked.generation_seconds
+            self.put(key, banked)
+            return banked
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "resident_bytes": self.size,
+            "max_bytes": self.max_size,
+            "generation_seconds": self.generation_seconds,
+            "seconds_saved": self.seconds_saved,
+        }
+
+def generate_kernel(kind: str, size: int, sigma: Optional[float] = None) -> BankedKernel:
+    start = time.perf_counter()
+    terms = KERNEL_TERMS[kind](size, sigma)
+    kernel = None
+    if not separable_is_cheaper(size, len(terms)):
+        kernel = sum(np.outer(column, row) for column, row in terms)
+        kernel.flags.writeable = False
+    for column, row in terms:
+        column.flags.writeable = row.flags.writeable = False
+    return BankedKernel(terms, kernel, time.perf_counter() - start)
+
+kernel_bank = KernelBank.from_environment()
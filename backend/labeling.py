@@ -0,0 +1,108 @@
+import numpy as np
+from typing import List, Tuple
+
+def _find_runs(mask: np.ndarray):
+    height, width = mask.shape
+    padded = np.zeros((height, width + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+
+    # nonzero returns runs in raster order, which fixes the label order below
+    run_rows, run_starts = np.nonzero(edges == 1)
+    _, run_ends = np.nonzero(edges == -1)
+    return run_rows, run_starts, run_ends
+
+def _find(parent: List[int], i: int) -> int:
+    root = i
+    while parent[root] != root:
+        root = parent[root]
+    while parent[i] != root: # path compression
+        parent[i], i = root, parent[i]
+    return root
+
+def label_components(mask: np.ndarray, connectivity: int = 8) -> Tuple[np.ndarray, List[dict]]:
+    """
+    Labels connected regions of a boolean mask with a two-pass union-find over horizontal runs.
+    Labels are numbered from 1 in the raster order of each region's first pixel.
+    Returns the label image and per-region stats (area, bbox as (x1, y1, x2, y2) with exclusive ends, centroid as (x, y)).
+    """
+    if connectivity not in (4, 8):
+        raise ValueError("Connectivity must be 4 or 8.")
+
+    height, width = mask.shape
+    run_rows, run_starts, run_ends = _find_runs(mask)
+    num_runs = len(run_rows)
+
+    labeled_image = np.zeros((height, width), dtype=np.int32)
+    if num_runs == 0:
+        return labeled_image, []
+
+    # diagonal neighbours widen every run by one pixel when looking at the previous row
+    slack = 1 if connectivity == 8 else 0
+    row_bounds = np.searchsorted(run_rows, np.arange(height + 1))
+    parent = list(range(num_runs))
+
+    # first pass: merge each run with the overlapping runs of the row above
+    for y in range(1, height):
+        current_lo, current_hi = row_bounds[y], row_bounds[y + 1]
+        previous_lo, previous_hi = row_bounds[y - 1], row_bounds[y]
+        if current_lo == current_hi or previous_lo == previous_hi:
+            continue
+
+        previous_starts = run_starts[previous_lo:previous_hi]
+        previous_ends = run_ends[previous_lo:previous_hi]
+        current_starts = run_starts[current_lo:current_hi]
+        current_ends = run_ends[current_lo:current_hi]
+
+        first = np.searchsorted(previous_ends, current_starts - slack, side='right') + previous_lo
+        last = np.searchsorted(previous_starts, current_ends + slack, side='left') + previous_lo
+
+        for run, lo, hi in zip(range(current_lo, current_hi), first.tolist(), last.tolist()):
+            for other in range(lo, hi):
+                root_run, root_other = _find(parent, run), _find(parent, other)
+                if root_run != root_other:
+                    parent[max(root_run, root_other)] = min(root_run, root_other)
+
+    # second pass: resolve roots and number regions by their first run
+    roots = np.fromiter((_find(parent, i) for i in range(num_runs)), dtype=np.intp, count=num_runs)
+    unique_roots, first_runs = np.unique(roots, return_index=True)
+    order = np.argsort(first_runs)
+    root_labels = np.empty(len(unique_roots), dtype=np.int32)
+    root_labels[order] = np.arange(1, len(unique_roots) + 1, dtype=np.int32)
+    run_labels = root_labels[np.searchsorted(unique_roots, roots)]
+
+    # paint runs through a difference array: +label at the run start, -label past its end
+    flat_labels = np.zeros(height * width + 1, dtype=np.int64)
+    run_offsets = run_rows.astype(np.int64) * width
+    np.add.at(flat_labels, run_offsets + run_starts, run_labels)
+    np.add.at(flat_labels, run_offsets + run_ends, -run_labels)
+    labeled_image = np.cumsum(flat_labels[:-1]).astype(np.int32).reshape(height, width)
+
+    # region stats are reduced from the same runs, no extra scan over the image
+    num_labels = len(unique_roots)
+    index = run_labels - 1
+    run_lengths = (run_ends - run_starts).astype(np.float64)
+    areas = np.bincount(index, weights=run_lengths, minlength=num_labels)
+    sum_x = np.bincount(index, weights=(run_starts + run_ends - 1) * run_lengths / 2, minlength=num_labels)
+    sum_y = np.bincount(index, weights=run_rows * run_lengths, minlength=num_labels)
+
+    x1 = np.full(num_labels, width, dtype=np.int64)
+    y1 = np.full(num_labels, height, dtype=np.int64)
+    x2 = np.zeros(num_labels, dtype=np.int64)
+    y2 = np.zeros(num_labels, dtype=np.int64)
+    np.minimum.at(x1, index, run_starts)
+    np.minimum.at(y1, index, run_rows)
+    np.maximum.at(x2, index, run_ends)
+    np.maximum.at(y2, index, run_rows + 1)
+
+    regions = [
+        {
+            "label": label + 1,
+            "area": int(areas[label]),
+            "bbox": (int(x1[label]), int(y1[label]), int(x2[label]), int(y2[label])),
+            "centroid": (float(sum_x[label] / areas[label]), float(sum_y[label] / areas[label])),
+        }
+        for label in range(num_labels)
+    ]
+
+    return labeled_image, regions
@@ -0,0 +1,57 @@
+import numpy as np
+import cv2
+
+def local_variance(image_array: np.ndarray, kernel_size: int) -> np.ndarray:
+    """
+    Population variance of every kernel_size x kernel_size window (reflect padded),
+    read from summed-area tables of x and x**2 so the cost does not depend on the kernel size.
+    """
+    pad_width = kernel_size // 2
+    padded = np.pad(image_array, pad_width=pad_width, mode='reflect')
+    height, width = image_array.shape
+    n = kernel_size * kernel_size
+
+    # float64 tables are exact here: even sums of squares of 8-bit images stay far below 2**53
+    sums, square_sums = cv2.integral2(padded, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+
+    def window_sums(table):
+        return (table[kernel_size:kernel_size + height, kernel_size:kernel_size + width]
+                - table[:height, kernel_size:kernel_size + width]
+                - table[kernel_size:kernel_size + height, :width]
+                + table[:height, :width]).astype(np.int64)
+
+    window_sum = window_sums(sums)
+    window_square_sum = window_sums(square_sums)
+
+    # var = (n * sum(x**2) - sum(x)**2) / n**2, with an exact integer numerator
+    return (n * window_square_sum - window_sum * window_sum) / float(n * n)
+
+def _sliding_extreme(array: np.ndarray, window: int, func) -> np.ndarray:
+    # van Herk/Gil-Werman along the last axis: prefix and suffix extremes inside blocks of
+    # `window` elements, so every output is func(suffix[x], prefix[x + window - 1])
+    length = array.shape[-1]
+    output_length = length - window + 1
+    blocks = -(-length // window)
+
+    # padded tail values never reach a valid output, edge values just keep the dtype intact
+    padding = [(0, 0)] * (array.ndim - 1) + [(0, blocks * window - length)]
+    shaped = np.pad(array, padding, mode='edge').reshape(*array.shape[:-1], blocks, window)
+
+    prefix = func.accumulate(shaped, axis=-1).reshape(*array.shape[:-1], blocks * window)
+    suffix = func.accumulate(shaped[..., ::-1], axis=-1)[..., ::-1].reshape(*array.shape[:-1], blocks * window)
+
+    return func(suffix[..., :output_length], prefix[..., window - 1:window - 1 + output_length])
+
+def _window_extreme(padded: np.ndarray, kernel_size: int, func) -> np.ndarray:
+    rows = _sliding_extreme(padded, kernel_size, func)
+    return _sliding_extreme(rows.T, kernel_size, func).T
+
+def local_range(image_array: np.ndarray, kernel_size: int) -> np.ndarray:
+    """
+    Max minus min of every kernel_size x kernel_size window (reflect padded),
+    using separable running max/min passes with a constant number of comparisons per pixel.
+    """
+    pad_width = kernel_size // 2
+    padded = np.pad(image_array, pad_width=pad_width, mode='reflect')
+
+    return _window_extreme(padded, kernel_size, np.maximum) - _window_extreme(padded, kernel_size, np.minimum)
@@ -1,9 +1,14 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Body
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Body, Request, Query
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse, FileResponse, Response, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+from typing import Optional
 from uuid import uuid4
+from functools import partial
+from pydantic import ValidationError
+import asyncio
 import os
-import shutil
 import image_utils  # Assume this module contains implementations for all operations
 from operations import (
     GrayscaleOperation,
@@ -16,11 +21,66 @@ from operations import (
     MultiImageOperation,
     SingleImageOperation,
     CreateImageOperation,
-    HistogramSegmentationOperation
+    HistogramSegmentationOperation,
+    PipelineOperation,
+    BatchOperation,
+    PIPELINE_OPERATIONS
 )
-from responses import ImageResponse
+from responses import ImageResponse, PipelineResponse, BatchItemResponse, JobResponse
+from histogram import histogram_to_bytes, histogram_from_bytes
+from executor import compute_executor, ExecutorBusy
+from jobs import job_queue, JobQueueFull
+from file_store import file_store
+from cache import result_cache, decoded_image_cache, DecodedImage, operation_key, content_digest, file_digest
+from kernel_bank import kernel_bank
+from storage import STORAGE_CODECS, UploadLimits, ImageTooLarge, storage_codec_from_environment, png_codec_from_environment, delivery_codecs, codec_for_path, MappedArray
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    job_queue.shutdown()
+    compute_executor.shutdown()
+    file_store.shutdown()
+
+class UploadSizeLimit:
+    """
+    ASGI middleware rejecting request bodies over max_bytes on the given paths with 413, before
+    FastAPI spools them: from Content-Length without reading the body, or for bodies without one
+    as soon as the bytes received so far pass the limit.
+    """
+    def __init__(self, app, paths: set, max_bytes: int):
+        self.app = app
+        self.paths = paths
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        detail = f"Upload exceeds the limit of {self.max_bytes} bytes."
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None:
+            try:
+                content_length = int(content_length)
+            except ValueError:
+                return await JSONResponse({"detail": "Invalid Content-Length header."}, status_code=400)(scope, receive, send)
+            if content_length > self.max_bytes:
+                return await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+
+        received = 0
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes: # FastAPI passes HTTPExceptions from body parsing through
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, counting_receive, send)
 
 app = FastAPI(
+    lifespan=lifespan,
     title="Image Processing API",
     description="An API for uploading images, applying transformations, and retrieving results. Developed as a project for Image Processing IT441 course at Helwan University. Developed by AHS",
     version="1.0.0"
@@ -41,39 +101,40 @@ HISTOGRAM_DIR = os.path.join(BASE_DIR, "histograms")
 for directory in [IMAGE_DIR, HISTOGRAM_DIR]:
     os.makedirs(directory, exist_ok=True)
 
+storage_codec = storage_codec_from_environment() # format new images are written in
+DELIVERY_CODECS = delivery_codecs(png_codec_from_environment()) # formats GET /images/{id} converts to
+ASYNC_RESPONSES = {202: {"model": JobResponse, "description": "Job accepted, with ?async=true"}}
+upload_limits = UploadLimits.from_environment()
+app.add_middleware(UploadSizeLimit, paths={"/images/"}, max_bytes=upload_limits.max_bytes)
+BATCH_CONCURRENCY = int(os.environ.get("IMG_PROC_BATCH_CONCURRENCY", os.cpu_count() or 1)) # images of one batch in flight at once
+
 @app.post("/images/", response_model=ImageResponse, status_code=201)
 async def upload_image(file: UploadFile = File(...)):
     """
-    Upload a new image.
+    Upload a new image. The image is decoded once; files or images over the configured
+    limits are rejected with 413, large images from their header before decoding.
 
     - **file**: Image file to upload.
     - **Returns**: Image ID, metadata, and histogram ID.
     """
     image_id = str(uuid4())
-    image_filename = f"{image_id}.png"
+    image_filename = f"{image_id}{storage_codec.extension}"
     image_path = os.path.join(IMAGE_DIR, image_filename)
-    histogram_path = os.path.join(HISTOGRAM_DIR, f"{image_id}.png")
 
-    image_bytes = await file.read()
-
-    png_image_bytes = image_utils.to_png_bytes(image_bytes)
-    if isinstance(png_image_bytes, dict) and "error" in png_image_bytes:
-        raise HTTPException(status_code=400, detail=png_image_bytes["error"])
-    
-    with open(image_path, "wb") as f:
-        f.write(png_image_bytes.getvalue())
-    
-    metadata = image_utils.get_metadata(image_bytes, file.filename)
-    if "error" in metadata:
-        raise HTTPException(status_code=400, detail=metadata["error"])
+    try:
+        # decoded from the file FastAPI spooled the upload to, within the byte limit of UploadSizeLimit
+        stored_image_bytes, metadata, histogram = await run_compute('ingest', image_utils.ingest_image, file.file, file.filename, storage_codec, upload_limits.max_pixels)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    await file_store.write(image_path, stored_image_bytes.getvalue())
     metadata['transformed'] = False # transformed flag
 
-    histogram = image_utils.get_histograms(png_image_bytes.getvalue())
-    if isinstance(histogram, dict) and "error" in histogram:
-        raise HTTPException(status_code=400, detail=histogram["error"])
-    
-    with open(histogram_path, "wb") as f:
-        f.write(histogram.getvalue())
+    await file_store.write(get_histogram_data_path(image_id), histogram_to_bytes(histogram))
 
     return ImageResponse(
         image_id = image_id,
@@ -82,7 +143,7 @@ async def upload_image(file: UploadFile = File(...)):
     )
 
 @app.post("/images/create", response_model=ImageResponse, status_code=201)
-def create_image(operation: CreateImageOperation):
+async def create_image(operation: CreateImageOperation):
     """
     Creates a new image with the specified size and color.
     
@@ -92,295 +153,497 @@ def create_image(operation: CreateImageOperation):
     
     - **Returns**: Image ID, metadata, and histogram ID.
     """
-    result = image_utils.create_image(operation)
+    result = await run_compute('create', image_utils.create_image, operation, storage_codec)
     if isinstance(result, dict) and "error" in result:
         raise HTTPException(status_code=400, detail=result["error"])
+
+    return await store_encoded_image(result, transformed=False)
     
-    image_id = str(uuid4())
-    image_filename = f"{image_id}.png"
-    image_path = os.path.join(IMAGE_DIR, image_filename)
-    histogram_path = os.path.join(HISTOGRAM_DIR, f"{image_id}.png")
+# registered before the per-image routes, which would otherwise take 'batch' for an image ID
+@app.post("/images/batch/{operation_type}", response_class=StreamingResponse)
+async def apply_batch(operation_type: str, batch: BatchOperation = Body(...)):
+    """
+    Apply one operation to many images. Results are streamed as NDJSON, one line per image
+    in the order they finish, so the first ones arrive before the slowest image is done.
 
-    with open(image_path, "wb") as f:
-        f.write(result.getvalue())
+    - **operation_type**: Any single-image operation, e.g. 'grayscale' or 'filtering'.
+    - **batch**: Source image IDs and the operation parameters shared by all of them.
+    - **Returns**: Lines with the source image ID, a status code and either the transformed image (as for a single request) or the error.
+    """
+    operation_model = PIPELINE_OPERATIONS.get(operation_type)
+    if operation_model is None:
+        raise HTTPException(status_code=400, detail="Unsupported operation type")
+    try:
+        operation = operation_model.model_validate(batch.operation)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
 
-    
-    image_bytes = result.getvalue()
-    metadata = image_utils.get_metadata(image_bytes, image_filename)
-    if "error" in metadata:
-        raise HTTPException(status_code=400, detail=metadata["error"])
-    metadata['transformed'] = False
-
-    histogram = image_utils.get_histograms(image_bytes)
-    if isinstance(histogram, dict) and "error" in histogram:
-        raise HTTPException(status_code=400, detail=histogram["error"])
-    
-    with open(histogram_path, "wb") as f:
-        f.write(histogram.getvalue())
+    return StreamingResponse(stream_batch(batch.image_ids, operation, operation_type), media_type="application/x-ndjson")
 
-    return ImageResponse(
-        image_id = image_id,
-        metadata = metadata,
-        histogram_id = image_id
-    )
-    
 @app.get("/images/{image_id}", response_class=StreamingResponse)
-def get_image(image_id: str):
+async def get_image(image_id: str, request: Request, format: Optional[str] = None):
     """
-    Retrieve an uploaded image.
+    Retrieve an uploaded image. Images are converted only when the requested format
+    differs from the one they are stored in.
 
     - **image_id**: ID of the image to retrieve.
-    - **Returns**: Image file as PNG.
+    - **format**: 'png', 'npy' or 'qoi'. Without it the Accept header decides, PNG by default.
+    - **Returns**: Image file in the requested format.
     """
-    image_path = get_image_path(image_id)
-    if not os.path.exists(image_path):
-        raise HTTPException(status_code=404, detail="Image not found")
-    return FileResponse(image_path, media_type="image/png")
+    image_path = await get_image_path(image_id)
+    codec = get_delivery_codec(format, request.headers.get("accept"))
+    stored_codec = codec_for_path(image_path)
+    if codec.name == stored_codec.name:
+        return FileResponse(image_path, media_type=codec.media_type)
+
+    content = await run_compute('decode', convert_stored_image, image_path, stored_codec, codec)
+    return Response(content=content, media_type=codec.media_type)
+
+def convert_stored_image(image_path: str, stored_codec, codec) -> bytes:
+    return codec.encode(stored_codec.load(image_path)).getvalue()
+
+def get_delivery_codec(format: Optional[str], accept: Optional[str]):
+    if format is not None:
+        if format not in DELIVERY_CODECS:
+            raise HTTPException(status_code=400, detail=f"Unsupported format '{format}'. Choose one of {tuple(DELIVERY_CODECS)}.")
+        return DELIVERY_CODECS[format]
+
+    accepted_types = [media_range.split(";")[0].strip() for media_range in (accept or "").split(",")]
+    for media_type in accepted_types:
+        for codec in DELIVERY_CODECS.values():
+            if codec.media_type == media_type:
+                return codec
+    return DELIVERY_CODECS['png']
 
 
 @app.get("/images/{image_id}/histogram", response_class=FileResponse)
-def get_histogram(image_id: str):
+async def get_histogram(image_id: str):
     """
-    Retrieve the histogram of an image.
+    Retrieve the histogram of an image. The plot is rendered on first request and cached.
 
     - **image_id**: ID of the image.
     - **Returns**: Histogram image as PNG.
     """
-    histogram_path = os.path.join(HISTOGRAM_DIR, f"{image_id}.png")
-    if not os.path.exists(histogram_path):
-        raise HTTPException(status_code=404, detail="Histogram not found")
+    histogram_path = get_histogram_image_path(image_id)
+    if not await file_store.exists(histogram_path):
+        histogram = await run_compute('histogram', image_utils.render_histogram, await load_histogram_counts(image_id))
+        if isinstance(histogram, dict) and "error" in histogram:
+            raise HTTPException(status_code=500, detail=histogram["error"])
+
+        await file_store.write(histogram_path, histogram.getvalue())
     return FileResponse(histogram_path, media_type="image/png")
 
+@app.get("/images/{image_id}/histogram.json")
+async def get_histogram_data(image_id: str):
+    """
+    Retrieve the raw histogram counts of an image.
+
+    - **image_id**: ID of the image.
+    - **Returns**: 256 counts per channel ('gray', or 'red', 'green' and 'blue').
+    """
+    histogram = await load_histogram_counts(image_id)
+    return {
+        "image_id": image_id,
+        "histogram": histogram.to_dict()
+    }
+
 @app.delete("/images/{image_id}", status_code=204)
-def delete_image(image_id: str):
+async def delete_image(image_id: str):
     """
     Delete an uploaded image.
 
     - **image_id**: ID of the image to delete.
     """
-    image_path = get_image_path(image_id)
-    if os.path.exists(image_path):
-        os.remove(image_path)
-        histogram_path = os.path.join(HISTOGRAM_DIR, f"{image_id}.png")
-        if os.path.exists(histogram_path):
-            os.remove(histogram_path)
-    else:
+    image_path = await get_image_path(image_id)
+    try:
+        await file_store.remove(image_path)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Image not found")
+    for histogram_path in (get_histogram_data_path(image_id), get_histogram_image_path(image_id)):
+        await file_store.remove(histogram_path, missing_ok=True)
+    result_cache.invalidate_image(image_id)
+    decoded_image_cache.discard(image_id)
     return
 
-@app.post("/images/{image_id}/grayscale", response_model=ImageResponse, status_code=201)
-async def apply_grayscale(image_id: str, operation: GrayscaleOperation = Body(...)):
+@app.get("/cache/stats")
+def get_cache_stats():
+    """
+    Retrieve the result cache counters.
+
+    - **Returns**: Entries, hits, misses, evictions and hit rate of the result cache, of the decoded image cache (with its resident bytes)
+      and of the API process's kernel bank (with the seconds spent generating kernels and saved by reusing them),
+      the compute executor's pending operations, pools and routes, and the running and queued background jobs.
+    """
+    return {
+        "results": result_cache.stats(),
+        "decoded_images": decoded_image_cache.stats(),
+        "kernels": kernel_bank.stats(),
+        "executor": compute_executor.stats(),
+        "jobs": job_queue.stats()
+    }
+
+@app.post("/images/{image_id}/grayscale", response_model=ImageResponse, status_code=201, responses=ASYNC_RESPONSES)
+async def apply_grayscale(image_id: str, operation: GrayscaleOperation = Body(...), run_async: bool = Query(False, alias="async")):
     """
     Apply grayscale transformation.
 
     - **image_id**: ID of the image to transform.
     - **operation**: Grayscale operation parameters.
+    - **async**: Return 202 with a job ID right away instead of waiting for the result.
     - **Returns**: Transformed image ID, metadata, and histogram ID.
 
     """
-    return await apply_transformation(image_id, operation, 'grayscale')
+    return await run_request('grayscale', partial(apply_transformation, image_id, operation, 'grayscale'), run_async, [image_id])
 
-@app.post("/images/{image_id}/halftoning", response_model=ImageResponse, status_code=201)
-async def apply_halftoning(image_id: str, operation: HalftoningOperation = Body(...)):
+@app.post("/images/{image_id}/halftoning", response_model=ImageResponse, status_code=201, responses=ASYNC_RESPONSES)
+async def apply_halftoning(image_id: str, operation: HalftoningOperation = Body(...), run_async: bool = Query(False, alias="async")):
     """
     Apply halftoning transformation.
 
     - **image_id**: ID of the image to transform.
     - **operation**: Halftoning operation parameters.
+    - **async**: Return 202 with a job ID right away instead of waiting for the result.
     - **Returns**: Transformed image ID, metadata, and histogram ID.
 
     """
-    return await apply_transformation(image_id, operation, 'halftoning')
+    return await run_request('halftoning', partial(apply_transformation, image_id, operation, 'halftoning'), run_async, [image_id])
 
-@app.post("/images/{image_id}/histogram_equalization", response_model=ImageResponse, status_code=201)
-async def apply_equalization(image_id: str, operation: HistogramEqualizationOperation = Body(...)):
+@app.post("/images/{image_id}/histogram_equalization", response_model=ImageResponse, status_code=201, responses=ASYNC_RESPONSES)
+async def apply_equalization(image_id: str, operation: HistogramEqualizationOperation = Body(...), run_async: bool = Query(False, alias="async")):
     """
     Apply histogram equalization.
 
     - **image_id**: ID of the image to transform.
     - **operation**: Equalization operation parameters.
+    - **async**: Return 202 with a job ID right away instead of waiting for the result.
     - **Returns**: Transformed image ID, metadata, and histogram ID.
 
     """
-    return await apply_transformation(image_id, operation, 'histogram_equalization')
+    return await run_request('histogram_equalization', partial(apply_transformation, image_id, operation, 'histogram_equalization'), run_async, [image_id])
 
-@app.post("/images/{image_id}/histogram_smoothing", response_model=ImageResponse, status_code=201)
-async def apply_equalization(image_id: str, operation: HistogramSmoothingOperation = Body(...)):
+@app.post("/images/{image_id}/histogram_smoothing", response_model=ImageResponse, status_code=201, responses=ASYNC_RESPONSES)
+async def apply_equalization(image_id: str, operation: HistogramSmoothingOperation = Body(...), run_async: bool = Query(False, alias="async")):
     """
     Apply histogram smoothing.
 
     - **image_id**: ID of the image to transform.
     - **operation**: Smoothinh operation parameters.
+    - **async**: Return 202 with a job ID right away instead of waiting for the result.
     - **Returns**: Transformed image ID, metadata, and histogram ID.
 
     """
-    return await apply_transformation(image_id, operation, 'histogram_smoothing')
+    return await run_request('histogram_smoothing', partial(apply_transformation, image_id, operation, 'histogram_smoothing'), run_async, [image_id])
 
-@app.post("/images/{image_id}/basic_edge_detection", response_model=ImageResponse, status_code=201)
-async def apply_basic_edge_detection(image_id: str, operation: BasicEdgeDetectionOperation = Body(...)):
+@app.post("/images/{image_id}/basic_edge_detection", response_model=ImageResponse, status_code=201, responses=ASYNC_RESPONSES)
+async def apply_basic_edge_detection(image_id: str, operation: BasicEdgeDetectionOperation = Body(...), run_async: bool = Query(False, alias="async")):
     """
     Apply basic edge detection.
 
     - **image_id**: ID of the image to transform.
     - **operation**: Basic edge detection parameters.
+    - **async**: Return 202 with a job ID right away instead of waiting for the result.
     - **Returns**: Transformed image ID, metadata, and histogram ID.
 
     """
-    return await apply_transformation(image_id, operation, 'basic_edge_detection')
+    return await run_request('basic_edge_detection', partial(apply_transformation, image_id, operation, 'basic_edge_detection'), run_async, [image_id])
 
-@app.post("/images/{image_id}/advanced_edge_detection", response_model=ImageResponse, status_code=201)
-async def apply_advanced_edge_detection(image_id: str, operation: AdvancedEdgeDetectionOperation = Body(...)):
+@app.post("/images/{image_id}/advanced_edge_detection", response_model=ImageResponse, status_code=201, responses=ASYNC_RESPONSES)
+async def apply_advanced_edge_detection(image_id: str, operation: AdvancedEdgeDetectionOperation = Body(...), run_async: bool = Query(False, alias="async")):
     """
     Apply advanced edge detection.
 
     - **image_id**: ID of the image to transform.
     - **operation**: Advanced edge detection parameters.
+    - **async**: Return 202 with a job ID right away instead of waiting for the result.
     - **Returns**: Transformed image ID, metadata, and histogram ID.
 
     """
-    return await apply_transformation(image_id, operation, 'advanced_edge_detection')
+    return await run_request('advanced_edge_detection', partial(apply_transformation, image_id, operation, 'advanced_edge_detection'), run_async, [image_id])
 
-@app.post("/images/{image_id}/filtering", response_model=ImageResponse, status_code=201)
-async def apply_filtering(image_id: str, operation: FilteringOperation = Body(...)):
+@app.post("/images/{image_id}/filtering", response_model=ImageResponse, status_code=201, responses=ASYNC_RESPONSES)
+async def apply_filtering(image_id: str, operation: FilteringOperation = Body(...), run_async: bool = Query(False, alias="async")):
     """
     Apply filtering operation.
 
     - **image_id**: ID of the image to transform.
     - **operation**: Filtering operation parameters.
+    - **async**: Return 202 with a job ID right away instead of waiting for the result.
     - **Returns**: Transformed image ID, metadata, and histogram ID.
 
     """
-    return await apply_transformation(image_id, operation, 'filtering')
+    return await run_request('filtering', partial(apply_transformation, image_id, operation, 'filtering'), run_async, [image_id])
 
-@app.post("/images/{image_id}/single_operation", response_model=ImageResponse, status_code=201)
-async def apply_single_image_operation(image_id: str, operation: SingleImageOperation = Body(...)):
+@app.post("/images/{image_id}/single_operation", response_model=ImageResponse, status_code=201, responses=ASYNC_RESPONSES)
+async def apply_single_image_operation(image_id: str, operation: SingleImageOperation = Body(...), run_async: bool = Query(False, alias="async")):
     """
     Apply single image operation (rotate, flip, scale, invert).
 
     - **image_id**: ID of the image to transform.
     - **operation**: Single image operation parameters.
+    - **async**: Return 202 with a job ID right away instead of waiting for the result.
     - **Returns**: Transformed image ID, metadata, and histogram ID.
 
     """
-    return await apply_transformation(image_id, operation, 'single_operation')
+    return await run_request('single_operation', partial(apply_transformation, image_id, operation, 'single_operation'), run_async, [image_id])
+
+@app.post("/images/{image_id}/pipeline", response_model=PipelineResponse, status_code=201, responses=ASYNC_RESPONSES)
+async def apply_pipeline(image_id: str, operation: PipelineOperation = Body(...), run_async: bool = Query(False, alias="async")):
+    """
+    Apply a chain of operations in one request. Intermediate results stay in memory;
+    only the final image and the steps marked with 'keep' are stored.
+
+    - **image_id**: ID of the image to transform.
+    - **operation**: Ordered steps, each an operation type with its parameters.
+    - **async**: Return 202 with a job ID right away instead of waiting for the result.
+    - **Returns**: Final image ID, metadata, and histogram ID, plus the kept intermediate images.
+    """
+    return await run_request('pipeline', partial(apply_pipeline_steps, image_id, operation), run_async, [image_id])
+
+async def apply_pipeline_steps(image_id: str, operation: PipelineOperation, progress=None) -> PipelineResponse:
+    decoded_image = await load_decoded_image(image_id)
+
+    result = await run_compute('pipeline', image_utils.run_pipeline, decoded_image.array, operation.steps, storage_codec, progress=progress)
+    if isinstance(result, dict) and "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+
+    responses = [await store_transformed_image(encoded_image) for _, encoded_image in result]
+    final_response = responses[-1]
 
-@app.post("/images/multi_operation", response_model=ImageResponse, status_code=201)
-async def apply_multi_image_operation(operation: MultiImageOperation = Body(...)):
+    return PipelineResponse(
+        image_id = final_response.image_id,
+        metadata = final_response.metadata,
+        histogram_id = final_response.histogram_id,
+        intermediates = responses[:-1]
+    )
+
+@app.post("/images/multi_operation", response_model=ImageResponse, status_code=201, responses=ASYNC_RESPONSES)
+async def apply_multi_image_operation(operation: MultiImageOperation = Body(...), run_async: bool = Query(False, alias="async")):
     """
     Apply multi-image operation (add, subtract, cut_paste).
 
     - **operation**: Multi-image operation parameters.
+    - **async**: Return 202 with a job ID right away instead of waiting for the result.
     - **Returns**: Transformed image ID, metadata, and histogram ID.
 
     """
-    return await apply_multi_transformation(operation)
+    return await run_request('multi_operation', partial(apply_multi_transformation, operation), run_async, operation.images)
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+def get_job(job_id: str):
+    """
+    Retrieve the status of a background job.
+
+    - **job_id**: ID returned by a request made with ?async=true.
+    - **Returns**: Status ('queued', 'running', 'succeeded', 'failed' or 'cancelled') and progress, with the result or the error once finished.
+    """
+    return job_response(get_job_or_404(job_id))
+
+@app.delete("/jobs/{job_id}", response_model=JobResponse)
+def cancel_job(job_id: str):
+    """
+    Cancel a queued or running job. Finished jobs are left as they are.
 
-def get_image_path(image_id: str):
-    image_file_name = f"{image_id}.png"
-    image_path = os.path.join(IMAGE_DIR, image_file_name)
-    if not os.path.exists(image_path):
+    - **job_id**: ID of the job to cancel.
+    - **Returns**: The job status after cancellation.
+    """
+    get_job_or_404(job_id)
+    return job_response(job_queue.cancel(job_id))
+
+async def find_image_path(image_id: str) -> Optional[str]:
+    for codec in STORAGE_CODECS.values(): # images stay readable after the storage format changes
+        image_path = os.path.join(IMAGE_DIR, f"{image_id}{codec.extension}")
+        if await file_store.exists(image_path):
+            return image_path
+    return None
+
+async def get_image_path(image_id: str):
+    image_path = await find_image_path(image_id)
+    if image_path is None:
         raise HTTPException(status_code=404, detail="Image not found")
     return image_path
 
-@app.post("/images/{image_id}/histogram_segmentation", status_code=201)
-async def apply_histogram_segmentation(image_id: str, operation: HistogramSegmentationOperation = Body(...)):
+def get_histogram_data_path(image_id: str):
+    return os.path.join(HISTOGRAM_DIR, f"{image_id}.npy")
+
+def get_histogram_image_path(image_id: str):
+    return os.path.join(HISTOGRAM_DIR, f"{image_id}.png")
+
+async def load_histogram_counts(image_id: str):
+    try:
+        data = await file_store.read(get_histogram_data_path(image_id))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Histogram not found")
+    return histogram_from_bytes(data)
+
+@app.post("/images/{image_id}/histogram_segmentation", status_code=201, responses=ASYNC_RESPONSES)
+async def apply_histogram_segmentation(image_id: str, operation: HistogramSegmentationOperation = Body(...), run_async: bool = Query(False, alias="async")):
     """
     Apply histogram-based segmentation.
 
     - **image_id**: ID of the image to transform.
     - **operation**: Segmentation operation parameters.
-    - **Returns**: Transformed image.
+    - **async**: Return 202 with a job ID right away instead of waiting for the result.
+    - **Returns**: Transformed image ID, metadata, and histogram ID. With 'segment', metadata also lists the labeled regions.
     """
-    return await apply_transformation(image_id, operation, 'histogram_segmentation')
+    return await run_request('histogram_segmentation', partial(apply_transformation, image_id, operation, 'histogram_segmentation'), run_async, [image_id])
+
+async def run_request(operation_type: str, run, run_async: bool, image_ids):
+    if not run_async:
+        return await run()
+
+    for image_id in image_ids: # unknown images fail right away rather than in the job
+        await get_image_path(image_id)
+    progress = compute_executor.track_progress()
+    try:
+        job = job_queue.submit(operation_type, partial(run, progress=progress), progress)
+    except JobQueueFull as e:
+        if progress is not None:
+            progress.close()
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    return JSONResponse(status_code=202, content=job_response(job).model_dump(mode='json'), headers={"Location": f"/jobs/{job.job_id}"})
+
+def get_job_or_404(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+def job_response(job) -> JobResponse:
+    return JobResponse(
+        job_id = job.job_id,
+        operation_type = job.operation_type,
+        status = job.status,
+        progress = job.fraction_done(),
+        status_code = job.status_code,
+        result = job.result,
+        error = job.error,
+        created_at = job.created_at,
+        started_at = job.started_at,
+        finished_at = job.finished_at
+    )
+
+async def run_compute(operation_type: str, func, *args, progress=None):
+    try:
+        return await compute_executor.run(operation_type, func, *args, progress=progress)
+    except ExecutorBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
 
-async def apply_transformation(image_id: str, operation, operation_type: str):
-    image_path = get_image_path(image_id)
+def read_decoded_image(image_path: str) -> DecodedImage:
+    codec = codec_for_path(image_path)
+    if codec.mappable: # operations map the file themselves and page in only what they touch
+        return DecodedImage(MappedArray(image_path), file_digest(image_path))
 
     with open(image_path, "rb") as f:
         image_bytes = f.read()
-
-    if operation_type == 'grayscale':
-        result = image_utils.apply_grayscale(image_bytes, operation)
-    elif operation_type == 'halftoning':
-        result = image_utils.apply_halftoning(image_bytes, operation)
-    elif operation_type == 'histogram_equalization':
-        result = image_utils.apply_histogram_equalization(image_bytes, operation)
-    elif operation_type == 'histogram_smoothing':
-        result = image_utils.apply_histogram_smoothing(image_bytes, operation)
-    elif operation_type == 'basic_edge_detection':
-        result = image_utils.apply_basic_edge_detection(image_bytes, operation)
-    elif operation_type == 'advanced_edge_detection':
-        result = image_utils.apply_advanced_edge_detection(image_bytes, operation)
-    elif operation_type == 'filtering':
-        result = image_utils.apply_filtering(image_bytes, operation)
-    elif operation_type == 'single_operation':
-        result = image_utils.apply_single_image_operation(image_bytes, operation)
-    elif operation_type == 'histogram_segmentation':
-        result = image_utils.apply_histogram_segmentation(image_bytes, operation)
-    else:
+    return DecodedImage(codec.decode(image_bytes), content_digest(image_bytes))
+
+async def load_decoded_image(image_id: str) -> DecodedImage:
+    image_path = await get_image_path(image_id)
+
+    decoded_image = decoded_image_cache.get(image_id)
+    if decoded_image is None:
+        try:
+            decoded_image = await run_compute('decode', read_decoded_image, image_path)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        decoded_image_cache.put(image_id, decoded_image)
+    return decoded_image
+
+async def apply_transformation(image_id: str, operation, operation_type: str, progress=None):
+    if operation_type not in image_utils.ARRAY_OPERATIONS:
         raise HTTPException(status_code=400, detail="Unsupported operation type")
 
+    decoded_image = await load_decoded_image(image_id)
+
+    cache_key = operation_key(operation_type, [decoded_image.digest], operation)
+    cached_response = await get_cached_result(cache_key)
+    if cached_response is not None:
+        return cached_response
+
+    result = await run_compute(operation_type, image_utils.transform_array, operation_type, decoded_image.array, operation, storage_codec, progress=progress)
+
     if isinstance(result, dict) and "error" in result:
         raise HTTPException(status_code=400, detail=result["error"])
 
-    transformed_image_id = str(uuid4())
-    transformed_image_filename = f"{transformed_image_id}.png"
-    transformed_image_path = os.path.join(IMAGE_DIR, transformed_image_filename)
-    with open(transformed_image_path, "wb") as f:
-        f.write(result.getvalue())
-
-    transformed_image_bytes = result.getvalue()
-    metadata = image_utils.get_metadata(transformed_image_bytes, transformed_image_filename)
-    if "error" in metadata:
-        raise HTTPException(status_code=400, detail=metadata["error"])
-    metadata['transformed'] = True
-
-    histogram = image_utils.get_histograms(transformed_image_bytes)
-    if isinstance(histogram, dict) and "error" in histogram:
-        raise HTTPException(status_code=400, detail=histogram["error"])
-    histogram_path = os.path.join(HISTOGRAM_DIR, f"{transformed_image_id}.png")
-    with open(histogram_path, "wb") as f:
-        f.write(histogram.getvalue())
+    response = await store_transformed_image(result)
+    result_cache.put(cache_key, response)
+    return response
 
-    return ImageResponse(
-        image_id = transformed_image_id,
-        metadata = metadata,
-        histogram_id = transformed_image_id
-    )
+async def apply_multi_transformation(operation: MultiImageOperation, progress=None):
+    decoded_images = [await load_decoded_image(image_id) for image_id in operation.images]
 
-async def apply_multi_transformation(operation: MultiImageOperation):
-    image_bytes_list = []
-    for image_id in operation.images:
-        image_path = get_image_path(image_id)
-        with open(image_path, "rb") as f:
-            image_bytes_list.append(f.read())
+    cache_key = operation_key('multi_operation', [decoded_image.digest for decoded_image in decoded_images], operation)
+    cached_response = await get_cached_result(cache_key)
+    if cached_response is not None:
+        return cached_response
 
-    result = image_utils.apply_multi_image_operation(image_bytes_list, operation)
+    image_arrays = [decoded_image.array for decoded_image in decoded_images]
+    result = await run_compute('multi_operation', image_utils.transform_arrays, image_arrays, operation, storage_codec, progress=progress)
     if isinstance(result, dict) and "error" in result:
         raise HTTPException(status_code=400, detail=result["error"])
 
-    transformed_image_id = str(uuid4())
-    transformed_image_filename = f"{transformed_image_id}.png"
-    transformed_image_path = os.path.join(IMAGE_DIR, transformed_image_filename)
-    with open(transformed_image_path, "wb") as f:
-        f.write(result.getvalue())
-
-    transformed_image_bytes = result.getvalue()
-    metadata = image_utils.get_metadata(transformed_image_bytes, transformed_image_filename)
-    if "error" in metadata:
-        raise HTTPException(status_code=400, detail=metadata["error"])
-    metadata['transformed'] = True
-
-    histogram = image_utils.get_histograms(transformed_image_bytes)
-    if isinstance(histogram, dict) and "error" in histogram:
-        raise HTTPException(status_code=400, detail=histogram["error"])
-    histogram_path = os.path.join(HISTOGRAM_DIR, f"{transformed_image_id}.png")
-    with open(histogram_path, "wb") as f:
-        f.write(histogram.getvalue())
+    response = await store_transformed_image(result)
+    result_cache.put(cache_key, response)
+    return response
+
+async def apply_batch_item(image_id: str, operation, operation_type: str, slots: asyncio.Semaphore) -> BatchItemResponse:
+    async with slots:
+        try:
+            response = await apply_transformation(image_id, operation, operation_type)
+        except HTTPException as e:
+            return BatchItemResponse(image_id=image_id, status_code=e.status_code, error=str(e.detail))
+        except Exception as e: # one failed image must not cut the stream of the others
+            return BatchItemResponse(image_id=image_id, status_code=500, error=str(e))
+    return BatchItemResponse(image_id=image_id, status_code=201, result=response)
+
+async def stream_batch(image_ids, operation, operation_type: str):
+    # a bounded number of images run at a time, so a large batch queues here instead of
+    # filling the compute executor and turning into 503s
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+    tasks = [asyncio.create_task(apply_batch_item(image_id, operation, operation_type, slots)) for image_id in image_ids]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            item = await finished
+            yield item.model_dump_json(exclude_none=True) + "\n"
+    finally:
+        for task in tasks: # client went away
+            task.cancel()
+
+async def get_cached_result(cache_key: tuple) -> Optional[ImageResponse]:
+    response = result_cache.get(cache_key)
+    if response is not None and await find_image_path(response.image_id) is None:
+        result_cache.discard(cache_key) # derived image removed behind the cache's back
+        return None
+    return response
+
+async def store_transformed_image(result) -> ImageResponse:
+    return await store_encoded_image(result, transformed=True)
+
+async def store_encoded_image(result, transformed: bool) -> ImageResponse:
+    """
+    Stores an EncodedImage with the metadata and histogram it carries, so nothing is decoded again.
+    """
+    image_id = str(uuid4())
+    image_filename = f"{image_id}{storage_codec.extension}"
+    image_path = os.path.join(IMAGE_DIR, image_filename)
+    image_bytes = result.buf.getvalue()
+    digest = None
+    if not storage_codec.mappable: # hashed on an I/O thread alongside the writes, off the event loop
+        digest = asyncio.get_running_loop().run_in_executor(file_store.executor, content_digest, image_bytes)
+    await asyncio.gather(
+        file_store.write(image_path, image_bytes),
+        file_store.write(get_histogram_data_path(image_id), histogram_to_bytes(result.histogram))
+    )
+
+    metadata = {**result.metadata, 'file_name': image_filename, 'transformed': transformed}
+
+    if not storage_codec.mappable: # follow-up operations on this image start from the array in hand
+        decoded_image_cache.put(image_id, DecodedImage(result.array, await digest))
 
     return ImageResponse(
-        image_id = transformed_image_id,
+        image_id = image_id,
         metadata = metadata,
-        histogram_id = transformed_image_id
+        histogram_id = image_id
     )
-
@@ -0,0 +1,83 @@
+import numpy as np
+import cv2
+from numpy.lib.stride_tricks import sliding_window_view
+
+CV2_MEDIAN_MAX_KERNEL = 255 # cv2.medianBlur's constant-time 8-bit path asserts on larger apertures
+CV2_MEDIAN_FLOAT_MAX_KERNEL = 5 # non-8-bit images are only supported for 3x3 and 5x5
+WINDOW_ELEMENTS_BUDGET = 1 << 24 # max window elements materialized at once by the generic path
+
+def _running_histogram_median(channel: np.ndarray, kernel_size: int) -> np.ndarray:
+    # Perreault-Hebert: one histogram per column slides down the image, and the kernel
+    # histogram of every output pixel in a row is a difference of column prefix sums
+    pad = kernel_size // 2
+    padded = cv2.copyMakeBorder(channel, pad, pad, pad, pad, cv2.BORDER_CONSTANT, value=0)
+    height, width = channel.shape
+    columns = np.arange(padded.shape[1])
+    rank = kernel_size * kernel_size // 2
+
+    column_histograms = np.zeros((padded.shape[1] + 1, 256), dtype=np.int32) # row 0 stays zero for the prefix sums
+    histograms = column_histograms[1:]
+    for row in padded[:kernel_size]:
+        histograms[columns, row] += 1
+
+    prefix = np.empty_like(column_histograms)
+    median_array = np.empty((height, width), dtype=np.uint8)
+    for y in range(height):
+        np.cumsum(column_histograms, axis=0, out=prefix)
+        window = prefix[kernel_size:] - prefix[:-kernel_size]
+        np.cumsum(window, axis=1, out=window)
+        median_array[y] = np.argmax(window > rank, axis=1)
+
+        if y + 1 < height:
+            histograms[columns, padded[y]] -= 1
+            histograms[columns, padded[y + kernel_size]] += 1
+
+    return median_array
+
+def _windowed_median(channel: np.ndarray, kernel_size: int) -> np.ndarray:
+    pad = kernel_size // 2
+    padded = np.pad(channel, pad, mode='constant', constant_values=0)
+    height, width = channel.shape
+    window_elements = kernel_size * kernel_size
+
+    # split into blocks so that at most WINDOW_ELEMENTS_BUDGET window elements exist at once
+    band_rows = max(1, WINDOW_ELEMENTS_BUDGET // (width * window_elements))
+    band_cols = width if band_rows > 1 else max(1, WINDOW_ELEMENTS_BUDGET // window_elements)
+
+    median_array = np.empty((height, width))
+    for y in range(0, height, band_rows):
+        y_end = min(y + band_rows, height)
+        for x in range(0, width, band_cols):
+            x_end = min(x + band_cols, width)
+            block = padded[y:y_end + 2 * pad, x:x_end + 2 * pad]
+            windows = sliding_window_view(block, (kernel_size, kernel_size))
+            median_array[y:y_end, x:x_end] = np.median(windows, axis=(-2, -1))
+
+    return median_array
+
+def _median_channel(channel: np.ndarray, kernel_size: int) -> np.ndarray:
+    pad = kernel_size // 2
+
+    if channel.dtype == np.uint8:
+        if kernel_size > CV2_MEDIAN_MAX_KERNEL:
+            return _running_histogram_median(channel, kernel_size)
+        # sorting network for 3x3/5x5, constant-time histogram median above that
+        padded = cv2.copyMakeBorder(channel, pad, pad, pad, pad, cv2.BORDER_CONSTANT, value=0)
+        return cv2.medianBlur(padded, kernel_size)[pad:-pad, pad:-pad]
+
+    if channel.dtype in (np.uint16, np.float32) and kernel_size <= CV2_MEDIAN_FLOAT_MAX_KERNEL:
+        padded = cv2.copyMakeBorder(channel, pad, pad, pad, pad, cv2.BORDER_CONSTANT, value=0)
+        return cv2.medianBlur(padded, kernel_size)[pad:-pad, pad:-pad]
+
+    return _windowed_median(channel, kernel_size)
+
+def median_filter(image_array: np.ndarray, kernel_size: int) -> np.ndarray:
+    """
+    Zero-padded median filter, applied to each channel separately.
+    """
+    if image_array.ndim == 2:
+        return _median_channel(np.ascontiguousarray(image_array), kernel_size)
+    elif image_array.ndim == 3:
+        channels = [_median_channel(np.ascontiguousarray(image_array[:, :, c]), kernel_size) for c in range(image_array.shape[2])]
+        return np.stack(channels, axis=2)
+    raise ValueError("Input image must be a 2D or 3D numpy array.")
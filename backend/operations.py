@@ -1,6 +1,10 @@
 from pydantic import BaseModel, Field, model_validator, field_validator
 from typing import List, Tuple, Literal, Optional, Union
 
+EXECUTION_FIELDS = {'workers'} # change how an operation runs, never its result
+
+MAX_WORKERS = 128
+
 class GrayscaleOperation(BaseModel):
     mode: Literal['lightness', 'luminosity']
 
@@ -11,6 +15,8 @@ class HalftoningOperation(BaseModel):
     mode: Literal['grayscale', 'RGB']
     method: Literal['thresholding', 'error_diffusion']
     threshold: Union[int, Tuple[int, int, int]] = Field(...)
+    kernel: Literal['floyd_steinberg', 'jarvis_judice_ninke', 'stucki'] = Field('floyd_steinberg', description="Error diffusion kernel")
+    serpentine: bool = Field(False, description="Alternate the scan direction on every row for error diffusion")
 
     @model_validator(mode='after')
     def check_threshold(self):
@@ -68,6 +74,7 @@ class AdvancedEdgeDetectionOperation(BaseModel):
     thresholding: Optional[bool] = None
     threshold: Optional[int] = Field(None,ge=0, le=255)
     kernel_size: Optional[int] = Field(None, ge=3, le=999)
+    workers: Optional[int] = Field(None, ge=1, le=MAX_WORKERS, description="Row bands processed in parallel, same result as one worker")
 
     @model_validator(mode='after')
     def check_threshold_and_kernel_size(self):
@@ -109,6 +116,7 @@ class FilteringOperation(BaseModel):
     mode: Literal['high', 'low', 'median']
     kernel_size: int = Field(ge=3, le=999)
     sigma: Optional[float] = None
+    workers: Optional[int] = Field(None, ge=1, le=MAX_WORKERS, description="Row bands processed in parallel, same result as one worker")
 
     @model_validator(mode='after')
     def check_sigma(self):
@@ -184,6 +192,7 @@ class HistogramSegmentationOperation(BaseModel):
     mode: Literal['manual', 'peak', 'valley', 'adaptive'] = Field(..., description="Segmentation mode: 'manual', 'peak', 'valley', 'adaptive'")
     value: int = Field(255, ge=3, le=999, description="Pixel value to set for thresholded pixels")
     segment: bool = Field(False, description="Whether to perform region growing")
+    connectivity: Literal[4, 8] = Field(8, description="Pixel connectivity used when labeling regions")
     hi: int = Field(None, description="High threshold value for 'manual' mode")
     low: int = Field(None, description="Low threshold value for 'manual' mode")
 
@@ -194,3 +203,45 @@ class HistogramSegmentationOperation(BaseModel):
                 raise ValueError("'hi' and 'lo' must be set for manual mode")
 
         return self
+
+PIPELINE_OPERATIONS = {
+    'grayscale': GrayscaleOperation,
+    'halftoning': HalftoningOperation,
+    'histogram_equalization': HistogramEqualizationOperation,
+    'histogram_smoothing': HistogramSmoothingOperation,
+    'basic_edge_detection': BasicEdgeDetectionOperation,
+    'advanced_edge_detection': AdvancedEdgeDetectionOperation,
+    'filtering': FilteringOperation,
+    'single_operation': SingleImageOperation,
+    'histogram_segmentation': HistogramSegmentationOperation,
+}
+
+class PipelineStep(BaseModel):
+    operation_type: Literal[
+        'grayscale', 'halftoning', 'histogram_equalization', 'histogram_smoothing',
+        'basic_edge_detection', 'advanced_edge_detection', 'filtering',
+        'single_operation', 'histogram_segmentation'
+    ]
+    operation: Union[
+        GrayscaleOperation, HalftoningOperation, HistogramEqualizationOperation, HistogramSmoothingOperation,
+        BasicEdgeDetectionOperation, AdvancedEdgeDetectionOperation, FilteringOperation,
+        SingleImageOperation, HistogramSegmentationOperation
+    ] = Field(..., description="Parameters of the operation named by 'operation_type'")
+    keep: bool = Field(False, description="Also store the output of this step as its own image")
+
+    @model_validator(mode='before')
+    @classmethod
+    def parse_operation(cls, data):
+        # the operation models share field names, so parse with the model selected by 'operation_type'
+        if isinstance(data, dict) and isinstance(data.get('operation'), dict):
+            operation_model = PIPELINE_OPERATIONS.get(data.get('operation_type'))
+            if operation_model is not None:
+                data = {**data, 'operation': operation_model.model_validate(data['operation'])}
+        return data
+
+class PipelineOperation(BaseModel):
+    steps: List[PipelineStep] = Field(..., min_length=1, description="Operations to apply in order")
+
+class BatchOperation(BaseModel):
+    image_ids: List[str] = Field(..., min_length=1, description="Source images, each transformed on its own")
+    operation: dict = Field(..., description="Parameters of the operation named in the path, shared by every image")
@@ -0,0 +1,121 @@
+import numpy as np
+import cv2
+from typing import Sequence, Union
+
+from histogram import Histogram
+
+IDENTITY = np.arange(256, dtype=np.uint8)
+
+class LookupTable:
+    """
+    A per-pixel map of 8-bit values: one 256-entry table shared by every channel, or a
+    (256, channels) table with a column per channel. Applied with cv2.LUT in one pass.
+    """
+    def __init__(self, lut: np.ndarray):
+        lut = np.asarray(lut)
+        if lut.ndim not in (1, 2) or lut.shape[0] != 256:
+            raise ValueError(f"Lookup tables have 256 rows, got shape {lut.shape}.")
+        self.lut = lut.astype(np.uint8, copy=False)
+
+    @property
+    def channels(self) -> int:
+        return self.lut.shape[1] if self.lut.ndim == 2 else 0 # 0: shared by any number of channels
+
+    def apply(self, image_array: np.ndarray) -> np.ndarray:
+        _check_input(image_array, self.channels)
+        if self.lut.ndim == 1:
+            return cv2.LUT(image_array, self.lut)
+        return cv2.LUT(image_array, np.ascontiguousarray(self.lut.reshape(1, 256, -1)))
+
+    def then(self, following: 'PointTable') -> 'PointTable':
+        """
+        The table applying self, then following.
+        """
+        if isinstance(following, WeightedLookupTable):
+            return WeightedLookupTable(self._index(following.partials), following.table)
+        if following.lut.ndim == 1:
+            return LookupTable(following.lut[self.lut])
+        return LookupTable(self._index(following.lut))
+
+    def _index(self, per_channel: np.ndarray) -> np.ndarray:
+        # column c of the result maps v to per_channel[self.lut[v, c], c]
+        source = self.lut if self.lut.ndim == 2 else np.repeat(self.lut[:, None], per_channel.shape[1], axis=1)
+        return np.take_along_axis(per_channel, source.astype(np.intp), axis=0)
+
+    def map_histograms(self, histograms: Histogram) -> Histogram:
+        """
+        Histograms of the mapped image, from those of the input without touching its pixels.
+        """
+        luts = self.lut.T if self.lut.ndim == 2 else [self.lut] * len(histograms.channels)
+        counts = np.stack([np.bincount(lut, weights=channel_counts, minlength=256) for lut, channel_counts in zip(luts, histograms.counts)])
+        return Histogram(counts.astype(np.int64), histograms.channels)
+
+class WeightedLookupTable:
+    """
+    Channels to one value, table[sum over c of partials[v_c, c]]: integer weighted sums, such
+    as luminosity, in 16-bit partial sums and one final 8-bit lookup instead of float products.
+    """
+    def __init__(self, partials: np.ndarray, table: np.ndarray):
+        if partials.ndim != 2 or partials.shape[0] != 256:
+            raise ValueError(f"Weighted lookup tables have (256, channels) partial sums, got shape {partials.shape}.")
+        max_sum = int(partials.max(axis=0).sum())
+        if partials.min() < 0 or max_sum > np.iinfo(np.uint16).max or len(table) <= max_sum:
+            raise ValueError("Partial sums must be non-negative, add up within 16 bits and index the table.")
+        self.partials = partials.astype(np.uint16, copy=False)
+        self.table = table.astype(np.uint8, copy=False)
+
+    @property
+    def channels(self) -> int:
+        return self.partials.shape[1]
+
+    def apply(self, image_array: np.ndarray) -> np.ndarray:
+        _check_input(image_array, self.channels)
+        partial_sums = cv2.LUT(image_array, np.ascontiguousarray(self.partials.reshape(1, 256, -1)))
+        if partial_sums.ndim == 2:
+            return np.take(self.table, partial_sums)
+        sums = partial_sums[:, :, 0].copy()
+        for c in range(1, self.channels):
+            sums += partial_sums[:, :, c]
+        return np.take(self.table, sums)
+
+    def then(self, following: 'PointTable') -> 'PointTable':
+        if not isinstance(following, LookupTable) or following.channels > 1:
+            raise ValueError("A weighted lookup table gives one channel, only a one-channel table can follow it.")
+        return WeightedLookupTable(self.partials, following.lut.reshape(256)[self.table])
+
+PointTable = Union[LookupTable, WeightedLookupTable]
+
+def weighted_sum_table(numerators: Sequence[int], denominator: int) -> WeightedLookupTable:
+    """
+    floor(sum of numerators[c] * v_c / denominator), exact in integers.
+    """
+    numerators = np.asarray(numerators, dtype=np.int64)
+    partials = np.arange(256, dtype=np.int64)[:, None] * numerators
+    table = np.minimum(np.arange(numerators.sum() * 255 + 1) // denominator, 255)
+    return WeightedLookupTable(partials, table)
+
+def threshold_table(threshold: Union[int, Sequence[int]]) -> LookupTable:
+    """
+    255 above the threshold, 0 otherwise; a sequence gives each channel its own threshold.
+    """
+    if isinstance(threshold, int):
+        return LookupTable(np.where(IDENTITY > threshold, 255, 0))
+    return LookupTable(np.where(IDENTITY[:, None] > np.asarray(threshold), 255, 0))
+
+def channel_table(lut: np.ndarray, channel: int, channels: int) -> LookupTable:
+    """
+    lut on one channel, the others unchanged.
+    """
+    luts = np.repeat(IDENTITY[:, None], channels, axis=1)
+    luts[:, channel] = lut
+    return LookupTable(luts)
+
+def _check_input(image_array: np.ndarray, channels: int):
+    if image_array.dtype != np.uint8:
+        raise ValueError(f"Lookup tables map 8-bit images, got {image_array.dtype}.")
+    image_channels = image_array.shape[2] if image_array.ndim == 3 else 1
+    if channels and channels != image_channels:
+        raise ValueError(f"Lookup table for {channels} channels applied to an image with {image_channels}.")
+
+INVERT = LookupTable(255 - IDENTITY)
+LUMINOSITY = weighted_sum_table((21, 72, 7), 100) # 0.21 R + 0.72 G + 0.07 B
@@ -1,6 +1,28 @@
 from pydantic import BaseModel
+from typing import List, Literal, Optional, Union
 
 class ImageResponse(BaseModel):
     image_id: str
     metadata: dict
     histogram_id: str
+
+class PipelineResponse(ImageResponse):
+    intermediates: List[ImageResponse] = []
+
+class BatchItemResponse(BaseModel):
+    image_id: str # source image
+    status_code: int
+    result: Optional[ImageResponse] = None
+    error: Optional[str] = None
+
+class JobResponse(BaseModel):
+    job_id: str
+    operation_type: str
+    status: Literal['queued', 'running', 'succeeded', 'failed', 'cancelled']
+    progress: float # fraction of the work done: pipeline steps, or tiles and bands (a whole image counts as one)
+    status_code: Optional[int] = None # of the equivalent synchronous request, once finished
+    result: Optional[Union[PipelineResponse, ImageResponse]] = None
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
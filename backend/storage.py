@@ -0,0 +1,161 @@
+import io
+import os
+from typing import Dict, NamedTuple, Optional
+
+import numpy as np
+from PIL import Image
+
+ARRAY_MODES = ('L', 'RGB', 'RGBA', 'I;16', 'I', 'F') # modes that round-trip through Image.fromarray
+
+def image_to_array(image: Image.Image) -> np.ndarray:
+    if image.mode == '1':
+        image = image.convert('L')
+    elif image.mode not in ARRAY_MODES:
+        image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+    return np.array(image)
+
+def array_mode(image_array: np.ndarray) -> Optional[str]:
+    """
+    The mode Image.fromarray would give the array, without building the image (None if not a common one).
+    """
+    if image_array.ndim == 2:
+        return {np.uint8: 'L', np.uint16: 'I;16', np.int32: 'I', np.float32: 'F'}.get(image_array.dtype.type)
+    if image_array.ndim == 3 and image_array.dtype == np.uint8:
+        return {3: 'RGB', 4: 'RGBA'}.get(image_array.shape[2])
+    return None
+
+class MappedArray:
+    """
+    Reference to a stored .npy image that is memory-mapped where it is used. Passing it to a
+    process pool costs a path instead of a pickled copy of the pixels, and operations page in
+    only the parts they touch.
+    """
+    __slots__ = ('path',)
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def open(self) -> np.ndarray:
+        return np.load(self.path, mmap_mode='r', allow_pickle=False)
+
+def as_array(image) -> np.ndarray:
+    return image.open() if isinstance(image, MappedArray) else image
+
+class PILCodec:
+    """
+    Stores images in a format Pillow can write, with fixed save options (e.g. the PNG compress_level).
+    """
+    mappable = False
+
+    def __init__(self, name: str, media_type: str, pil_format: str, modes: Optional[tuple] = None, **save_options):
+        self.name = name
+        self.extension = f".{name}"
+        self.media_type = media_type
+        self.pil_format = pil_format
+        self.modes = modes # modes the format can hold, others are converted to RGB(A) first
+        self.save_options = save_options
+
+    def encode_image(self, image: Image.Image) -> io.BytesIO:
+        if self.modes is not None and image.mode not in self.modes:
+            image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+        buf = io.BytesIO()
+        image.save(buf, format=self.pil_format, **self.save_options)
+        buf.seek(0)
+        return buf
+
+    def encode(self, image_array: np.ndarray) -> io.BytesIO:
+        return self.encode_image(Image.fromarray(image_array))
+
+    def open(self, data: bytes) -> Image.Image:
+        return Image.open(io.BytesIO(data))
+
+    def decode(self, data: bytes) -> np.ndarray:
+        return image_to_array(self.open(data))
+
+    def load(self, path: str) -> np.ndarray:
+        with open(path, "rb") as f:
+            return self.decode(f.read())
+
+class NPYCodec:
+    """
+    Stores the raw array in NumPy's .npy format: no compression, no conversion, and memory-mappable.
+    """
+    name = 'npy'
+    extension = '.npy'
+    media_type = 'application/x-npy'
+    pil_format = None
+    mappable = True
+
+    def encode_image(self, image: Image.Image) -> io.BytesIO:
+        return self.encode(image_to_array(image))
+
+    def encode(self, image_array: np.ndarray) -> io.BytesIO:
+        buf = io.BytesIO()
+        np.save(buf, np.ascontiguousarray(image_array), allow_pickle=False)
+        buf.seek(0)
+        return buf
+
+    def open(self, data: bytes) -> Image.Image:
+        return Image.fromarray(self.decode(data))
+
+    def decode(self, data: bytes) -> np.ndarray:
+        return np.load(io.BytesIO(data), allow_pickle=False)
+
+    def load(self, path: str) -> np.ndarray:
+        return MappedArray(path).open()
+
+DEFAULT_PNG_COMPRESS_LEVEL = 6 # zlib's default, what Image.save uses when no level is given
+
+def png_codec(compress_level: int = DEFAULT_PNG_COMPRESS_LEVEL) -> PILCodec:
+    if not 0 <= compress_level <= 9:
+        raise ValueError("PNG compress level must be between 0 and 9.")
+    return PILCodec('png', 'image/png', 'PNG', compress_level=compress_level)
+
+PNG_CODEC = png_codec()
+NPY_CODEC = NPYCodec()
+QOI_CODEC = PILCodec('qoi', 'image/qoi', 'QOI', modes=('RGB', 'RGBA'))
+
+STORAGE_CODECS = {'png': PNG_CODEC, 'npy': NPY_CODEC} # by format name, decoding does not depend on save options
+
+def png_codec_from_environment() -> PILCodec:
+    return png_codec(int(os.environ.get("IMG_PROC_PNG_COMPRESS_LEVEL", DEFAULT_PNG_COMPRESS_LEVEL)))
+
+def storage_codec_from_environment():
+    """
+    The codec new images are stored with. Images stored under another format stay readable.
+    """
+    storage_format = os.environ.get("IMG_PROC_STORAGE_FORMAT", "png")
+    if storage_format not in STORAGE_CODECS:
+        raise ValueError(f"Unsupported storage format '{storage_format}'. Choose one of {tuple(STORAGE_CODECS)}.")
+    return NPY_CODEC if storage_format == 'npy' else png_codec_from_environment()
+
+def delivery_codecs(png: PILCodec) -> Dict[str, object]:
+    """
+    Formats GET /images/{id} can convert to, by name. QOI needs a Pillow that can write it.
+    """
+    Image.init()
+    codecs = {'png': png, 'npy': NPY_CODEC}
+    if QOI_CODEC.pil_format in Image.SAVE:
+        codecs['qoi'] = QOI_CODEC
+    return codecs
+
+class ImageTooLarge(ValueError):
+    pass
+
+class UploadLimits(NamedTuple):
+    max_bytes: int
+    max_pixels: int # checked from the image header, before decoding
+
+    @classmethod
+    def from_environment(cls) -> 'UploadLimits':
+        return cls(
+            max_bytes=int(os.environ.get("IMG_PROC_MAX_UPLOAD_BYTES", 256 * 1024 * 1024)),
+            max_pixels=int(os.environ.get("IMG_PROC_MAX_IMAGE_PIXELS", Image.MAX_IMAGE_PIXELS)),
+        )
+
+def codec_for_path(path: str):
+    extension = os.path.splitext(path)[1]
+    for codec in STORAGE_CODECS.values():
+        if codec.extension == extension:
+            return codec
+    raise ValueError(f"Unknown stored image format '{extension}'.")
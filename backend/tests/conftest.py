@@ -0,0 +1,47 @@
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+# the backend modules import each other by their flat names, as when the server runs from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def png_bytes(image_array: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    Image.fromarray(image_array).save(buf, format='PNG')
+    return buf.getvalue()
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """
+    The app with its image directories, caches and job queue fresh for each test.
+    """
+    monkeypatch.chdir(tmp_path) # main creates its image directories in the working directory on import
+    import main
+    from cache import DecodedImageCache, ResultCache
+    from jobs import JobQueue
+
+    for name, directory in [('IMAGE_DIR', 'images'), ('HISTOGRAM_DIR', 'histograms')]:
+        (tmp_path / directory).mkdir(exist_ok=True)
+        monkeypatch.setattr(main, name, str(tmp_path / directory))
+    monkeypatch.setattr(main, 'result_cache', ResultCache(max_size=16))
+    monkeypatch.setattr(main, 'decoded_image_cache', DecodedImageCache(max_size=1 << 24))
+    monkeypatch.setattr(main, 'job_queue', JobQueue(max_running=1, max_queued=2, max_history=16, retry_after=1))
+
+    with TestClient(main.app) as client: # one event loop for the test, so async jobs keep running between requests
+        yield client
+
+@pytest.fixture
+def upload(api):
+    """
+    Uploads an array as PNG and returns the image ID.
+    """
+    def upload_array(image_array: np.ndarray) -> str:
+        response = api.post('/images/', files={'file': ('image.png', png_bytes(image_array), 'image/png')})
+        assert response.status_code == 201, response.text
+        return response.json()['image_id']
+    return upload_array
@@ -0,0 +1,74 @@
+import time
+
+import numpy as np
+import pytest
+
+import image_utils
+from executor import ComputeExecutor, ExecutorBusy
+from image_utils import run_array_operation
+from operations import AdvancedEdgeDetectionOperation, FilteringOperation, HistogramEqualizationOperation, SingleImageOperation
+
+BANDED_OPERATIONS = [
+    ('histogram_equalization', HistogramEqualizationOperation(mode='grayscale')),
+    ('advanced_edge_detection', AdvancedEdgeDetectionOperation(operator='difference', contrast_based=False, threshold=10, kernel_size=3)),
+    ('advanced_edge_detection', AdvancedEdgeDetectionOperation(operator='variance', contrast_based=True, smoothing_kernel_size=5, thresholding=True, threshold=20, kernel_size=7)),
+    ('advanced_edge_detection', AdvancedEdgeDetectionOperation(operator='gaussian_2', contrast_based=False)),
+    ('filtering', FilteringOperation(mode='median', kernel_size=7)),
+    ('filtering', FilteringOperation(mode='high', kernel_size=3)),
+    ('single_operation', SingleImageOperation(operation='invert')),
+]
+
+@pytest.fixture
+def rgb():
+    return np.random.default_rng(0).integers(0, 256, (61, 45, 3), dtype=np.uint8)
+
+@pytest.fixture
+def small_executor(monkeypatch):
+    executor = ComputeExecutor(process_workers=1, thread_workers=1, max_queue_depth=2, retry_after=3)
+    monkeypatch.setattr(image_utils, 'compute_executor', executor)
+    yield executor
+    executor.shutdown()
+
+def wait_until_idle(executor, timeout=10):
+    deadline = time.monotonic() + timeout
+    while executor.pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return executor.pending
+
+@pytest.mark.parametrize("workers", [2, 3, 7])
+@pytest.mark.parametrize("operation_type, operation", BANDED_OPERATIONS)
+def test_workers_bands_equal_one_worker(rgb, workers, operation_type, operation):
+    whole = run_array_operation(operation_type, rgb, operation)
+    banded = run_array_operation(operation_type, rgb, operation.model_copy(update={'workers': workers}))
+    assert banded.dtype == whole.dtype
+    np.testing.assert_array_equal(banded, whole)
+
+def test_python_bound_bands_go_through_the_compute_executor(rgb, monkeypatch, small_executor):
+    monkeypatch.setattr(image_utils, 'CV2_MEDIAN_MAX_KERNEL', 1) # send median bands to processes
+    submitted = []
+    submit = small_executor.submit
+
+    def counting_submit(operation_type, *args, **kwargs):
+        future = submit(operation_type, *args, **kwargs) # ExecutorBusy while the queue is full
+        submitted.append(operation_type)
+        return future
+
+    monkeypatch.setattr(small_executor, 'submit', counting_submit)
+
+    operation = FilteringOperation(mode='median', kernel_size=5)
+    banded = run_array_operation('filtering', rgb, operation.model_copy(update={'workers': 5}))
+    np.testing.assert_array_equal(banded, run_array_operation('filtering', rgb, operation))
+    assert submitted == ['bands'] * 5 # more bands than the queue holds, each waiting for a place
+    assert wait_until_idle(small_executor) == 0
+
+def test_bands_get_executor_busy_only_without_bands_of_their_own(small_executor):
+    blockers = [small_executor.submit('bands', time.sleep, 0.5) for _ in range(2)]
+    with pytest.raises(ExecutorBusy):
+        small_executor.band_submitter()(abs, -1)
+    for future in blockers:
+        future.result()
+
+    submit_band = small_executor.band_submitter()
+    bands = [submit_band(abs, -band) for band in range(4)]
+    assert [band.result() for band in bands] == [0, 1, 2, 3]
+    assert wait_until_idle(small_executor) == 0
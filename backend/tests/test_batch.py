@@ -0,0 +1,42 @@
+import json
+
+import numpy as np
+import pytest
+
+@pytest.fixture
+def image_ids(upload):
+    return [upload(np.random.default_rng(seed).integers(0, 256, (20 + seed, 30, 3), dtype=np.uint8)) for seed in range(4)]
+
+def ndjson(response) -> list:
+    return [json.loads(line) for line in response.text.splitlines()]
+
+def test_batch_streams_one_line_per_image(api, image_ids):
+    response = api.post('/images/batch/filtering', json={'image_ids': image_ids + ['nope'], 'operation': {'mode': 'low', 'kernel_size': 3}})
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+
+    lines = {line['image_id']: line for line in ndjson(response)}
+    assert sorted(lines) == sorted(image_ids + ['nope'])
+    assert (lines['nope']['status_code'], lines['nope']['error']) == (404, 'Image not found')
+    for image_id in image_ids:
+        single = api.post(f'/images/{image_id}/filtering', json={'mode': 'low', 'kernel_size': 3}).json()
+        assert lines[image_id]['status_code'] == 201
+        assert lines[image_id]['result'] == single # same results as single requests, from the result cache
+
+def test_failed_image_does_not_cut_the_stream(api, image_ids, monkeypatch):
+    import main
+    apply_transformation = main.apply_transformation
+
+    async def failing_first(image_id, *args, **kwargs):
+        if image_id == image_ids[0]:
+            raise RuntimeError("boom")
+        return await apply_transformation(image_id, *args, **kwargs)
+
+    monkeypatch.setattr(main, 'apply_transformation', failing_first)
+    lines = ndjson(api.post('/images/batch/grayscale', json={'image_ids': image_ids, 'operation': {'mode': 'luminosity'}}))
+    assert sorted(line['status_code'] for line in lines) == [201, 201, 201, 500]
+
+def test_invalid_batches_are_rejected_before_streaming(api, image_ids):
+    assert api.post('/images/batch/grayscale', json={'image_ids': image_ids, 'operation': {'mode': 'bogus'}}).status_code == 422
+    assert api.post('/images/batch/nothing', json={'image_ids': image_ids, 'operation': {}}).status_code == 400
+    assert api.post('/images/batch/grayscale', json={'image_ids': [], 'operation': {'mode': 'luminosity'}}).status_code == 422
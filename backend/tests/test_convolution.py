@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from convolution import convolve, filter2d, rank_one_terms, separable_filter, separable_is_cheaper
+
+def rank_one_kernel(size: int, rng: np.random.Generator) -> np.ndarray:
+    return np.outer(rng.normal(size=size), rng.normal(size=size))
+
+@pytest.mark.parametrize("size", [3, 7, 15])
+def test_separable_matches_direct_on_rank_one_kernel(size):
+    rng = np.random.default_rng(size)
+    kernel = rank_one_kernel(size, rng)
+    terms = rank_one_terms(kernel)
+    assert terms is not None
+
+    image = rng.uniform(0, 255, (64, 48, 3)).astype(np.float32)
+    np.testing.assert_allclose(separable_filter(image, terms), filter2d(image, kernel), rtol=1e-4, atol=1e-3)
+
+@pytest.mark.parametrize("size", [3, 7, 15])
+def test_convolve_rank_one_kernel_matches_filter2d_on_8_bit_images(size):
+    rng = np.random.default_rng(size)
+    kernel = rank_one_kernel(size, rng) / size
+    image = rng.integers(0, 256, (64, 48), dtype=np.uint8)
+
+    difference = convolve(image, kernel).astype(int) - filter2d(image, kernel)
+    assert np.abs(difference).max() <= 1 # rounding of the float sums in a different order
+
+def test_rank_one_terms_rejects_full_rank_kernels():
+    assert rank_one_terms(np.eye(5)) is None
+
+def test_separable_is_cheaper_counts_taps():
+    assert not separable_is_cheaper(3, 2)
+    assert separable_is_cheaper(3, 1)
+    assert separable_is_cheaper(15, 7)
+    assert not separable_is_cheaper(15, 8)
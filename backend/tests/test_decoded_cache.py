@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import pytest
+
+from cache import DecodedImage, DecodedImageCache
+
+@pytest.fixture
+def main(api):
+    import main # after api moved to the test's working directory
+    return main
+
+@pytest.fixture
+def decodes(main, monkeypatch):
+    """
+    Paths of the stored images the app decodes, in order.
+    """
+    paths = []
+    read = main.read_decoded_image
+    monkeypatch.setattr(main, 'read_decoded_image', lambda image_path: paths.append(image_path) or read(image_path))
+    return paths
+
+@pytest.fixture
+def image_id(upload):
+    return upload(np.random.default_rng(0).integers(0, 256, (30, 40, 3), dtype=np.uint8))
+
+def test_source_is_decoded_once_for_many_operations(api, image_id, decodes):
+    for operation in ({'mode': 'low', 'kernel_size': 3}, {'mode': 'high', 'kernel_size': 3}, {'mode': 'median', 'kernel_size': 5}):
+        assert api.post(f'/images/{image_id}/filtering', json=operation).status_code == 201
+    assert len(decodes) == 1
+
+    decoded_images = api.get('/cache/stats').json()['decoded_images']
+    assert (decoded_images['hits'], decoded_images['misses']) == (2, 1)
+
+def test_results_are_cached_from_the_array_in_hand(api, main, image_id, decodes):
+    gray_id = api.post(f'/images/{image_id}/grayscale', json={'mode': 'luminosity'}).json()['image_id']
+    inverted = api.post(f'/images/{gray_id}/single_operation', json={'operation': 'invert'})
+    assert inverted.status_code == 201
+    assert len(decodes) == 1 # the source only
+
+    cached = main.decoded_image_cache.get(gray_id)
+    assert cached is not None and not cached.array.flags.writeable # shared by every request
+
+def test_cached_array_matches_the_stored_image(api, main, image_id):
+    gray_id = api.post(f'/images/{image_id}/grayscale', json={'mode': 'lightness'}).json()['image_id']
+    cached = main.decoded_image_cache.get(gray_id)
+    np.testing.assert_array_equal(main.read_decoded_image(os.path.join(main.IMAGE_DIR, f'{gray_id}.png')).array, cached.array)
+
+def test_deleting_an_image_drops_it_from_the_cache(api, main, image_id, decodes):
+    api.post(f'/images/{image_id}/grayscale', json={'mode': 'lightness'})
+    assert api.delete(f'/images/{image_id}').status_code == 204
+    assert main.decoded_image_cache.get(image_id) is None
+    assert api.post(f'/images/{image_id}/grayscale', json={'mode': 'lightness'}).status_code == 404
+
+def test_decoded_image_cache_is_bounded_by_pixel_bytes():
+    cache = DecodedImageCache(max_size=250)
+    for key in 'abc':
+        cache.put(key, DecodedImage(np.zeros(100, dtype=np.uint8), key))
+    assert list(cache.entries) == ['b', 'c']
+    assert cache.stats()['resident_bytes'] == 200
+
+    cache.put('big', DecodedImage(np.zeros(251, dtype=np.uint8), 'big')) # larger than the whole cache
+    assert 'big' not in cache.entries and cache.size == 200
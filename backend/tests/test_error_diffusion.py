@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+import error_diffusion
+from error_diffusion import ERROR_DIFFUSION_KERNELS, _diffuse_pixels, wavefront_slope
+
+def floyd_steinberg_before(image_array, threshold):
+    # the per-pixel grayscale loop the engine replaced
+    image_array = np.array(image_array, dtype=float)
+    height, width = image_array.shape
+    for y in range(height):
+        for x in range(width):
+            old_pixel = image_array[y, x]
+            new_pixel = 255 if old_pixel > threshold else 0
+            image_array[y, x] = new_pixel
+            quant_error = old_pixel - new_pixel
+            for dy, dx, coefficient in ((0, 1, 7 / 16), (1, -1, 3 / 16), (1, 0, 5 / 16), (1, 1, 1 / 16)):
+                ny, nx = y + dy, x + dx
+                if 0 <= ny < height and 0 <= nx < width:
+                    image_array[ny, nx] += quant_error * coefficient
+    return np.clip(image_array, 0, 255)
+
+def pixel_by_pixel(image_array, thresholds, kernel, serpentine):
+    buffer = np.array(image_array, dtype=np.float64).reshape(image_array.shape[:2] + (-1,))
+    weights = ERROR_DIFFUSION_KERNELS[kernel]
+    _diffuse_pixels(buffer, np.array(thresholds, dtype=np.float64), [dy for dy, _, _ in weights],
+                    [dx for _, dx, _ in weights], np.array([weight for _, _, weight in weights]), serpentine)
+    return buffer.reshape(image_array.shape)
+
+@pytest.fixture(params=[(1, 1), (1, 9), (9, 1), (23, 31), (31, 23, 3)])
+def image(request):
+    return np.random.default_rng(sum(request.param)).integers(0, 256, request.param, dtype=np.uint8)
+
+def thresholds_for(image):
+    return (128,) if image.ndim == 2 else (96, 128, 160)
+
+def test_floyd_steinberg_matches_the_loop_it_replaced():
+    image = np.random.default_rng(0).integers(0, 256, (37, 29), dtype=np.uint8)
+    np.testing.assert_array_equal(np.clip(error_diffusion.error_diffusion(image, (100,)), 0, 255), floyd_steinberg_before(image, 100))
+
+@pytest.mark.parametrize("kernel", list(ERROR_DIFFUSION_KERNELS))
+@pytest.mark.parametrize("serpentine", [False, True])
+def test_engine_matches_pixel_by_pixel_scan(image, kernel, serpentine):
+    expected = pixel_by_pixel(image, thresholds_for(image), kernel, serpentine)
+    np.testing.assert_array_equal(error_diffusion.error_diffusion(image, thresholds_for(image), kernel, serpentine), expected)
+
+@pytest.mark.parametrize("kernel", list(ERROR_DIFFUSION_KERNELS))
+def test_wavefront_strips_match_one_pass(monkeypatch, kernel):
+    image = np.random.default_rng(1).integers(0, 256, (70, 40, 3), dtype=np.uint8)
+    expected = error_diffusion.error_diffusion(image, (96, 128, 160), kernel)
+    monkeypatch.setattr(error_diffusion, 'ERROR_DIFFUSION_STRIP_BYTES', 1) # smallest strips
+    np.testing.assert_array_equal(error_diffusion.error_diffusion(image, (96, 128, 160), kernel), expected)
+
+def test_wavefront_slope_orders_every_tap_before_its_target():
+    assert wavefront_slope(ERROR_DIFFUSION_KERNELS['floyd_steinberg']) == 2
+    assert wavefront_slope(ERROR_DIFFUSION_KERNELS['stucki']) == 4
+
+def test_rejects_unknown_kernels_and_threshold_counts():
+    with pytest.raises(ValueError):
+        error_diffusion.error_diffusion(np.zeros((2, 2), dtype=np.uint8), (128,), 'atkinson')
+    with pytest.raises(ValueError):
+        error_diffusion.error_diffusion(np.zeros((2, 2, 3), dtype=np.uint8), (128,))
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+@pytest.fixture
+def main(api):
+    import main # after api moved to the test's working directory
+    return main
+
+@pytest.fixture
+def release(main, monkeypatch):
+    """
+    Filtering requests wait until this event is set, holding their job's slot.
+    """
+    event = threading.Event()
+    apply_transformation = main.apply_transformation
+
+    async def held_transformation(image_id, operation, operation_type, progress=None):
+        while operation_type == 'filtering' and not event.is_set():
+            await asyncio.sleep(0.01)
+        return await apply_transformation(image_id, operation, operation_type, progress=progress)
+
+    monkeypatch.setattr(main, 'apply_transformation', held_transformation)
+    yield event
+    event.set()
+
+@pytest.fixture
+def image_id(upload):
+    return upload(np.random.default_rng(0).integers(0, 256, (30, 40, 3), dtype=np.uint8))
+
+def wait_for_job(api, job_id, statuses=('succeeded', 'failed', 'cancelled'), timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = api.get(f'/jobs/{job_id}').json()
+        if job['status'] in statuses or time.monotonic() > deadline:
+            return job
+        time.sleep(0.01)
+
+def test_async_request_returns_a_job_with_the_synchronous_result(api, image_id):
+    response = api.post(f'/images/{image_id}/grayscale?async=true', json={'mode': 'luminosity'})
+    assert response.status_code == 202
+    job_id = response.json()['job_id']
+    assert response.headers['location'] == f'/jobs/{job_id}'
+
+    job = wait_for_job(api, job_id)
+    assert (job['status'], job['status_code'], job['progress']) == ('succeeded', 201, 1.0)
+    assert job['started_at'] <= job['finished_at']
+    assert api.post(f'/images/{image_id}/grayscale', json={'mode': 'luminosity'}).json() == job['result']
+
+def test_async_pipeline_and_multi_image_jobs(api, image_id):
+    steps = [{'operation_type': 'grayscale', 'operation': {'mode': 'luminosity'}},
+             {'operation_type': 'filtering', 'operation': {'mode': 'low', 'kernel_size': 3}}]
+    pipeline = api.post(f'/images/{image_id}/pipeline?async=true', json={'steps': steps}).json()
+    multi = api.post('/images/multi_operation?async=true', json={'images': [image_id, image_id], 'operation': 'add'}).json()
+    for job_id in (pipeline['job_id'], multi['job_id']):
+        assert wait_for_job(api, job_id)['status'] == 'succeeded'
+
+def test_failed_job_reports_the_error(api, image_id, release):
+    job_id = api.post(f'/images/{image_id}/filtering?async=true', json={'mode': 'low', 'kernel_size': 3}).json()['job_id']
+    assert api.delete(f'/images/{image_id}').status_code == 204 # before the job gets to read it
+    release.set()
+    job = wait_for_job(api, job_id)
+    assert (job['status'], job['status_code'], job['error']) == ('failed', 404, 'Image not found')
+
+def test_unknown_images_and_jobs_fail_right_away(api):
+    assert api.post('/images/nope/grayscale?async=true', json={'mode': 'luminosity'}).status_code == 404
+    assert api.get('/jobs/nope').status_code == 404
+    assert api.delete('/jobs/nope').status_code == 404
+
+def test_cancel_queued_and_running_jobs(api, image_id, release):
+    running = api.post(f'/images/{image_id}/filtering?async=true', json={'mode': 'low', 'kernel_size': 3}).json()['job_id']
+    assert wait_for_job(api, running, statuses=('running',))['status'] == 'running'
+    queued = api.post(f'/images/{image_id}/grayscale?async=true', json={'mode': 'luminosity'}).json()['job_id']
+    assert api.get(f'/jobs/{queued}').json()['status'] == 'queued' # one job runs at a time in these tests
+
+    cancelled = api.delete(f'/jobs/{queued}').json()
+    assert (cancelled['status'], cancelled['progress']) == ('cancelled', 0.0)
+    api.delete(f'/jobs/{running}')
+    assert wait_for_job(api, running)['status'] == 'cancelled'
+
+    assert api.get('/cache/stats').json()['jobs']['running'] == 0
+    finished = api.post(f'/images/{image_id}/grayscale?async=true', json={'mode': 'luminosity'}).json()['job_id']
+    assert wait_for_job(api, finished)['status'] == 'succeeded'
+    assert api.delete(f'/jobs/{finished}').json()['status'] == 'succeeded' # finished jobs are left as they are
+
+def test_full_job_queue_asks_to_retry(api, image_id, release):
+    for _ in range(3): # one running, two queued
+        assert api.post(f'/images/{image_id}/filtering?async=true', json={'mode': 'low', 'kernel_size': 3}).status_code == 202
+    response = api.post(f'/images/{image_id}/filtering?async=true', json={'mode': 'low', 'kernel_size': 3})
+    assert response.status_code == 503
+    assert response.headers['retry-after'] == '1'
+
+def test_progress_counts_pipeline_steps(api, image_id, main, monkeypatch):
+    fractions = []
+    apply_pipeline_steps = main.apply_pipeline_steps
+
+    async def recording_pipeline(*args, progress=None):
+        result = await apply_pipeline_steps(*args, progress=progress)
+        fractions.append(progress.read())
+        return result
+
+    monkeypatch.setattr(main, 'apply_pipeline_steps', recording_pipeline)
+    steps = [{'operation_type': 'single_operation', 'operation': {'operation': 'invert'}},
+             {'operation_type': 'filtering', 'operation': {'mode': 'median', 'kernel_size': 3}}]
+    job_id = api.post(f'/images/{image_id}/pipeline?async=true', json={'steps': steps}).json()['job_id']
+    assert wait_for_job(api, job_id)['status'] == 'succeeded'
+    assert fractions == [(2, 2)]
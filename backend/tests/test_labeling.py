@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from labeling import label_components
+
+NEIGHBOURS = {
+    4: [(-1, 0), (0, -1), (0, 1), (1, 0)],
+    8: [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)],
+}
+
+def flood_fill_labels(mask: np.ndarray, connectivity: int) -> np.ndarray:
+    # the stack flood fill label_components replaced, with its raster-order labels
+    labeled_image = np.zeros(mask.shape, dtype=int)
+    remaining = mask.copy()
+    rows, cols = mask.shape
+    label = 1
+    for i in range(rows):
+        for j in range(cols):
+            if not remaining[i, j]:
+                continue
+            stack = [(i, j)]
+            remaining[i, j] = False
+            labeled_image[i, j] = label
+            while stack:
+                x, y = stack.pop()
+                for dx, dy in NEIGHBOURS[connectivity]:
+                    nx, ny = x + dx, y + dy
+                    if 0 <= nx < rows and 0 <= ny < cols and remaining[nx, ny]:
+                        remaining[nx, ny] = False
+                        labeled_image[nx, ny] = label
+                        stack.append((nx, ny))
+            label += 1
+    return labeled_image
+
+def random_mask(density: float, seed: int, shape=(47, 61)) -> np.ndarray:
+    return np.random.default_rng(seed).random(shape) < density
+
+@pytest.mark.parametrize("connectivity", [4, 8])
+@pytest.mark.parametrize("density", [0.2, 0.45, 0.6, 0.9])
+def test_labels_match_flood_fill(connectivity, density):
+    mask = random_mask(density, seed=int(density * 100))
+    labeled_image, regions = label_components(mask, connectivity)
+    np.testing.assert_array_equal(labeled_image, flood_fill_labels(mask, connectivity))
+    assert len(regions) == labeled_image.max()
+
+@pytest.mark.parametrize("connectivity", [4, 8])
+def test_region_stats_match_the_labeled_pixels(connectivity):
+    labeled_image, regions = label_components(random_mask(0.5, seed=3), connectivity)
+    for region in regions:
+        ys, xs = np.nonzero(labeled_image == region["label"])
+        assert region["area"] == len(xs)
+        assert region["bbox"] == (xs.min(), ys.min(), xs.max() + 1, ys.max() + 1)
+        assert region["centroid"] == pytest.approx((xs.mean(), ys.mean()))
+
+def test_diagonal_neighbours_join_only_with_8_connectivity():
+    mask = np.eye(4, dtype=bool)
+    assert len(label_components(mask, 8)[1]) == 1
+    assert len(label_components(mask, 4)[1]) == 4
+
+def test_runs_joined_through_a_later_row_share_a_label():
+    mask = np.array([[1, 0, 1],
+                     [1, 0, 1],
+                     [1, 1, 1]], dtype=bool)
+    labeled_image, regions = label_components(mask, 4)
+    assert len(regions) == 1
+    np.testing.assert_array_equal(labeled_image, mask.astype(np.int32))
+
+def test_empty_and_full_masks():
+    labeled_image, regions = label_components(np.zeros((5, 7), dtype=bool))
+    assert regions == [] and not labeled_image.any()
+
+    labeled_image, regions = label_components(np.ones((5, 7), dtype=bool))
+    assert (labeled_image == 1).all()
+    assert regions[0]["area"] == 35 and regions[0]["bbox"] == (0, 0, 7, 5)
+
+def test_rejects_other_connectivity():
+    with pytest.raises(ValueError):
+        label_components(np.ones((2, 2), dtype=bool), 6)
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from numpy.lib.stride_tricks import sliding_window_view
+
+from local_stats import local_range, local_variance
+
+def reflect_windows(image: np.ndarray, kernel_size: int) -> np.ndarray:
+    padded = np.pad(image, pad_width=kernel_size // 2, mode='reflect')
+    return sliding_window_view(padded, (kernel_size, kernel_size))
+
+@pytest.fixture
+def gray():
+    return np.random.default_rng(0).integers(0, 256, (41, 33), dtype=np.uint8)
+
+@pytest.mark.parametrize("kernel_size", [3, 5, 11, 31])
+def test_variance_matches_sliding_window_variance(gray, kernel_size):
+    expected = np.var(reflect_windows(gray, kernel_size).astype(np.float64), axis=(2, 3))
+    np.testing.assert_allclose(local_variance(gray, kernel_size), expected, rtol=1e-12, atol=1e-9)
+
+def test_variance_of_constant_windows_is_exactly_zero():
+    assert not local_variance(np.full((9, 9), 200, dtype=np.uint8), 5).any()
+
+@pytest.mark.parametrize("kernel_size", [3, 4, 5, 11, 31])
+def test_range_matches_sliding_window_max_minus_min(gray, kernel_size):
+    windows = reflect_windows(gray, kernel_size)
+    expected = np.max(windows, axis=(2, 3)) - np.min(windows, axis=(2, 3))
+    result = local_range(gray, kernel_size)
+    assert result.dtype == gray.dtype
+    np.testing.assert_array_equal(result, expected)
+
+def test_range_on_float_images():
+    image = np.random.default_rng(1).normal(size=(20, 27))
+    windows = reflect_windows(image, 7)
+    np.testing.assert_array_equal(local_range(image, 7), np.max(windows, axis=(2, 3)) - np.min(windows, axis=(2, 3)))
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from numpy.lib.stride_tricks import sliding_window_view
+
+import median
+from median import median_filter
+
+def reference_median(channel: np.ndarray, kernel_size: int) -> np.ndarray:
+    pad = kernel_size // 2
+    windows = sliding_window_view(np.pad(channel, pad), (kernel_size, kernel_size))
+    return np.median(windows, axis=(-2, -1))
+
+def reference_median_filter(image: np.ndarray, kernel_size: int) -> np.ndarray:
+    if image.ndim == 2:
+        return reference_median(image, kernel_size)
+    return np.stack([reference_median(image[:, :, c], kernel_size) for c in range(image.shape[2])], axis=2)
+
+@pytest.fixture
+def rgb():
+    return np.random.default_rng(0).integers(0, 256, (37, 29, 3), dtype=np.uint8)
+
+@pytest.mark.parametrize("kernel_size", [3, 5, 9])
+def test_cv2_path_matches_sliding_window_median(rgb, kernel_size):
+    result = median_filter(rgb, kernel_size)
+    assert result.dtype == np.uint8
+    np.testing.assert_array_equal(result, reference_median_filter(rgb, kernel_size))
+
+@pytest.mark.parametrize("kernel_size", [3, 7, 41])
+def test_running_histogram_path_matches_sliding_window_median(rgb, monkeypatch, kernel_size):
+    monkeypatch.setattr(median, 'CV2_MEDIAN_MAX_KERNEL', 1) # route every 8-bit kernel past cv2
+    np.testing.assert_array_equal(median_filter(rgb, kernel_size), reference_median_filter(rgb, kernel_size))
+
+@pytest.mark.parametrize("dtype", [np.uint16, np.float32])
+@pytest.mark.parametrize("kernel_size", [3, 5])
+def test_cv2_path_for_other_dtypes(dtype, kernel_size):
+    gray = np.random.default_rng(1).integers(0, 60000, (31, 23)).astype(dtype)
+    np.testing.assert_array_equal(median_filter(gray, kernel_size), reference_median(gray, kernel_size))
+
+@pytest.mark.parametrize("kernel_size", [7, 9])
+def test_windowed_path_matches_in_bounded_blocks(monkeypatch, kernel_size):
+    gray = np.random.default_rng(2).uniform(0, 1, (31, 23)).astype(np.float32)
+    expected = reference_median(gray, kernel_size)
+    np.testing.assert_array_equal(median_filter(gray, kernel_size), expected)
+
+    # a budget below one image row of windows splits the rows into column blocks as well
+    monkeypatch.setattr(median, 'WINDOW_ELEMENTS_BUDGET', 5 * kernel_size * kernel_size)
+    np.testing.assert_array_equal(median_filter(gray, kernel_size), expected)
+
+def test_median_filter_rejects_other_shapes():
+    with pytest.raises(ValueError):
+        median_filter(np.zeros(5, dtype=np.uint8), 3)
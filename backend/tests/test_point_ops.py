@@ -0,0 +1,82 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from histogram import compute_histogram
+from image_utils import PointChain, run_array_operation, run_pipeline
+from operations import (GrayscaleOperation, HalftoningOperation, HistogramEqualizationOperation,
+                        HistogramSmoothingOperation, PipelineStep, SingleImageOperation)
+from point_ops import INVERT, LUMINOSITY, LookupTable, channel_table, threshold_table
+
+@pytest.fixture
+def rgb():
+    return np.random.default_rng(0).integers(0, 256, (40, 30, 3), dtype=np.uint8)
+
+@pytest.fixture
+def gray():
+    return np.random.default_rng(1).integers(0, 256, (40, 30), dtype=np.uint8)
+
+def test_luminosity_is_the_integer_floor_of_the_weighted_sum(rgb):
+    expected = (rgb.astype(np.int64) @ np.array([21, 72, 7])) // 100
+    np.testing.assert_array_equal(LUMINOSITY.apply(rgb), expected)
+
+def test_luminosity_differs_from_the_float_dot_by_at_most_one_level(rgb):
+    old = np.uint8(rgb.dot(np.array([0.21, 0.72, 0.07])))
+    assert np.abs(LUMINOSITY.apply(rgb).astype(int) - old).max() <= 1
+
+def test_invert_matches_per_pixel_output(rgb, gray):
+    np.testing.assert_array_equal(INVERT.apply(rgb), 255 - rgb)
+    np.testing.assert_array_equal(INVERT.apply(gray), 255 - gray)
+
+def test_threshold_tables_match_per_pixel_output(rgb, gray):
+    np.testing.assert_array_equal(threshold_table(100).apply(gray), np.where(gray > 100, 255, 0))
+    expected = np.stack([np.where(rgb[:, :, c] > t, 255, 0) for c, t in enumerate((50, 128, 200))], axis=2)
+    np.testing.assert_array_equal(threshold_table((50, 128, 200)).apply(rgb), expected)
+
+def test_channel_table_leaves_other_channels_unchanged(rgb):
+    result = channel_table(255 - np.arange(256), 1, 3).apply(rgb)
+    np.testing.assert_array_equal(result[:, :, 1], 255 - rgb[:, :, 1])
+    np.testing.assert_array_equal(result[:, :, [0, 2]], rgb[:, :, [0, 2]])
+
+def test_composed_tables_equal_applying_them_in_turn(rgb):
+    square = LookupTable(np.arange(256) ** 2 // 255)
+    per_channel = threshold_table((50, 128, 200))
+    for first, second in [(INVERT, square), (per_channel, INVERT), (INVERT, per_channel)]:
+        np.testing.assert_array_equal(first.then(second).apply(rgb), second.apply(first.apply(rgb)))
+    np.testing.assert_array_equal(LUMINOSITY.then(INVERT).apply(rgb), INVERT.apply(LUMINOSITY.apply(rgb)))
+
+def test_mapped_histograms_equal_those_of_the_mapped_image(rgb):
+    table = threshold_table((50, 128, 200)).then(INVERT)
+    np.testing.assert_array_equal(table.map_histograms(compute_histogram(rgb)).counts, compute_histogram(table.apply(rgb)).counts)
+
+def test_lookup_tables_reject_other_dtypes():
+    with pytest.raises(ValueError):
+        INVERT.apply(np.zeros((2, 2), dtype=np.float32))
+
+POINT_STEPS = [
+    ('grayscale', GrayscaleOperation(mode='luminosity')),
+    ('single_operation', SingleImageOperation(operation='invert')),
+    ('halftoning', HalftoningOperation(mode='grayscale', method='thresholding', threshold=100)),
+    ('halftoning', HalftoningOperation(mode='RGB', method='thresholding', threshold=(50, 128, 200))),
+    ('histogram_equalization', HistogramEqualizationOperation(mode='grayscale')),
+    ('histogram_smoothing', HistogramSmoothingOperation(mode='grayscale', kernel_size=5)),
+    ('histogram_smoothing', HistogramSmoothingOperation(mode='RGB', kernel_size=3)),
+]
+
+@pytest.mark.parametrize("steps", list(itertools.product(POINT_STEPS, repeat=3)))
+def test_fused_pipeline_equals_steps_one_by_one(rgb, steps):
+    expected = rgb
+    for operation_type, operation in steps:
+        expected = run_array_operation(operation_type, expected, operation)
+
+    outputs = run_pipeline(rgb, [PipelineStep(operation_type=operation_type, operation=operation) for operation_type, operation in steps])
+    assert not isinstance(outputs, dict), outputs
+    np.testing.assert_array_equal(outputs[-1][1].array, expected)
+
+def test_point_chain_fuses_consecutive_tables(rgb):
+    chain = PointChain(rgb)
+    assert chain.add('single_operation', SingleImageOperation(operation='invert'))
+    assert chain.add('halftoning', HalftoningOperation(mode='RGB', method='thresholding', threshold=(50, 128, 200)))
+    assert chain.image_array is rgb # nothing applied until the chain is flushed
+    np.testing.assert_array_equal(chain.flush(), np.where(255 - rgb > np.array([50, 128, 200]), 255, 0))
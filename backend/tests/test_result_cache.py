@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from cache import ResultCache, operation_key
+from operations import FilteringOperation
+
+@pytest.fixture
+def image_id(upload):
+    return upload(np.random.default_rng(0).integers(0, 256, (30, 40, 3), dtype=np.uint8))
+
+def test_repeated_request_returns_the_stored_result(api, image_id):
+    first = api.post(f'/images/{image_id}/filtering', json={'mode': 'low', 'kernel_size': 3})
+    again = api.post(f'/images/{image_id}/filtering', json={'kernel_size': 3, 'mode': 'low', 'workers': 2})
+    assert first.status_code == again.status_code == 201
+    assert again.json() == first.json()
+
+    results = api.get('/cache/stats').json()['results']
+    assert (results['entries'], results['hits'], results['misses']) == (1, 1, 1)
+
+def test_other_parameters_or_sources_are_computed_again(api, upload, image_id):
+    low = api.post(f'/images/{image_id}/filtering', json={'mode': 'low', 'kernel_size': 3}).json()
+    high = api.post(f'/images/{image_id}/filtering', json={'mode': 'high', 'kernel_size': 3}).json()
+    other_id = upload(np.zeros((30, 40, 3), dtype=np.uint8))
+    other = api.post(f'/images/{other_id}/filtering', json={'mode': 'low', 'kernel_size': 3}).json()
+    assert len({low['image_id'], high['image_id'], other['image_id']}) == 3
+
+def test_same_pixels_uploaded_twice_share_results(api, upload):
+    pixels = np.random.default_rng(1).integers(0, 256, (20, 20), dtype=np.uint8)
+    first = api.post(f'/images/{upload(pixels)}/grayscale', json={'mode': 'luminosity'}).json()
+    second = api.post(f'/images/{upload(pixels)}/grayscale', json={'mode': 'luminosity'}).json()
+    assert first['image_id'] == second['image_id']
+
+def test_deleted_result_is_computed_again(api, image_id):
+    first = api.post(f'/images/{image_id}/grayscale', json={'mode': 'lightness'}).json()
+    assert api.delete(f"/images/{first['image_id']}").status_code == 204
+    assert api.get('/cache/stats').json()['results']['entries'] == 0
+
+    again = api.post(f'/images/{image_id}/grayscale', json={'mode': 'lightness'})
+    assert again.status_code == 201 and again.json()['image_id'] != first['image_id']
+    assert api.get(f"/images/{again.json()['image_id']}").status_code == 200
+
+def test_multi_image_results_are_cached(api, upload, image_id):
+    other_id = upload(np.full((30, 40, 3), 7, dtype=np.uint8))
+    request = {'images': [image_id, other_id], 'operation': 'add'}
+    first = api.post('/images/multi_operation', json=request).json()
+    assert api.post('/images/multi_operation', json=request).json() == first
+    swapped = api.post('/images/multi_operation', json={**request, 'images': [other_id, image_id]}).json()
+    assert swapped['image_id'] != first['image_id'] # the key keeps the order of the sources
+
+def test_operation_key_ignores_field_order_and_workers():
+    key = operation_key('filtering', ['digest'], FilteringOperation(mode='low', kernel_size=3))
+    assert operation_key('filtering', ['digest'], FilteringOperation(kernel_size=3, mode='low', workers=4)) == key
+    assert operation_key('filtering', ['other'], FilteringOperation(mode='low', kernel_size=3)) != key
+
+def test_result_cache_evicts_the_least_recently_used_entry():
+    cache = ResultCache(max_size=2)
+    for key in 'abc':
+        cache.put(key, key)
+        cache.get('a')
+    assert list(cache.entries) == ['c', 'a']
+    assert cache.stats()['evictions'] == 1
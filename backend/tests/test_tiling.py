@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+import image_utils
+from image_utils import run_array_operation
+from operations import (AdvancedEdgeDetectionOperation, BasicEdgeDetectionOperation, FilteringOperation, GrayscaleOperation,
+                        HalftoningOperation, HistogramEqualizationOperation, HistogramSmoothingOperation, SingleImageOperation)
+from tiling import TilePlan, TilingConfig, band_shape, run_tiled, tile_grid
+
+TILED_OPERATIONS = [
+    ('grayscale', GrayscaleOperation(mode='lightness')),
+    ('halftoning', HalftoningOperation(mode='RGB', method='thresholding', threshold=(50, 128, 200))),
+    ('histogram_equalization', HistogramEqualizationOperation(mode='RGB')),
+    ('histogram_smoothing', HistogramSmoothingOperation(mode='grayscale', kernel_size=5)),
+    ('basic_edge_detection', BasicEdgeDetectionOperation(operator='sobel', thresholding=False, contrast_based=True, smoothing_kernel_size=5)),
+    ('advanced_edge_detection', AdvancedEdgeDetectionOperation(operator='homogeneity', contrast_based=False, threshold=10, kernel_size=5)),
+    ('advanced_edge_detection', AdvancedEdgeDetectionOperation(operator='gaussian_2', contrast_based=False)),
+    ('advanced_edge_detection', AdvancedEdgeDetectionOperation(operator='variance', contrast_based=True, smoothing_kernel_size=7, kernel_size=9)),
+    ('advanced_edge_detection', AdvancedEdgeDetectionOperation(operator='range', contrast_based=False, kernel_size=9)),
+    ('filtering', FilteringOperation(mode='median', kernel_size=31)),
+    ('single_operation', SingleImageOperation(operation='invert')),
+]
+
+@pytest.fixture
+def rgb():
+    return np.random.default_rng(0).integers(0, 256, (97, 131, 3), dtype=np.uint8)
+
+def run_with_tiling(monkeypatch, config, operation_type, image, operation):
+    monkeypatch.setattr(image_utils, 'tiling_config', config)
+    return run_array_operation(operation_type, image, operation)
+
+@pytest.mark.parametrize("tile_size, workers", [(16, 1), (37, 3)])
+@pytest.mark.parametrize("operation_type, operation", TILED_OPERATIONS)
+def test_tiled_run_equals_whole_image_run(monkeypatch, rgb, tile_size, workers, operation_type, operation):
+    whole = run_with_tiling(monkeypatch, TilingConfig(tile_size, 10**12, 1), operation_type, rgb, operation)
+    tiled = run_with_tiling(monkeypatch, TilingConfig(tile_size, 0, workers), operation_type, rgb, operation)
+    assert tiled.dtype == whole.dtype
+    np.testing.assert_array_equal(tiled, whole)
+
+def test_tiled_float_convolution_is_off_by_at_most_one(monkeypatch, rgb):
+    # cv2 rounds its float convolutions differently depending on the input size
+    operation = FilteringOperation(mode='low', kernel_size=25)
+    whole = run_with_tiling(monkeypatch, TilingConfig(16, 10**12, 1), 'filtering', rgb, operation)
+    tiled = run_with_tiling(monkeypatch, TilingConfig(16, 0, 1), 'filtering', rgb, operation)
+    assert np.abs(tiled.astype(int) - whole).max() <= 1
+
+def test_geometric_operations_run_on_the_whole_image(monkeypatch, rgb):
+    operation = SingleImageOperation(operation='rotate', angle=30)
+    result = run_with_tiling(monkeypatch, TilingConfig(16, 0, 1), 'single_operation', rgb, operation)
+    np.testing.assert_array_equal(result, run_array_operation('single_operation', rgb, operation))
+
+def test_tile_grid_covers_the_image_once():
+    coverage = np.zeros((23, 17), dtype=int)
+    for y0, y1, x0, x1 in tile_grid(23, 17, 5, 8):
+        coverage[y0:y1, x0:x1] += 1
+    assert (coverage == 1).all()
+
+def test_band_shape_never_makes_more_bands_than_asked():
+    assert band_shape(10, 7, 3) == (4, 7)
+    assert len(tile_grid(10, 7, *band_shape(10, 7, 3))) == 3
+    assert band_shape(2, 7, 5) == (1, 7)
+
+def test_run_tiled_folds_the_statistic_over_tile_cores():
+    image = np.arange(30 * 20, dtype=np.int64).reshape(30, 20)
+    plan = TilePlan(
+        halo=2,
+        func=lambda tile, total: np.full(tile.shape, total),
+        statistic=lambda tile, core: tile[core].sum()
+    )
+    np.testing.assert_array_equal(run_tiled(image, plan, (7, 6)), np.full(image.shape, image.sum()))
@@ -0,0 +1,92 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from conftest import png_bytes
+from storage import UploadLimits
+
+MAX_BYTES = 20000
+BOUNDARY = 'boundary'
+
+@pytest.fixture
+def main(api):
+    import main # after api moved to the test's working directory
+    return main
+
+@pytest.fixture
+def limited(main, monkeypatch):
+    """
+    A client for the app with an upload limit of MAX_BYTES bytes and 10000 pixels.
+    """
+    monkeypatch.setattr(main, 'upload_limits', UploadLimits(max_bytes=MAX_BYTES, max_pixels=10000))
+    return TestClient(main.UploadSizeLimit(main.app, paths={'/images/'}, max_bytes=MAX_BYTES))
+
+def multipart_body(data: bytes) -> bytes:
+    header = f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="image.png"\r\nContent-Type: image/png\r\n\r\n'
+    return header.encode() + data + f'\r\n--{BOUNDARY}--\r\n'.encode()
+
+def noise(height: int, width: int) -> np.ndarray:
+    return np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+def stored_images(main) -> list:
+    return os.listdir(main.IMAGE_DIR)
+
+def test_upload_within_the_limits_is_stored(limited, main):
+    response = limited.post('/images/', files={'file': ('image.png', png_bytes(np.zeros((100, 100), dtype=np.uint8)), 'image/png')})
+    assert response.status_code == 201
+    assert stored_images(main) == [f"{response.json()['image_id']}.png"]
+
+def test_upload_over_the_byte_limit_is_rejected_from_content_length(limited, main):
+    data = png_bytes(noise(90, 90))
+    assert len(data) > MAX_BYTES
+    response = limited.post('/images/', files={'file': ('image.png', data, 'image/png')})
+    assert response.status_code == 413
+    assert response.json()['detail'] == f'Upload exceeds the limit of {MAX_BYTES} bytes.'
+    assert stored_images(main) == []
+
+def test_upload_over_the_byte_limit_is_rejected_without_content_length(limited, main):
+    body = multipart_body(png_bytes(noise(90, 90)))
+    chunks = (body[i:i + 4096] for i in range(0, len(body), 4096))
+    response = limited.post('/images/', content=chunks, headers={'content-type': f'multipart/form-data; boundary={BOUNDARY}'})
+    assert 'content-length' not in response.request.headers
+    assert response.status_code == 413
+    assert stored_images(main) == []
+
+def test_malformed_content_length_is_a_bad_request(main):
+    messages = []
+    scope = {
+        'type': 'http', 'method': 'POST', 'path': '/images/', 'query_string': b'', 'root_path': '',
+        'headers': [(b'content-length', b'many'), (b'content-type', f'multipart/form-data; boundary={BOUNDARY}'.encode())],
+    }
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(main.UploadSizeLimit(main.app, paths={'/images/'}, max_bytes=MAX_BYTES)(scope, receive, send))
+    assert messages[0]['status'] == 400
+    assert messages[1]['body'] == b'{"detail":"Invalid Content-Length header."}'
+
+def test_image_over_the_pixel_limit_is_rejected_before_decoding(limited, main):
+    response = limited.post('/images/', files={'file': ('image.png', png_bytes(np.zeros((101, 100), dtype=np.uint8)), 'image/png')})
+    assert response.status_code == 413
+    assert stored_images(main) == []
+
+def test_decompression_bomb_is_rejected(api, main, tmp_path):
+    bomb = tmp_path / 'bomb.png'
+    Image.new('1', (10000, 10000)).save(bomb) # small file, over the default 89 MP limit
+    response = api.post('/images/', files={'file': ('bomb.png', bomb.read_bytes(), 'image/png')})
+    assert response.status_code == 413
+    assert stored_images(main) == []
+
+def test_undecodable_upload_reports_only_the_decode_error(api, main):
+    response = api.post('/images/', files={'file': ('image.png', b'garbage', 'image/png')})
+    assert response.status_code == 400
+    assert response.json()['detail'] == 'Cannot identify image file.'
+    assert stored_images(main) == []
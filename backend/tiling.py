@@ -0,0 +1,145 @@
+import functools
+import operator
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from executor import Progress
+
+class TilePlan(NamedTuple):
+    """
+    How an operation runs tile by tile.
+
+    - halo: pixels of context needed around a tile on each side (the kernel radius).
+    - func(tile, statistic): the operation on a tile with its halo; the halo is cropped from the result.
+    - statistic(tile, core): partial global statistic of a tile with its halo, core being the slices
+      of the tile without it; partials of all tiles are folded with combine (default +, e.g. for
+      histograms) in a first reduction pass.
+    - releases_gil: False when func spends its time in Python code, so parallel tiles need processes.
+    """
+    halo: int
+    func: Callable[[np.ndarray, Any], np.ndarray]
+    statistic: Optional[Callable[[np.ndarray, Tuple[slice, slice]], Any]] = None
+    combine: Optional[Callable[[Any, Any], Any]] = None
+    releases_gil: bool = True
+
+class TilingConfig(NamedTuple):
+    tile_size: int
+    min_pixels: int # smaller images run in one piece
+    workers: int
+
+    @classmethod
+    def from_environment(cls) -> 'TilingConfig':
+        return cls(
+            tile_size=int(os.environ.get("IMG_PROC_TILE_SIZE", 2048)),
+            min_pixels=int(os.environ.get("IMG_PROC_TILE_MIN_PIXELS", 64 * 1024 * 1024)),
+            workers=int(os.environ.get("IMG_PROC_TILE_WORKERS", 1)),
+        )
+
+def tile_grid(height: int, width: int, tile_height: int, tile_width: int) -> List[Tuple[int, int, int, int]]:
+    return [
+        (y, min(y + tile_height, height), x, min(x + tile_width, width))
+        for y in range(0, height, tile_height)
+        for x in range(0, width, tile_width)
+    ]
+
+def band_shape(height: int, width: int, bands: int) -> Tuple[int, int]:
+    """
+    Tile shape splitting the image into (at most) the given number of full-width row bands.
+    """
+    return max(1, -(-height // bands)), width
+
+def tile_with_halo(image_array: np.ndarray, bounds: Tuple[int, int, int, int], halo: int) -> Tuple[np.ndarray, Tuple[slice, slice]]:
+    """
+    The tile grown by halo pixels where the image has them. At the image border the operation
+    pads the tile exactly as it pads the whole image, so border pixels come out the same.
+    """
+    y0, y1, x0, x1 = bounds
+    height, width = image_array.shape[:2]
+    top, left = min(halo, y0), min(halo, x0)
+    bottom, right = min(halo, height - y1), min(halo, width - x1)
+
+    tile = image_array[y0 - top:y1 + bottom, x0 - left:x1 + right]
+    core = (slice(top, top + y1 - y0), slice(left, left + x1 - x0))
+    return tile, core
+
+def _map(func: Callable, items: List, workers: int) -> Iterator:
+    if workers <= 1 or len(items) <= 1:
+        return map(func, items)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tile") as pool:
+        return iter(list(pool.map(func, items)))
+
+def run_tiled(image_array: np.ndarray, plan: TilePlan, tile_shape: Tuple[int, int], workers: int = 1, remote: Optional[Callable[[np.ndarray], np.ndarray]] = None, submit: Optional[Callable[..., Future]] = None, progress: Optional[Progress] = None) -> np.ndarray:
+    """
+    Runs a tile plan over the image and stitches the result, holding the temporaries of one tile
+    per worker at a time. Output tiles must keep the height and width of their input tile.
+    The result matches the whole-image run, except that the rounding of cv2's float convolutions
+    (the DFT for kernels of 11x11 and up, the vectorized 1D passes) depends on the input size
+    (rare off-by-one pixels).
+
+    remote is a picklable equivalent of plan.func without a statistic; plans that hold the GIL
+    run their tiles through it with submit, which hands them to other processes (see
+    ComputeExecutor.band_submitter).
+
+    progress counts finished tiles, and the tiles of the reduction pass first.
+    """
+    height, width = image_array.shape[:2]
+    grid = tile_grid(height, width, *tile_shape)
+
+    if progress is not None:
+        progress.start(len(grid) * (2 if plan.statistic is not None else 1))
+    advance = progress.advance if progress is not None else lambda: None
+
+    if workers > 1 and len(grid) > 1 and not plan.releases_gil and remote is not None and submit is not None and plan.statistic is None:
+        return _run_tiles_in_processes(image_array, plan.halo, grid, remote, submit, advance)
+
+    statistic = None
+    if plan.statistic is not None:
+        def partial_statistic(bounds):
+            value = plan.statistic(*tile_with_halo(image_array, bounds, plan.halo))
+            advance()
+            return value
+
+        statistic = functools.reduce(plan.combine or operator.add, _map(partial_statistic, grid, workers))
+
+    def process(bounds):
+        tile, core = tile_with_halo(image_array, bounds, plan.halo)
+        result = plan.func(tile, statistic)[core]
+        advance()
+        return result
+
+    # the first tile fixes the output channels and dtype, the others write straight into it
+    first = process(grid[0])
+    output = np.empty((height, width) + first.shape[2:], dtype=first.dtype)
+
+    def store(bounds, result):
+        y0, y1, x0, x1 = bounds
+        output[y0:y1, x0:x1] = result
+
+    store(grid[0], first)
+    list(_map(lambda bounds: store(bounds, process(bounds)), grid[1:], workers))
+    return output
+
+def _run_tiles_in_processes(image_array: np.ndarray, halo: int, grid: List[Tuple[int, int, int, int]], remote: Callable, submit: Callable[..., Future], advance: Callable[[], None]) -> np.ndarray:
+    tiles = [tile_with_halo(image_array, bounds, halo) for bounds in grid]
+    futures = []
+    try:
+        for tile, _ in tiles:
+            futures.append(submit(remote, np.ascontiguousarray(tile)))
+
+        output = None
+        for bounds, (_, core), future in zip(grid, tiles, futures):
+            result = future.result()[core]
+            if output is None:
+                output = np.empty(image_array.shape[:2] + result.shape[2:], dtype=result.dtype)
+            y0, y1, x0, x1 = bounds
+            output[y0:y1, x0:x1] = result
+            advance()
+        return output
+    finally:
+        for future in futures: # on failure (e.g. the executor is busy) the tiles not started are dropped
+            future.cancel()
+
+tiling_config = TilingConfig.from_environment()